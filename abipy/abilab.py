@@ -6,60 +6,121 @@ from __future__ import print_function, division, unicode_literals
 import sys
 import os
 import collections
+import importlib
+import inspect
 
 ####################
 ### Monty import ###
 ####################
 from monty.os.path import which
 
-#######################
-### Pymatgen import ###
-#######################
-# Tools for unit conversion
-import pymatgen.core.units as units
-FloatWithUnit = units.FloatWithUnit
-ArrayWithUnit = units.ArrayWithUnit
+from abipy.core.release import __version__, min_abinit_version
 
-####################
-### Abipy import ###
-####################
-from abipy.flowtk import Pseudo, PseudoTable, Mrgscr, Mrgddb, Mrggkk, Flow, TaskManager, AbinitBuild, flow_main
-#from pymatgen.io.abinit.flows import (Flow, G0W0WithQptdmFlow, bandstructure_flow, PhononFlow,
-#    g0w0_flow, phonon_flow, phonon_conv_flow, nonlinear_coeff_flow)
+# The objects exported by abilab are imported on first use (see __getattr__) so that
+# `import abipy.abilab` and `abiopen` do not pay the import time of all the modules
+# (phonons, GW, BSE, pandas, matplotlib, pymatgen flows ...).
+# Each entry maps the module to the names re-exported by abilab.
+_LAZY_MODULES = collections.OrderedDict([
+    # Tools for unit conversion.
+    ("pymatgen.core", ["units"]),
+    ("pymatgen.core.units", ["FloatWithUnit", "ArrayWithUnit"]),
+    ("abipy.flowtk", ["Pseudo", "PseudoTable", "Mrgscr", "Mrgddb", "Mrggkk", "Flow", "TaskManager",
+                      "AbinitBuild", "flow_main"]),
+    ("abipy.core.structure", ["Lattice", "Structure", "StructureModifier", "frames_from_structures",
+                              "mp_match_structure", "mp_search"]),
+    ("abipy.core.mixins", ["CubeFile"]),
+    ("abipy.core.kpoints", ["set_atol_kdiff"]),
+    ("abipy.htc.input", ["AbiInput", "LdauParams", "LexxParams", "input_gen"]),
+    ("abipy.abio.robots", ["Robot", "GsrRobot", "SigresRobot", "MdfRobot", "DdbRobot", "abirobot"]),
+    ("abipy.abio.inputs", ["AbinitInput", "MultiDataset", "AnaddbInput", "OpticInput"]),
+    ("abipy.abio.abivars", ["AbinitInputFile"]),
+    ("abipy.abio.outputs", ["AbinitLogFile", "AbinitOutputFile", "OutNcFile"]),
+    ("abipy.tools.pandas", ["print_frame"]),
+    ("abipy.electrons.ebands", ["ElectronBands", "ElectronBandsPlotter", "ElectronDos", "ElectronDosPlotter",
+                                "frame_from_ebands"]),
+    ("abipy.electrons.gsr", ["GsrFile"]),
+    ("abipy.electrons.psps", ["PspsFile"]),
+    ("abipy.electrons.gw", ["SigresFile", "SigresPlotter"]),
+    ("abipy.electrons.bse", ["MdfFile"]),
+    ("abipy.electrons.scissors", ["ScissorsBuilder"]),
+    ("abipy.electrons.scr", ["ScrFile"]),
+    ("abipy.electrons.denpot", ["DensityNcFile", "VhartreeNcFile", "VxcNcFile", "VhxcNcFile", "PotNcFile",
+                                "DensityFortranFile"]),
+    ("abipy.electrons.fatbands", ["FatBandsFile"]),
+    ("abipy.dfpt.phonons", ["PhbstFile", "PhononBands", "PhononBandsPlotter", "PhdosFile", "PhononDosPlotter",
+                            "PhdosReader", "phbands_gridplot"]),
+    ("abipy.dfpt.ddb", ["DdbFile"]),
+    ("abipy.dfpt.anaddbnc", ["AnaddbNcFile"]),
+    ("abipy.dfpt.gruneisen", ["GrunsNcFile"]),
+    ("abipy.dynamics.hist", ["HistFile"]),
+    ("abipy.waves", ["WfkFile"]),
+    #("abipy.electrons.sigmaph", ["SigmaPhFile"]),
+    # Abinit Documentation.
+    ("abipy.abio.abivars_db", ["get_abinit_variables", "abinit_help", "docvar"]),
+])
 
-from abipy.core.release import __version__, min_abinit_version
-from abipy.core.structure import Lattice, Structure, StructureModifier, frames_from_structures, mp_match_structure, mp_search
-from abipy.core.mixins import CubeFile
-from abipy.core.kpoints import set_atol_kdiff
-from abipy.htc.input import AbiInput, LdauParams, LexxParams, input_gen
-from abipy.abio.robots import Robot, GsrRobot, SigresRobot, MdfRobot, DdbRobot, abirobot
-from abipy.abio.inputs import AbinitInput, MultiDataset, AnaddbInput, OpticInput
-from abipy.abio.abivars import AbinitInputFile
-from abipy.abio.outputs import AbinitLogFile, AbinitOutputFile, OutNcFile #, CubeFile
-from abipy.tools.pandas import print_frame
-from abipy.abio.factories import *
-from abipy.electrons.ebands import (ElectronBands, ElectronBandsPlotter, ElectronDos, ElectronDosPlotter,
-    frame_from_ebands)
-from abipy.electrons.gsr import GsrFile
-from abipy.electrons.psps import PspsFile
-from abipy.electrons.gw import SigresFile, SigresPlotter
-from abipy.electrons.bse import MdfFile
-from abipy.electrons.scissors import ScissorsBuilder
-from abipy.electrons.scr import ScrFile
-
-from abipy.electrons.denpot import DensityNcFile, VhartreeNcFile, VxcNcFile, VhxcNcFile, PotNcFile, DensityFortranFile
-from abipy.electrons.fatbands import FatBandsFile
-from abipy.dfpt.phonons import (PhbstFile, PhononBands, PhononBandsPlotter, PhdosFile, PhononDosPlotter,
-    PhdosReader, phbands_gridplot)
-from abipy.dfpt.ddb import DdbFile
-from abipy.dfpt.anaddbnc import AnaddbNcFile
-from abipy.dfpt.gruneisen import GrunsNcFile
-from abipy.dynamics.hist import HistFile
-from abipy.waves import WfkFile
-#from abipy.electrons.sigmaph import SigmaPhFile
-
-# Abinit Documentation.
-from abipy.abio.abivars_db import get_abinit_variables, abinit_help, docvar
+# Modules whose public names (__all__) are re-exported by abilab.
+_LAZY_STAR_MODULES = ["abipy.abio.factories"]
+
+_LAZY_OBJECTS = {name: modname + "." + name for modname, names in _LAZY_MODULES.items() for name in names}
+
+
+def _import_object(dotted_path):
+    """Import and return the object (class, function or module) from its dotted path."""
+    modname, _, name = dotted_path.rpartition(".")
+    module = importlib.import_module(modname)
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        # Submodule not imported by the parent package.
+        return importlib.import_module(dotted_path)
+
+
+def _get_all():
+    """
+    Return the list of names exported by `from abipy.abilab import *`:
+    the lazy objects, the public names of _LAZY_STAR_MODULES and the public functions defined in abilab.
+    """
+    names = set(_LAZY_OBJECTS)
+    for modname in _LAZY_STAR_MODULES:
+        names.update(importlib.import_module(modname).__all__)
+    names.update(k for k, v in globals().items() if not k.startswith("_") and not inspect.ismodule(v))
+    return sorted(names)
+
+
+def __getattr__(name):
+    """Import the objects exported by abilab on first access (PEP 562)."""
+    if name == "__all__":
+        # Computed on demand so that `import abipy.abilab` stays cheap.
+        # Note that star-import resolves (and therefore imports) all the names.
+        obj = _get_all()
+    elif name in _LAZY_OBJECTS:
+        obj = _import_object(_LAZY_OBJECTS[name])
+    else:
+        if name.startswith("__"):
+            raise AttributeError("module %s has no attribute %s" % (__name__, name))
+        for modname in _LAZY_STAR_MODULES:
+            module = importlib.import_module(modname)
+            if name in getattr(module, "__all__", []):
+                obj = getattr(module, name)
+                break
+        else:
+            raise AttributeError("module %s has no attribute %s" % (__name__, name))
+
+    # Cache the object in the module so that __getattr__ is not called again.
+    globals()[name] = obj
+    return obj
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_OBJECTS))
+
+
+if sys.version_info < (3, 7):
+    # Module-level __getattr__ is not supported. Import everything now.
+    for _name in _LAZY_OBJECTS:
+        globals()[_name] = _import_object(_LAZY_OBJECTS[_name])
+    from abipy.abio.factories import *
 
 
 def _straceback():
@@ -67,46 +128,52 @@ def _straceback():
     import traceback
     return traceback.format_exc()
 
+# Name of the pickle file used to store the Flow.
+# Copy of Flow.PICKLE_FNAME so that abiopen does not import flowtk (consistency is checked in the tests).
+_FLOW_PICKLE_FNAME = "__AbinitFlow__.pickle"
+
+# Registry used by abiopen: file extension --> dotted path of the class.
+# Classes are imported only when a file with this extension is opened.
 # Abinit text files. Use OrderedDict for nice output in show_abiopen_exc2class.
 ext2file = collections.OrderedDict([
-    (".abi", AbinitInputFile),
-    (".in", AbinitInputFile),
-    (".abo", AbinitOutputFile),
-    (".out", AbinitOutputFile),
-    (".log", AbinitLogFile),
-    (".cif", Structure),
-    ("POSCAR", Structure),
-    (".cssr", Structure),
-    (".cube", CubeFile),
-    ("anaddb.nc", AnaddbNcFile),
-    ("DEN", DensityFortranFile),
-    (".psp8", Pseudo),
-    (".pspnc", Pseudo),
-    (".fhi", Pseudo),
-    (".xml", Pseudo),
+    (".abi", "abipy.abio.abivars.AbinitInputFile"),
+    (".in", "abipy.abio.abivars.AbinitInputFile"),
+    (".abo", "abipy.abio.outputs.AbinitOutputFile"),
+    (".out", "abipy.abio.outputs.AbinitOutputFile"),
+    (".log", "abipy.abio.outputs.AbinitLogFile"),
+    (".cif", "abipy.core.structure.Structure"),
+    ("POSCAR", "abipy.core.structure.Structure"),
+    (".cssr", "abipy.core.structure.Structure"),
+    (".cube", "abipy.core.mixins.CubeFile"),
+    ("anaddb.nc", "abipy.dfpt.anaddbnc.AnaddbNcFile"),
+    ("DEN", "abipy.electrons.denpot.DensityFortranFile"),
+    (".psp8", "abipy.flowtk.Pseudo"),
+    (".pspnc", "abipy.flowtk.Pseudo"),
+    (".fhi", "abipy.flowtk.Pseudo"),
+    (".xml", "abipy.flowtk.Pseudo"),
 ])
 
 # Abinit files require a special treatment.
 abiext2ncfile = collections.OrderedDict([
-    ("GSR.nc", GsrFile),
-    ("DEN.nc", DensityNcFile),
-    ("OUT.nc", OutNcFile),
-    ("VHA.nc", VhartreeNcFile),
-    ("VXC.nc", VxcNcFile),
-    ("VHXC.nc", VhxcNcFile),
-    ("POT.nc", PotNcFile),
-    ("WFK.nc", WfkFile),
-    ("HIST.nc", HistFile),
-    ("PSPS.nc", PspsFile),
-    ("DDB", DdbFile),
-    ("PHBST.nc", PhbstFile),
-    ("PHDOS.nc", PhdosFile),
-    ("SCR.nc", ScrFile),
-    ("SIGRES.nc", SigresFile),
-    #("SIGMAPH.nc", SigmaPhFile),
-    ("GRUNS.nc", GrunsNcFile),
-    ("MDF.nc", MdfFile),
-    ("FATBANDS.nc", FatBandsFile),
+    ("GSR.nc", "abipy.electrons.gsr.GsrFile"),
+    ("DEN.nc", "abipy.electrons.denpot.DensityNcFile"),
+    ("OUT.nc", "abipy.abio.outputs.OutNcFile"),
+    ("VHA.nc", "abipy.electrons.denpot.VhartreeNcFile"),
+    ("VXC.nc", "abipy.electrons.denpot.VxcNcFile"),
+    ("VHXC.nc", "abipy.electrons.denpot.VhxcNcFile"),
+    ("POT.nc", "abipy.electrons.denpot.PotNcFile"),
+    ("WFK.nc", "abipy.waves.WfkFile"),
+    ("HIST.nc", "abipy.dynamics.hist.HistFile"),
+    ("PSPS.nc", "abipy.electrons.psps.PspsFile"),
+    ("DDB", "abipy.dfpt.ddb.DdbFile"),
+    ("PHBST.nc", "abipy.dfpt.phonons.PhbstFile"),
+    ("PHDOS.nc", "abipy.dfpt.phonons.PhdosFile"),
+    ("SCR.nc", "abipy.electrons.scr.ScrFile"),
+    ("SIGRES.nc", "abipy.electrons.gw.SigresFile"),
+    #("SIGMAPH.nc", "abipy.electrons.sigmaph.SigmaPhFile"),
+    ("GRUNS.nc", "abipy.dfpt.gruneisen.GrunsNcFile"),
+    ("MDF.nc", "abipy.electrons.bse.MdfFile"),
+    ("FATBANDS.nc", "abipy.electrons.fatbands.FatBandsFile"),
 ])
 
 
@@ -118,28 +185,40 @@ def abiopen_ext2class_table():
     from tabulate import tabulate
     table = []
 
-    for ext, cls in chain(ext2file.items(), abiext2ncfile.items()):
-        table.append((ext, str(cls)))
+    for ext, cls_path in chain(ext2file.items(), abiext2ncfile.items()):
+        table.append((ext, cls_path))
 
     return tabulate(table, headers=["Extension", "Class"])
 
 
-def abifile_subclass_from_filename(filename):
+def _find_abifile_class_path(filename):
     """
-    Returns the appropriate class associated to the given filename.
+    Return the dotted path of the class associated to filename. None if filename is not supported.
+    No module is imported.
     """
-    if os.path.basename(filename) == Flow.PICKLE_FNAME:
-        return Flow
-
-    for ext, cls in ext2file.items():
-        if filename.endswith(ext): return cls
+    for ext, cls_path in ext2file.items():
+        if filename.endswith(ext): return cls_path
 
     ext = filename.split("_")[-1]
     try:
         return abiext2ncfile[ext]
     except KeyError:
-        for ext, cls in abiext2ncfile.items():
-            if filename.endswith(ext): return cls
+        for ext, cls_path in abiext2ncfile.items():
+            if filename.endswith(ext): return cls_path
+
+    return None
+
+
+def abifile_subclass_from_filename(filename):
+    """
+    Returns the appropriate class associated to the given filename.
+    """
+    if os.path.basename(filename) == _FLOW_PICKLE_FNAME:
+        return _import_object("abipy.flowtk.Flow")
+
+    cls_path = _find_abifile_class_path(filename)
+    if cls_path is not None:
+        return _import_object(cls_path)
 
     msg = ("No class has been registered for file:\n\t%s\n\nFile extensions supported:\n%s" %
         (filename, abiopen_ext2class_table()))
@@ -174,11 +253,8 @@ def isabifile(filepath):
     """
     Return True if `filepath` can be opened with `abiopen`.
     """
-    try:
-        abifile_subclass_from_filename(filepath)
-        return True
-    except ValueError:
-        return False
+    return (os.path.basename(filepath) == _FLOW_PICKLE_FNAME or
+            _find_abifile_class_path(filepath) is not None)
 
 
 def abiopen(filepath):
@@ -190,7 +266,8 @@ def abiopen(filepath):
         filepath: string with the filename.
     """
     #print(filepath)
-    if os.path.basename(filepath) == "__AbinitFlow__.pickle":
+    if os.path.basename(filepath) == _FLOW_PICKLE_FNAME:
+        from abipy.flowtk import Flow
         return Flow.pickle_load(filepath)
 
     # Handle old output files produced by Abinit.
@@ -198,6 +275,7 @@ def abiopen(filepath):
     outnum = re.compile(r".+\.out[\d]+")
     abonum = re.compile(r".+\.abo[\d]+")
     if outnum.match(filepath) or abonum.match(filepath):
+        from abipy.abio.outputs import AbinitOutputFile
         return AbinitOutputFile.from_file(filepath)
 
     cls = abifile_subclass_from_filename(filepath)
@@ -223,6 +301,7 @@ def display_structure(obj, **kwargs):
                           "See also https://github.com/gmatteo/nbjsmol.")
 
     # Cast to structure, get string with cif data and pass it to nbjsmol.
+    from abipy.core.structure import Structure
     structure = Structure.as_structure(obj)
     return nbjsmol_display(structure.to(fmt="cif"), ext=".cif", **kwargs)
 
@@ -265,6 +344,7 @@ def abicheck(verbose=0):
     at run-time can be imported. Return string with error messages, empty if success.
     """
     from monty.termcolor import cprint
+    from abipy.flowtk import TaskManager, AbinitBuild
     err_lines = []
     app = err_lines.append
 
@@ -357,3 +437,8 @@ o-  o/   oo`       ss    /y..y/    ss ss +y`   -y::y-    yo          -o/  .o- -o
    `  ..` `:-                            :+              /:         --` `-` `
             `.`                                                   ..`
 """
+
+
+if sys.version_info < (3, 7):
+    # No module-level __getattr__: names exported by star-import must be listed explicitly.
+    __all__ = _get_all()
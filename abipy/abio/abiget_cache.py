@@ -0,0 +1,245 @@
+# coding: utf-8
+"""
+Persistent cache for the results of the `AbinitInput.abiget_*` methods.
+These methods execute ABINIT in a temporary directory, the results are stored on disk
+and reused if the same request is performed again with the same input and the same version of ABINIT.
+
+Usage example:
+
+.. code-block:: python
+
+    from abipy.abio.abiget_cache import AbigetCache, set_abiget_cache
+    set_abiget_cache(AbigetCache(maxsize_mb=50))
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import os
+import pickle
+import hashlib
+import inspect
+import tempfile
+import functools
+import threading
+
+from collections import OrderedDict
+from abipy.tools.cachetools import json_key, CacheStatsMixin
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+__all__ = [
+    "AbigetCache",
+    "get_abiget_cache",
+    "set_abiget_cache",
+]
+
+
+def input_digest(inp):
+    """
+    Return string with the sha1 of the :class:`AbinitInput` `inp`.
+    Contrary to `variable_checksum`, the hash includes the structure.
+    """
+    sha1 = hashlib.sha1()
+    sha1.update(inp.variable_checksum().encode("utf-8"))
+    abivars = inp.structure.to_abivars()
+    sha1.update(json_key(abivars).encode("utf-8"))
+    return sha1.hexdigest()
+
+
+class AbigetCache(CacheStatsMixin):
+    """
+    Content-addressed cache stored in a directory. Each entry is a pickle file whose name is the sha1
+    of the input, the name of the method, its arguments and the version of ABINIT.
+    The least recently used entries are removed when the size of the cache exceeds `maxsize_mb`.
+    """
+    DEFAULT_CACHEDIR = os.path.join(os.path.expanduser("~"), ".abinit", "abipy", "abiget_cache")
+
+    # Counters. See CacheStatsMixin.
+    COUNTERS = ("hits", "misses", "stores", "evictions")
+
+    def __init__(self, cachedir=None, maxsize_mb=100, abinit_version=None):
+        """
+        Args:
+            cachedir: Directory used to store the results. Default: ~/.abinit/abipy/abiget_cache
+            maxsize_mb: Maximum size of the cache in Mb.
+            abinit_version: String with the version of ABINIT used to build the keys.
+                If None, the version is obtained by running ABINIT with the :class:`TaskManager`.
+        """
+        self.cachedir = os.path.abspath(cachedir if cachedir is not None else self.DEFAULT_CACHEDIR)
+        if not os.path.exists(self.cachedir): os.makedirs(self.cachedir)
+        self.maxsize_mb = maxsize_mb
+        self.abinit_version = abinit_version
+
+        self._versions = {}
+        self._lock = threading.RLock()
+        self.reset_stats()
+
+    def _stats_title(self):
+        return "AbigetCache: %s" % self.cachedir
+
+    def _list_entries(self):
+        """Return list of (mtime, size, path) for the entries in the cache."""
+        entries = []
+        for f in os.listdir(self.cachedir):
+            if not f.endswith(".pickle"): continue
+            path = os.path.join(self.cachedir, f)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def __len__(self):
+        return len(self._list_entries())
+
+    def _extra_stats(self):
+        """Size of the cache."""
+        entries = self._list_entries()
+        return OrderedDict([
+            ("nentries", len(entries)), ("size_mb", sum(e[1] for e in entries) / 1024 ** 2),
+            ("maxsize_mb", self.maxsize_mb),
+        ])
+
+    def get_abinit_version(self, manager=None):
+        """Return the version of ABINIT executed by `manager`. The value is computed once per manager."""
+        if self.abinit_version is not None: return self.abinit_version
+        mkey = None if manager is None else str(manager)
+        with self._lock:
+            if mkey not in self._versions:
+                from abipy.flowtk import AbinitBuild
+                self._versions[mkey] = AbinitBuild(manager=manager).version
+            return self._versions[mkey]
+
+    def get_key(self, inp, method, args, manager=None):
+        """
+        Return the key associated to the call of `method` with arguments `args` (dict) for the input `inp`.
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(input_digest(inp).encode("utf-8"))
+        sha1.update(method.encode("utf-8"))
+        sha1.update(json_key(args).encode("utf-8"))
+        sha1.update(str(self.get_abinit_version(manager=manager)).encode("utf-8"))
+        return sha1.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cachedir, key + ".pickle")
+
+    def lookup(self, key):
+        """Return (True, value) if key is in the cache else (False, None)."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                value = pickle.load(fh)
+        except (IOError, OSError):
+            self.misses += 1
+            return False, None
+        except Exception as exc:
+            # Corrupted or incompatible entry.
+            logger.warning("Removing invalid entry %s: %s" % (path, str(exc)))
+            self._remove(path)
+            self.misses += 1
+            return False, None
+
+        # Update mtime for LRU eviction.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return True, value
+
+    def store(self, key, value):
+        """Store value in the cache. Return True if success. Values that cannot be pickled are not stored."""
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            logger.warning("Cannot pickle %s: %s" % (type(value), str(exc)))
+            return False
+
+        # Write to a temporary file and then rename it so that readers never see partial files.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.rename(tmp_path, self._path(key))
+
+        self.stores += 1
+        self.evict()
+        return True
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove the least recently used entries if the size of the cache exceeds maxsize_mb."""
+        with self._lock:
+            entries = sorted(self._list_entries())
+            size, maxsize = sum(e[1] for e in entries), self.maxsize_mb * 1024 ** 2
+            for mtime, nbytes, path in entries:
+                if size <= maxsize: break
+                self._remove(path)
+                size -= nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all the entries."""
+        for _, _, path in self._list_entries():
+            self._remove(path)
+
+
+# Cache used by the abiget methods. None if caching is disabled.
+_ABIGET_CACHE = None
+
+
+def get_abiget_cache():
+    """Return the cache used by the `AbinitInput.abiget_*` methods. None if caching is disabled."""
+    return _ABIGET_CACHE
+
+
+def set_abiget_cache(cache):
+    """
+    Set the cache used by the `AbinitInput.abiget_*` methods. None disables caching.
+    Return the previous cache.
+    """
+    global _ABIGET_CACHE
+    old, _ABIGET_CACHE = _ABIGET_CACHE, cache
+    return old
+
+
+# Arguments of the abiget methods that do not change the results.
+_IGNORED_ARGS = ("self", "workdir", "manager", "verbose")
+
+
+def memoize_abiget(method):
+    """
+    Decorator for the `AbinitInput.abiget_*` methods.
+    The results are stored in the cache returned by `get_abiget_cache`, if any.
+    The cache is not used if `workdir` is specified since the files produced by ABINIT are requested
+    or if the arguments cannot be used to build the key (see :func:`json_key`).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = get_abiget_cache()
+        if cache is None: return method(self, *args, **kwargs)
+
+        callargs = inspect.getcallargs(method, self, *args, **kwargs)
+        if callargs.get("workdir") is not None: return method(self, *args, **kwargs)
+
+        key_args = OrderedDict([(k, callargs[k]) for k in sorted(callargs) if k not in _IGNORED_ARGS])
+        try:
+            key = cache.get_key(self, method.__name__, key_args, manager=callargs.get("manager"))
+        except TypeError:
+            # Arguments that cannot be converted unambiguously to a key (see json_key). Don't use the cache.
+            return method(self, *args, **kwargs)
+        found, value = cache.lookup(key)
+        if found: return value
+
+        value = method(self, *args, **kwargs)
+        cache.store(key, value)
+        return value
+
+    return wrapper
@@ -9,6 +9,7 @@ import collections
 import warnings
 import itertools
 import copy
+import functools
 import six
 import abc
 import json
@@ -27,6 +28,7 @@ from abipy.htc.variable import InputVariable
 from abipy.abio.abivars import is_abivar, is_anaddb_var
 from abipy.abio.abivars_db import get_abinit_variables
 from abipy.abio.input_tags import *
+from abipy.abio.abiget_cache import memoize_abiget, input_digest
 from abipy.flowtk import PseudoTable, Pseudo, AbinitTask, AnaddbTask, ParalHintsParser, NetcdfReader
 from abipy.flowtk.abiinspect import yaml_read_irred_perts
 from abipy.flowtk import abiobjects as aobj
@@ -35,6 +37,10 @@ import logging
 logger = logging.getLogger(__file__)
 
 
+# namedtuple returned by AbinitInput.abiget_ibz (defined at the module level so that it can be pickled).
+Ibz = collections.namedtuple("Ibz", "points weights")
+
+
 # List of Abinit variables used to specify the structure.
 # This variables should not be passed to set_vars since
 # they will be generated with structure.to_abivars()
@@ -1384,6 +1390,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
         retcode = task.start_and_wait(autoparal=False, exec_args=["--dry-run"])
         return dict2namedtuple(retcode=retcode, log_file=task.log_file, stderr_file=task.stderr_file)
 
+    @memoize_abiget
     def abiget_ibz(self, ngkpt=None, shiftk=None, kptopt=None, workdir=None, manager=None):
         """
         This function computes the list of points in the IBZ and the corresponding weights.
@@ -1421,8 +1428,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
         # Read the list of k-points from the netcdf file.
         try:
             with NetcdfReader(os.path.join(task.workdir, "kpts.nc")) as r:
-                ibz = collections.namedtuple("ibz", "points weights")
-                return ibz(points=r.read_value("reduced_coordinates_of_kpoints"),
+                return Ibz(points=r.read_value("reduced_coordinates_of_kpoints"),
                            weights=r.read_value("kpoint_weights"))
 
         except Exception as exc:
@@ -1525,6 +1531,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
         except Exception as exc:
             self._handle_task_exception(task, exc)
 
+    @memoize_abiget
     def abiget_irred_phperts(self, qpt=None, ngkpt=None, shiftk=None, kptopt=None, workdir=None, manager=None):
         """
         This function, computes the list of irreducible perturbations for DFPT.
@@ -1555,6 +1562,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
         return self._abiget_irred_perts(phperts_vars, qpt=qpt, ngkpt=ngkpt, shiftk=shiftk, kptopt=kptopt,
                                         workdir=workdir, manager=manager)
 
+    @memoize_abiget
     def abiget_irred_ddeperts(self, ngkpt=None, shiftk=None, kptopt=None, workdir=None, manager=None):
         """
         This function, computes the list of irreducible perturbations for DFPT.
@@ -1583,6 +1591,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
         return self._abiget_irred_perts(ddeperts_vars, qpt=(0, 0, 0), ngkpt=ngkpt, shiftk=shiftk, kptopt=kptopt,
                                         workdir=workdir, manager=manager)
 
+    @memoize_abiget
     def abiget_irred_dteperts(self, ngkpt=None, shiftk=None, kptopt=None, workdir=None, manager=None,
                               phonon_pert=False):
         """
@@ -1622,6 +1631,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
         return self._abiget_irred_perts(dteperts_vars, qpt=(0, 0, 0), ngkpt=ngkpt, shiftk=shiftk, kptopt=kptopt,
                                         workdir=workdir, manager=manager)
 
+    @memoize_abiget
     def abiget_irred_strainperts(self, ngkpt=None, shiftk=None, kptopt=None, workdir=None, manager=None):
         """
         This function, computes the list of irreducible perturbations for strain perturbations in DFPT.
@@ -1670,6 +1680,7 @@ class AbinitInput(six.with_metaclass(abc.ABCMeta, AbstractInput, MSONable, Has_S
 
         return popped
 
+    @memoize_abiget
     def abiget_autoparal_pconfs(self, max_ncpus, autoparal=1, workdir=None, manager=None, verbose=0):
         """
         Get all the possible configurations up to max_ncpus
@@ -1871,6 +1882,10 @@ class MultiDataset(object):
                                  % (self.__class__.__name__, name))
         isattr = not callable(m)
 
+        if name.startswith("abiget_") and not isattr:
+            # Run ABINIT only once for identical datasets.
+            return functools.partial(self.abiget, name)
+
         def on_all(*args, **kwargs):
             results = []
             for obj in self._inputs:
@@ -1886,6 +1901,44 @@ class MultiDataset(object):
         if isattr: on_all = on_all()
         return on_all
 
+    def abiget(self, name, *args, **kwargs):
+        """
+        Call the `AbinitInput` method `name` (e.g. "abiget_ibz") for all the datasets and return the list of results.
+        The method is called only once for datasets with the same variables and structure
+        and the calls for the different datasets can be executed concurrently.
+        `multi.abiget_ibz(...)` is equivalent to `multi.abiget("abiget_ibz", ...)`.
+
+        Args:
+            name: Name of the method.
+            args, kwargs: Arguments passed to the method.
+            workers: Number of threads used to run the ABINIT tasks. Default: 1
+        """
+        workers = kwargs.pop("workers", 1)
+
+        # Group the datasets by digest.
+        digests = [input_digest(inp) for inp in self]
+        uniques = OrderedDict()
+        for inp, digest in zip(self, digests):
+            uniques.setdefault(digest, inp)
+
+        def call(inp):
+            return getattr(inp, name)(*args, **kwargs)
+
+        if workers > 1 and len(uniques) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(call, uniques.values()))
+        else:
+            results = [call(inp) for inp in uniques.values()]
+
+        results = dict(zip(uniques.keys(), results))
+        # Return copies for the duplicated datasets so that the results can be modified independently.
+        out, seen = [], set()
+        for d in digests:
+            out.append(copy.deepcopy(results[d]) if d in seen else results[d])
+            seen.add(d)
+        return out
+
     def __add__(self, other):
         """self + other"""
         if isinstance(other, AbinitInput):
@@ -5,17 +5,18 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 import sys
 import os
 import numpy as np
-import pandas as pd
+import pymatgen.core.units as units
 
 from collections import OrderedDict, deque
 from monty.string import is_string, list_strings
 from monty.termcolor import cprint
 from monty.collections import dict2namedtuple
 #from monty.functools import lazy_property
-from pymatgen.analysis.eos import EOS
 from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt
 from abipy.flowtk import Flow
 from abipy.core.mixins import NotebookWriter
+from abipy.iotools import NcHandlePool
+from abipy.abio.rowcache import RowCache
 
 
 #__all__ = [
@@ -48,6 +49,44 @@ def abirobot(obj, ext, nids=None):
                      [cls.EXT for cls in Robot.__subclasses__()])
 
 
+class FileMetadata(object):
+    """
+    Lightweight object with the quantities read from a file by `Robot.read_metadata`.
+    The file is closed after the read so that the object can be sent back by the worker processes.
+    Quantities are accessed as attributes, e.g. `meta.energy`.
+    """
+    def __init__(self, filepath, **kwargs):
+        self.filepath = filepath
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, self.filepath)
+
+    def __str__(self):
+        return "\n".join([repr(self)] + ["%s: %s" % (k, v) for k, v in self.__dict__.items() if k != "filepath"])
+
+    def close(self):
+        """Nothing to close. The file has been closed by `read_metadata`."""
+
+
+def _robot_open_file(robot_cls, filepath, metadata_only):
+    """
+    Open `filepath` with abiopen or read the metadata with `robot_cls.read_metadata`.
+    Used by the workers of `Robot._open_files` (module-level function so that it can be pickled).
+
+    Returns:
+        (filepath, object, None) if success else (filepath, None, string with the traceback).
+    """
+    try:
+        if metadata_only:
+            return filepath, robot_cls.read_metadata(filepath), None
+        from abipy.abilab import abiopen
+        return filepath, abiopen(filepath), None
+    except Exception:
+        import traceback
+        return filepath, None, traceback.format_exc()
+
+
 class Robot(object):
     """
     The main function of a `Robot` is facilitating the extraction of the output data produced by
@@ -69,13 +108,26 @@ class Robot(object):
     # filepaths are relative to `start`. None for asbolute paths. This flag is set in trim_paths
     start = None
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         """
         Args:
             args is a list of tuples (label, filepath)
+            max_open_files: Maximum number of netCDF files kept open by the robot.
+                Files are closed with a LRU policy and reopened on demand. None for no limit.
+            row_cache: :class:`RowCache` or path of the database used to cache the rows of the dataframes.
+                None to disable caching. See `set_row_cache`.
         """
         self._ncfiles, self._do_close = OrderedDict(), OrderedDict()
         self._exceptions = deque(maxlen=100)
+        self._failures = OrderedDict()
+
+        max_open_files = kwargs.pop("max_open_files", None)
+        row_cache = kwargs.pop("row_cache", None)
+        if kwargs:
+            raise ValueError("Unknown keyword arguments: %s" % list(kwargs.keys()))
+        self.handle_pool = NcHandlePool(maxsize=max_open_files) if max_open_files is not None else None
+        self.row_cache, self._close_row_cache = None, False
+        self.set_row_cache(row_cache)
 
         for label, ncfile in args:
             self.add_file(label, ncfile)
@@ -95,7 +147,7 @@ class Robot(object):
     for_ext = class_for_ext
 
     @classmethod
-    def from_dir(cls, top, walk=True):
+    def from_dir(cls, top, walk=True, workers=None, executor="thread", metadata_only=False, max_open_files=None):
         """
         This class method builds a robot by scanning all files located within directory `top`.
         This method should be invoked with a concrete robot class, for example:
@@ -104,28 +156,77 @@ class Robot(object):
 
         Args:
             top (str): Root directory
-	    walk: if True, directories inside `top` are included as well.
+            walk: if True, directories inside `top` are included as well.
+            workers, executor, metadata_only, max_open_files: See `from_files`.
         """
-        return cls(*cls._open_files_in_dir(top, walk))
+        return cls.from_files(cls._find_files_in_dir(top, walk), workers=workers, executor=executor,
+                              metadata_only=metadata_only, max_open_files=max_open_files)
 
     @classmethod
-    def _open_files_in_dir(cls, top, walk):
-        """Open files in directory tree starting from `top`. Return list of Abinit files."""
-        from abipy.abilab import abiopen
-        items = []
+    def _find_files_in_dir(cls, top, walk):
+        """Return the list of files handled by the robot in the directory tree starting from `top`."""
+        filepaths = []
         if walk:
             for dirpath, dirnames, filenames in os.walk(top):
-                filenames = [f for f in filenames if cls.class_handles_filename(f)]
-                for f in filenames:
-                    ncfile = abiopen(os.path.join(dirpath, f))
-                    if ncfile is not None: items.append((ncfile.filepath, ncfile))
+                filepaths.extend(os.path.join(dirpath, f) for f in sorted(filenames)
+                                 if cls.class_handles_filename(f))
+        else:
+            filepaths = [os.path.join(top, f) for f in sorted(os.listdir(top)) if cls.class_handles_filename(f)]
+
+        return filepaths
+
+    @classmethod
+    def _open_files(cls, filepaths, workers=None, executor="thread", metadata_only=False, handle_pool=None):
+        """
+        Open the files in `filepaths`. Failures are recorded and do not abort the scan.
+        If `handle_pool` is not None, the netCDF files are registered in the pool by the calling thread
+        once the workers have returned them so that the pool never closes files that are still being read.
+        At most `workers` files are opened concurrently.
+
+        Returns:
+            (items, failures) where items is the list of (filepath, ncfile) tuples in the same order as filepaths
+            and failures is an OrderedDict mapping the filepath of the files that could not be opened
+            to the string with the traceback.
+        """
+        if metadata_only and cls.read_metadata.__func__ is Robot.read_metadata.__func__:
+            raise NotImplementedError("%s does not support metadata_only" % cls.__name__)
+
+        items, failures = [], OrderedDict()
+
+        def register(results):
+            for filepath, ncfile, error in results:
+                if error is not None:
+                    failures[filepath] = error
+                elif ncfile is not None:
+                    if handle_pool is not None and hasattr(ncfile, "set_handle_pool"):
+                        ncfile.set_handle_pool(handle_pool)
+                    items.append((ncfile.filepath, ncfile))
+
+        if workers is None or workers <= 1 or len(filepaths) <= 1:
+            register(_robot_open_file(cls, f, metadata_only) for f in filepaths)
         else:
-            filenames = [f for f in os.listdir(top) if cls.class_handles_filename(f)]
-            for f in filenames:
-                ncfile = abiopen(os.path.join(top, f))
-                if ncfile is not None: items.append((ncfile.filepath, ncfile))
+            if executor == "thread":
+                from concurrent.futures import ThreadPoolExecutor as PoolExecutor
+            elif executor == "process":
+                # File handles cannot be sent back by the worker processes.
+                if not metadata_only:
+                    raise ValueError("executor='process' requires metadata_only=True")
+                from concurrent.futures import ProcessPoolExecutor as PoolExecutor
+            else:
+                raise ValueError("Invalid executor: %s" % str(executor))
+
+            with PoolExecutor(max_workers=workers) as pool:
+                # Keep at most `workers` files in flight so that the number of open files is bounded by
+                # handle_pool.maxsize + workers. Results are registered (and the LRU files closed)
+                # before submitting the next file.
+                futures = deque()
+                for filepath in filepaths:
+                    if len(futures) == workers:
+                        register([futures.popleft().result()])
+                    futures.append(pool.submit(_robot_open_file, cls, filepath, metadata_only))
+                register(f.result() for f in futures)
 
-        return items
+        return items, failures
 
     @classmethod
     def class_handles_filename(cls, filename):
@@ -133,19 +234,31 @@ class Robot(object):
         return filename.endswith("_" + cls.EXT + ".nc")
 
     @classmethod
-    def from_files(cls, filenames):
-        """Build a Robot from a list of `filenames`."""
-        filenames = list_strings(filenames)
-        from abipy.abilab import abiopen
-        filenames = [f for f in filenames if cls.class_handles_filename(f)]
-        items = []
-        for f in filenames:
-            try:
-                ncfile = abiopen(f)
-            except Exception:
-                ncfile = None
-            if ncfile is not None: items.append((ncfile.filepath, ncfile))
-        return cls(*items)
+    def read_metadata(cls, filepath):
+        """
+        Read the quantities used to build the dataframes without opening the full file.
+        Return :class:`FileMetadata`. Must be implemented by the subclasses supporting `metadata_only`.
+        """
+        raise NotImplementedError("%s does not support metadata_only" % cls.__name__)
+
+    @classmethod
+    def from_files(cls, filenames, workers=None, executor="thread", metadata_only=False, max_open_files=None):
+        """
+        Build a Robot from a list of `filenames`.
+        The files that cannot be opened are stored in `robot.failures`.
+
+        Args:
+            filenames: List of file paths.
+            workers: Number of workers used to open the files concurrently. None or 1 for serial execution.
+            executor: "thread" to use a pool of threads (useful if the filesystem has large latency),
+                "process" to use a pool of processes (requires metadata_only).
+            metadata_only: True if only the quantities needed by `get_dataframe` should be read.
+                The robot contains :class:`FileMetadata` objects instead of files.
+            max_open_files: Maximum number of netCDF files kept open. None for no limit.
+        """
+        robot = cls(max_open_files=max_open_files)
+        robot.scan_files(filenames, workers=workers, executor=executor, metadata_only=metadata_only)
+        return robot
 
     @classmethod
     def from_flow(cls, flow, outdirs="all", nids=None):
@@ -211,23 +324,39 @@ class Robot(object):
 
             self.add_file(label, filepath)
 
-    def scan_dir(self, top, walk=True):
+    def scan_dir(self, top, walk=True, workers=None, executor="thread", metadata_only=False):
         """
         Scan directory tree starting from `top`. Add files to the robot instance.
 
         Args:
             top (str): Root directory
             walk: if True, directories inside `top` are included as well.
+            workers, executor, metadata_only: See `from_files`.
 
         Return:
             Number of files found.
-	"""
-        count = 0
-        for filepath, ncfile in self.__class__._open_files_in_dir(top, walk):
-            count += 1
+        """
+        return self.scan_files(self._find_files_in_dir(top, walk), workers=workers, executor=executor,
+                               metadata_only=metadata_only)
+
+    def scan_files(self, filenames, workers=None, executor="thread", metadata_only=False):
+        """
+        Open the files handled by the robot in `filenames` and add them to the robot.
+        The files that cannot be opened are stored in `self.failures`. See `from_files` for the other args.
+
+        Return:
+            Number of files added.
+        """
+        filenames = [f for f in list_strings(filenames) if self.class_handles_filename(f)]
+        items, failures = self.__class__._open_files(filenames, workers=workers, executor=executor,
+                                                     metadata_only=metadata_only, handle_pool=self.handle_pool)
+        for filepath, ncfile in items:
             self.add_file(filepath, ncfile)
+            # Files have been opened by the robot --> have to close them.
+            self._do_close[ncfile.filepath] = True
+        self._failures.update(failures)
 
-        return count
+        return len(items)
 
     def add_file(self, label, ncfile):
         """
@@ -247,6 +376,9 @@ class Robot(object):
         if label in self._ncfiles:
             raise ValueError("label %s is already present!")
 
+        if self.handle_pool is not None and hasattr(ncfile, "set_handle_pool"):
+            ncfile.set_handle_pool(self.handle_pool)
+
         self._ncfiles[label] = ncfile
 
     #def pop_filepath(self, filepath):
@@ -311,6 +443,32 @@ class Robot(object):
         """List of exceptions."""
         return self._exceptions
 
+    def set_row_cache(self, row_cache):
+        """
+        Set the persistent cache used to store the rows of the dataframes. The rows are computed
+        only for the files that are not in the cache or that have been modified.
+
+        Args:
+            row_cache: :class:`RowCache` object or string with the path of the database (the database
+                is closed by the robot). None disables caching.
+        """
+        if self._close_row_cache: self.row_cache.close()
+        self._close_row_cache = is_string(row_cache)
+        self.row_cache = RowCache(row_cache) if is_string(row_cache) else row_cache
+
+    def _get_row(self, ncfile, extractor, args, func):
+        """
+        Return the OrderedDict computed by `func(ncfile)`. Use the row cache if available.
+        `extractor` and `args` (json-serializable dict) identify the row in the cache.
+        """
+        if self.row_cache is None: return func(ncfile)
+        return self.row_cache.get_or_compute(ncfile, extractor, args, func)
+
+    @property
+    def failures(self):
+        """OrderedDict mapping the path of the files that could not be opened to the traceback."""
+        return self._failures
+
     def __len__(self):
         return len(self._ncfiles)
 
@@ -347,6 +505,10 @@ class Robot(object):
         """String representation."""
         lines = ["%s with %d files in memory" % (self.__class__.__name__, len(self.ncfiles))]
         app = lines.append
+        if self.failures:
+            app("%d files could not be opened: %s" % (len(self.failures), list(self.failures.keys())))
+        if self.handle_pool is not None:
+            app("Handle pool: %s" % str(self.handle_pool))
         for i, f in enumerate(self.ncfiles):
             app(" ")
             app(func(f))
@@ -363,6 +525,10 @@ class Robot(object):
         """
         Close all files that have been opened by the Robot
         """
+        if self._close_row_cache:
+            self.row_cache.close()
+            self.row_cache, self._close_row_cache = None, False
+
         for ncfile in self.ncfiles:
             if self._do_close.pop(ncfile.filepath, False):
                 try:
@@ -476,6 +642,29 @@ class GsrRobot(Robot, NotebookWriter):
     """
     EXT = "GSR"
 
+    @classmethod
+    def read_metadata(cls, filepath):
+        """
+        Read the quantities used in `get_dataframe` from the GSR file.
+        The eigenvalues are not read. Return :class:`FileMetadata`.
+        """
+        from abipy.electrons.gsr import GsrReader
+        with GsrReader(filepath) as r:
+            fmods = np.sqrt(np.sum(r.read_cart_forces() ** 2, axis=1))
+            return FileMetadata(filepath,
+                energy=units.Energy(r.read_value("etotal"), "Ha").to("eV"),
+                pressure=r.read_pressure(),
+                max_force=fmods.max(),
+                ecut=units.Energy(r.read_value("ecut"), "Ha"),
+                pawecutdg=units.Energy(r.read_value("pawecutdg"), "Ha"),
+                tsmear=r.read_smearing().tsmear_ev.to("Ha"),
+                nkpt=r.read_dimvalue("number_of_kpoints"),
+                nsppol=r.read_nsppol(),
+                nspinor=r.read_nspinor(),
+                nspden=r.read_nspden(),
+                structure=r.read_structure(),
+            )
+
     def get_dataframe(self, with_geo=True, **kwargs):
         """
         Return a pandas DataFrame with the most important GS results.
@@ -492,6 +681,7 @@ class GsrRobot(Robot, NotebookWriter):
                 Each function receives a :class:`GsrFile` object and returns a tuple (key, value)
                 where key is a string with the name of column and value is the value to be inserted.
         """
+        import pandas as pd
         # Add attributes specified by the users
         # TODO add more columns
         attrs = [
@@ -501,12 +691,13 @@ class GsrRobot(Robot, NotebookWriter):
             "nsppol", "nspinor", "nspden",
         ] + kwargs.pop("attrs", [])
 
-        rows, row_names = [], []
-        for label, gsr in self:
-            row_names.append(label)
+        def get_row(gsr):
             d = OrderedDict()
             for aname in attrs:
-                if aname == "nkpt":
+                if isinstance(gsr, FileMetadata):
+                    # Robot built with metadata_only.
+                    value = getattr(gsr, aname, None)
+                elif aname == "nkpt":
                     value = len(gsr.ebands.kpoints)
                 else:
                     value = getattr(gsr, aname, None)
@@ -516,6 +707,12 @@ class GsrRobot(Robot, NotebookWriter):
             # Add info on structure.
             if with_geo:
                 d.update(gsr.structure.get_dict4frame(with_spglib=True))
+            return d
+
+        rows, row_names = [], []
+        for label, gsr in self:
+            row_names.append(label)
+            d = self._get_row(gsr, "GsrRobot.get_dataframe", dict(attrs=attrs, with_geo=with_geo), get_row)
 
             # Execute functions
             d.update(self._exec_funcs(kwargs.get("funcs", []), gsr))
@@ -565,6 +762,8 @@ class GsrRobot(Robot, NotebookWriter):
 
         TODO: which default? all should return a list of fits
         """
+        from pymatgen.analysis.eos import EOS
+        import pandas as pd
         # Read volumes and energies from the GSR files.
         energies, volumes = [], []
         for label, gsr in self:
@@ -636,6 +835,7 @@ class SigresRobot(Robot, NotebookWriter):
             kpoint
             with_geo: True if structure info should be added to the dataframe
         """
+        import pandas as pd
         # TODO: Ideally one should select the k-point for which we have the fundamental gap for the given spin
         # TODO: In principle the SIGRES might have different k-points
         if spin is None: spin = 0
@@ -647,9 +847,7 @@ class SigresRobot(Robot, NotebookWriter):
             #"tsmear", "nkibz",
         ] + kwargs.pop("attrs", [])
 
-        rows, row_names = [], []
-        for label, sigres in self:
-            row_names.append(label)
+        def get_row(sigres):
             d = OrderedDict()
             for aname in attrs:
                 d[aname] = getattr(sigres, aname, None)
@@ -663,6 +861,15 @@ class SigresRobot(Robot, NotebookWriter):
             # Add info on structure.
             if with_geo:
                 d.update(sigres.structure.get_dict4frame(with_spglib=True))
+            return d
+
+        # Kpoint objects are stored with the full-precision reduced coordinates.
+        args = dict(spin=spin, kpoint=np.asarray(getattr(kpoint, "frac_coords", kpoint)).tolist(),
+                    attrs=attrs, with_geo=with_geo)
+        rows, row_names = [], []
+        for label, sigres in self:
+            row_names.append(label)
+            d = self._get_row(sigres, "SigresRobot.get_qpgaps_dataframe", args, get_row)
 
             # Execute functions.
             d.update(self._exec_funcs(kwargs.get("funcs", []), sigres))
@@ -732,9 +939,8 @@ class MdfRobot(Robot, NotebookWriter):
         Return:
             pandas DataFrame
         """
-        rows, row_names = [], []
-        for i, (label, mdf) in enumerate(self):
-            row_names.append(label)
+        import pandas as pd
+        def get_row(mdf):
             d = OrderedDict([
                 ("exc_mdf", mdf.exc_mdf),
                 ("rpa_mdf", mdf.rpanlf_mdf),
@@ -749,6 +955,12 @@ class MdfRobot(Robot, NotebookWriter):
             # Add info on structure.
             if with_geo:
                 d.update(mdf.structure.get_dict4frame(with_spglib=True))
+            return d
+
+        rows, row_names = [], []
+        for i, (label, mdf) in enumerate(self):
+            row_names.append(label)
+            d = self._get_row(mdf, "MdfRobot.get_dataframe", dict(with_geo=with_geo), get_row)
 
             # Execute functions.
             d.update(self._exec_funcs(kwargs.get("funcs", []), mdf))
@@ -836,6 +1048,7 @@ class DdbRobot(Robot, NotebookWriter):
         Return:
             pandas DataFrame
         """
+        import pandas as pd
         # If qpoint is None, all the DDB must contain have the same q-point .
         if qpoint is None:
             if not all(len(ddb.qpoints) == 1 for ddb in self.ncfiles):
@@ -845,9 +1058,7 @@ class DdbRobot(Robot, NotebookWriter):
             if any(np.any(ddb.qpoints[0] != qpoint) for ddb in self.ncfiles):
                 raise ValueError("All the q-points in the DDB files must be equal")
 
-        rows, row_names = [], []
-        for i, (label, ddb) in enumerate(self):
-            row_names.append(label)
+        def get_row(ddb):
             d = OrderedDict()
             #d = {aname: getattr(ddb, aname) for aname in attrs}
             #d.update({"qpgap": mdf.get_qpgap(spin, kpoint)})
@@ -864,6 +1075,15 @@ class DdbRobot(Robot, NotebookWriter):
             # Add info on structure.
             if with_geo:
                 d.update(phbands.structure.get_dict4frame(with_spglib=True))
+            return d
+
+        # The anaddb calculation is performed only for the files that are not in the cache.
+        args = dict(qpoint=np.asarray(getattr(qpoint, "frac_coords", qpoint)).tolist(),
+                    asr=asr, chneut=chneut, dipdip=dipdip, with_geo=with_geo)
+        rows, row_names = [], []
+        for i, (label, ddb) in enumerate(self):
+            row_names.append(label)
+            d = self._get_row(ddb, "DdbRobot.get_dataframe_at_qpoint", args, get_row)
 
             # Execute functions.
             d.update(self._exec_funcs(kwargs.get("funcs", []), ddb))
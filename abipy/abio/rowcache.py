@@ -0,0 +1,178 @@
+# coding: utf-8
+"""Persistent cache for the rows extracted by the robots from the output files."""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import os
+import time
+import pickle
+import sqlite3
+
+from collections import OrderedDict
+from abipy.tools.cachetools import json_key, CacheStatsMixin
+
+
+__all__ = [
+    "RowCache",
+]
+
+
+class RowCache(CacheStatsMixin):
+    """
+    Persistent cache (SQLite database) with the rows extracted by the robots from the files.
+    An entry is associated to the absolute path of the file, the name of the extractor
+    (e.g. "GsrRobot.get_dataframe") and the arguments of the extractor.
+    The mtime and the size of the file are stored together with the row.
+
+    Invalidation rules:
+
+        - The entries of a file are stale if the mtime or the size of the file changed.
+          Stale entries are removed when the file is looked up.
+        - `prune` removes the entries of the files that do not exist anymore.
+        - `invalidate` removes the entries of a file and/or an extractor.
+        - The database is cleared if it has been written with a different `VERSION`.
+
+    Usage example:
+
+    .. code-block:: python
+
+        with RowCache("robot_rows.sqlite") as cache:
+            robot.set_row_cache(cache)
+            df = robot.get_dataframe()
+            print(cache.to_string())
+    """
+    # Increase this number if the format of the rows changes.
+    VERSION = 1
+
+    # Counters. See CacheStatsMixin.
+    COUNTERS = ("hits", "misses", "stale", "stores")
+
+    def __init__(self, filepath):
+        """
+        Args:
+            filepath: Path of the SQLite database. Created if it does not exist.
+        """
+        self.filepath = os.path.abspath(os.path.expanduser(filepath))
+        self._conn = sqlite3.connect(self.filepath)
+        self.reset_stats()
+
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS rows (
+                path TEXT, extractor TEXT, args TEXT, mtime REAL, size INTEGER, row BLOB, ctime REAL,
+                PRIMARY KEY (path, extractor, args))""")
+
+            version = self._conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+            if version is None or int(version[0]) != self.VERSION:
+                self._conn.execute("DELETE FROM rows")
+                self._conn.execute("INSERT OR REPLACE INTO info VALUES ('version', ?)", (str(self.VERSION),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the database."""
+        self._conn.close()
+
+    def _stats_title(self):
+        return "RowCache: %s" % self.filepath
+
+    def _extra_stats(self):
+        """Size of the database."""
+        nrows, nfiles = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT path) FROM rows").fetchone()
+        return OrderedDict([("nrows", nrows), ("nfiles", nfiles), ("size_bytes", os.path.getsize(self.filepath))])
+
+    @staticmethod
+    def _get_key(filepath, extractor, args):
+        return os.path.abspath(filepath), extractor, json_key(args)
+
+    def get(self, filepath, extractor, args):
+        """
+        Return the row stored in the cache for (filepath, extractor, args). None if not available.
+        The stale entries of filepath are removed.
+        """
+        path, extractor, args = self._get_key(filepath, extractor, args)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        with self._conn:
+            nstale = self._conn.execute("DELETE FROM rows WHERE path = ? AND (mtime != ? OR size != ?)",
+                                        (path, stat.st_mtime, stat.st_size)).rowcount
+            self.stale += nstale
+            entry = self._conn.execute("SELECT row FROM rows WHERE path = ? AND extractor = ? AND args = ?",
+                                       (path, extractor, args)).fetchone()
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return pickle.loads(bytes(entry[0]))
+
+    def put(self, filepath, extractor, args, row):
+        """
+        Store the row extracted from filepath in the cache.
+        Return True if success. Rows that cannot be pickled are not stored.
+        """
+        path, extractor, args = self._get_key(filepath, extractor, args)
+        try:
+            stat = os.stat(path)
+            blob = pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            return False
+
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, extractor, args, stat.st_mtime, stat.st_size, sqlite3.Binary(blob), time.time()))
+        self.stores += 1
+        return True
+
+    def get_or_compute(self, obj, extractor, args, func):
+        """
+        Return the row computed by `func(obj)` using the cache.
+        `obj` is an object with the `filepath` attribute (e.g. :class:`AbinitNcFile`).
+        The cache is not used if `args` cannot be serialized with json.
+        """
+        try:
+            self._get_key(obj.filepath, extractor, args)
+        except TypeError:
+            return func(obj)
+
+        row = self.get(obj.filepath, extractor, args)
+        if row is None:
+            row = func(obj)
+            self.put(obj.filepath, extractor, args, row)
+        return row
+
+    def invalidate(self, filepath=None, extractor=None):
+        """
+        Remove the entries of `filepath` and/or `extractor`. All the entries if both are None.
+        Return the number of entries removed.
+        """
+        query, params = "DELETE FROM rows", []
+        conds = []
+        if filepath is not None:
+            conds.append("path = ?")
+            params.append(os.path.abspath(filepath))
+        if extractor is not None:
+            conds.append("extractor = ?")
+            params.append(extractor)
+        if conds: query += " WHERE " + " AND ".join(conds)
+
+        with self._conn:
+            return self._conn.execute(query, params).rowcount
+
+    def clear(self):
+        """Remove all the entries. Return the number of entries removed."""
+        return self.invalidate()
+
+    def prune(self):
+        """Remove the entries of the files that do not exist anymore. Return the number of entries removed."""
+        paths = [p for (p,) in self._conn.execute("SELECT DISTINCT path FROM rows") if not os.path.exists(p)]
+        with self._conn:
+            return sum(self._conn.execute("DELETE FROM rows WHERE path = ?", (p,)).rowcount for p in paths)
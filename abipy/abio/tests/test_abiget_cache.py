@@ -0,0 +1,86 @@
+# coding: utf-8
+"""Tests for abiget_cache module."""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import tempfile
+import numpy as np
+
+from abipy.core.kpoints import Kpoint
+from abipy.core.testing import AbipyTest
+from abipy.abio.abiget_cache import AbigetCache, get_abiget_cache, set_abiget_cache, memoize_abiget
+
+
+class FakeStructure(object):
+    def to_abivars(self):
+        return dict(natom=2, xred=np.zeros((2, 3)))
+
+
+class FakeInput(object):
+    """Emulates the AbinitInput API used by the cache."""
+    def __init__(self, checksum):
+        self.checksum, self.ncalls = checksum, 0
+        self.structure = FakeStructure()
+
+    def variable_checksum(self):
+        return self.checksum
+
+    @memoize_abiget
+    def abiget_foo(self, ngkpt=None, workdir=None, manager=None):
+        self.ncalls += 1
+        return dict(ngkpt=ngkpt, data=np.arange(1000.0))
+
+
+class AbigetCacheTest(AbipyTest):
+
+    def test_abiget_cache(self):
+        """Testing AbigetCache."""
+        assert get_abiget_cache() is None
+        cache = AbigetCache(cachedir=tempfile.mkdtemp(), abinit_version="8.4.1")
+        inp = FakeInput("abc")
+        key = cache.get_key(inp, "abiget_foo", dict(ngkpt=[2, 2, 2]))
+        assert key == cache.get_key(FakeInput("abc"), "abiget_foo", dict(ngkpt=np.array([2, 2, 2])))
+        assert key != cache.get_key(FakeInput("abd"), "abiget_foo", dict(ngkpt=[2, 2, 2]))
+        assert key != cache.get_key(inp, "abiget_bar", dict(ngkpt=[2, 2, 2]))
+        assert cache.lookup(key) == (False, None)
+
+        # Without cache, the method is always executed.
+        inp.abiget_foo(ngkpt=[2, 2, 2])
+        inp.abiget_foo(ngkpt=[2, 2, 2])
+        assert inp.ncalls == 2
+
+        old_cache = set_abiget_cache(cache)
+        try:
+            inp = FakeInput("abc")
+            res = inp.abiget_foo(ngkpt=[2, 2, 2])
+            same_res = FakeInput("abc").abiget_foo([2, 2, 2], manager="foo")
+            assert inp.ncalls == 1 and cache.hits == 1 and cache.stores == 1
+            self.assert_equal(same_res["data"], res["data"])
+
+            # Different arguments or workdir --> no hit.
+            inp.abiget_foo(ngkpt=[4, 4, 4])
+            inp.abiget_foo(ngkpt=[2, 2, 2], workdir="foo")
+            assert inp.ncalls == 3 and len(cache) == 2
+            str(cache)
+
+            # Kpoints are keyed with the full-precision reduced coordinates.
+            k1, k2 = Kpoint([0.1, 0, 0], np.eye(3)), Kpoint([0.1001, 0, 0], np.eye(3))
+            inp.abiget_foo(ngkpt=k1)
+            inp.abiget_foo(ngkpt=k2)
+            assert inp.ncalls == 5 and len(cache) == 4
+
+            # Arguments that cannot be used to build the key --> no caching.
+            inp.abiget_foo(ngkpt=object())
+            inp.abiget_foo(ngkpt=object())
+            assert inp.ncalls == 7 and len(cache) == 4
+
+            # Size-bounded eviction (each entry is ~8 Kb).
+            cache.maxsize_mb = 20.0 / 1024
+            for i in range(5):
+                FakeInput("input%d" % i).abiget_foo()
+            assert len(cache) == 2 and cache.evictions == 7
+            assert cache.get_stats()["size_mb"] <= cache.maxsize_mb
+
+            cache.clear()
+            assert len(cache) == 0
+        finally:
+            set_abiget_cache(old_cache)
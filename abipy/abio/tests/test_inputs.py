@@ -288,6 +288,25 @@ class TestAbinitInput(AbipyTest):
         inp_si["paral_kgb"] = 1
         pconfs = inp_si.abiget_autoparal_pconfs(max_ncpus=5)
 
+        # Test the abiget cache and MultiDataset batching.
+        import tempfile
+        from abipy.abio.abiget_cache import AbigetCache, set_abiget_cache
+        cache = AbigetCache(cachedir=tempfile.mkdtemp())
+        old_cache = set_abiget_cache(cache)
+        try:
+            inp_si444 = inp_si.deepcopy()
+            inp_si444.set_kmesh(ngkpt=(4, 4, 4), shiftk=(0, 0, 0))
+            multi = MultiDataset.from_inputs([inp_si, inp_si.deepcopy(), inp_si444])
+            ibzs = multi.abiget_ibz(workers=2)
+            assert len(ibzs) == 3 and cache.stores == 2 and cache.misses == 2
+            self.assert_equal(ibzs[0].points, ibzs[1].points)
+            same_ibz = inp_si.abiget_ibz()
+            assert cache.hits == 1
+            self.assert_equal(same_ibz.points, ibzs[0].points)
+            self.assert_equal(same_ibz.weights, ibzs[0].weights)
+        finally:
+            set_abiget_cache(old_cache)
+
     def test_dict_methods(self):
         """ Testing AbinitInput dict methods """
         inp = ebands_input(abidata.cif_file("si.cif"), abidata.pseudos("14si.pspnc"), kppa=10, ecut=2)[0]
@@ -63,6 +63,120 @@ class RobotTest(AbipyTest):
 
         robot.close()
 
+    def test_parallel_open(self):
+        """Testing concurrent open and metadata-only open of files in robots"""
+        filepaths = [abidata.ref_file("si_scf_GSR.nc"), abidata.ref_file("si_nscf_GSR.nc")]
+        bad_path = self.get_tmpname(suffix="_GSR.nc")
+        with open(bad_path, "wt") as fh:
+            fh.write("not a netcdf file")
+
+        with GsrRobot.from_files(filepaths + [bad_path], workers=2) as robot:
+            assert len(robot) == 2
+            assert list(robot.failures.keys()) == [bad_path]
+            df = robot.get_dataframe()
+            repr(robot); str(robot)
+
+        with self.assertRaises(ValueError):
+            GsrRobot.from_files(filepaths, workers=2, executor="process")
+        with self.assertRaises(NotImplementedError):
+            DdbRobot.from_files(filepaths, metadata_only=True)
+
+        for executor in ("thread", "process"):
+            with GsrRobot.from_files(filepaths + [bad_path], workers=2, executor=executor,
+                                     metadata_only=True) as meta_robot:
+                assert len(meta_robot) == 2 and len(meta_robot.failures) == 1
+                assert all(isinstance(meta, FileMetadata) for meta in meta_robot.ncfiles)
+                meta_df = meta_robot.get_dataframe()
+                self.assert_almost_equal(meta_df["energy"].values, df["energy"].values)
+                assert list(meta_df["nkpt"]) == list(df["nkpt"])
+                assert list(meta_df["natom"]) == list(df["natom"])
+
+    def test_handle_pool(self):
+        """Testing robots with a bounded number of open files"""
+        filepaths = [abidata.ref_file("si_scf_GSR.nc"), abidata.ref_file("si_nscf_GSR.nc")]
+        with GsrRobot.from_files(filepaths, max_open_files=1) as robot:
+            assert len(robot) == 2 and len(robot.handle_pool) == 1
+            df = robot.get_dataframe()
+            self.assert_almost_equal(df["energy"].values[0], -241.2364683)
+            stats = robot.handle_pool.get_stats()
+            assert stats["evictions"] > 0 and stats["reopens"] > 0
+            str(robot)
+
+        assert len(robot.handle_pool) == 0
+        with self.assertRaises(ValueError):
+            GsrRobot(foo=1)
+
+        # Concurrent opening: files are registered in the pool after the workers returned them.
+        filepaths = filepaths + [abidata.ref_file("ni_666k_GSR.nc")]
+        with GsrRobot.from_files(filepaths, workers=3, max_open_files=1) as robot:
+            assert len(robot) == 3 and len(robot.handle_pool) == 1
+            df = robot.get_dataframe()
+            self.assert_almost_equal(df["energy"].values[0], -241.2364683)
+            assert robot.handle_pool.get_stats()["evictions"] > 0
+
+    def test_handle_pool_concurrent_scan(self):
+        """Testing the number of open files during a concurrent scan with max_open_files"""
+        if not os.path.isdir("/proc/self/fd"):
+            raise self.SkipTest("Requires /proc/self/fd")
+        import shutil
+        import tempfile
+        from abipy.abio import robots
+        tmpdir = os.path.realpath(tempfile.mkdtemp())
+        filepaths = []
+        for i in range(8):
+            filepaths.append(os.path.join(tmpdir, "f%d_GSR.nc" % i))
+            shutil.copy(abidata.ref_file("si_scf_GSR.nc"), filepaths[-1])
+
+        def count_open_files():
+            count = 0
+            for fd in os.listdir("/proc/self/fd"):
+                try:
+                    if os.readlink(os.path.join("/proc/self/fd", fd)).startswith(tmpdir): count += 1
+                except OSError:
+                    pass
+            return count
+
+        nopen = []
+        open_file = robots._robot_open_file
+        def counting_open_file(*args):
+            out = open_file(*args)
+            nopen.append(count_open_files())
+            return out
+
+        workers, max_open_files = 2, 1
+        robots._robot_open_file = counting_open_file
+        try:
+            with GsrRobot.from_files(filepaths, workers=workers, max_open_files=max_open_files) as robot:
+                assert len(robot) == len(filepaths) and not robot.failures
+                assert len(nopen) == len(filepaths)
+                assert max(nopen) <= max_open_files + workers
+                assert count_open_files() == max_open_files
+        finally:
+            robots._robot_open_file = open_file
+            shutil.rmtree(tmpdir)
+
+    def test_row_cache(self):
+        """Testing robots with the persistent row cache"""
+        from abipy.abio.rowcache import RowCache
+        filepaths = [abidata.ref_file("si_scf_GSR.nc"), abidata.ref_file("si_nscf_GSR.nc")]
+        dbpath = self.get_tmpname(suffix=".sqlite")
+        with RowCache(dbpath) as cache:
+            with GsrRobot.from_files(filepaths) as robot:
+                robot.set_row_cache(cache)
+                df = robot.get_dataframe()
+                assert cache.stores == 2 and cache.hits == 0
+                same_df = robot.get_dataframe(funcs=lambda gsr: ("natom2", 2 * len(gsr.structure)))
+                assert cache.hits == 2
+                self.assert_almost_equal(same_df["energy"].values, df["energy"].values)
+                assert "natom2" in same_df
+
+        # The robot opens and closes the database.
+        with GsrRobot.from_files(filepaths) as robot:
+            robot.set_row_cache(dbpath)
+            robot.get_dataframe()
+            assert robot.row_cache.hits == 2
+        assert robot.row_cache is None
+
     def test_sigres_robot(self):
         """Testing SIGRES robot."""
         filepaths = abidata.ref_files(
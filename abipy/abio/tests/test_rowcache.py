@@ -0,0 +1,73 @@
+# coding: utf-8
+"""Tests for rowcache module."""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import os
+import time
+import numpy as np
+
+from collections import OrderedDict
+from abipy.core.testing import AbipyTest
+from abipy.abio.rowcache import RowCache
+
+
+class FakeFile(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+
+class RowCacheTest(AbipyTest):
+
+    def test_rowcache(self):
+        """Testing RowCache."""
+        dbpath = self.get_tmpname(suffix=".sqlite")
+        filepath = self.get_tmpname(suffix="_GSR.nc")
+        with open(filepath, "wt") as fh:
+            fh.write("foo")
+
+        ncalls = [0]
+        def func(obj):
+            ncalls[0] += 1
+            return OrderedDict([("energy", 1.0), ("path", obj.filepath), ("vec", np.ones(3))])
+
+        args = dict(attrs=["energy"], qpoint=np.zeros(3), with_geo=True)
+        with RowCache(dbpath) as cache:
+            assert cache.get(filepath, "func", args) is None
+            row = cache.get_or_compute(FakeFile(filepath), "func", args, func)
+            same_row = cache.get_or_compute(FakeFile(filepath), "func", args, func)
+            assert ncalls[0] == 1 and list(same_row.keys()) == list(row.keys())
+            self.assert_equal(same_row["vec"], row["vec"])
+
+            # Different arguments --> new entry.
+            cache.get_or_compute(FakeFile(filepath), "func", dict(args, with_geo=False), func)
+            assert ncalls[0] == 2
+            stats = cache.get_stats()
+            assert stats["hits"] == 1 and stats["stores"] == 2 and stats["nrows"] == 2 and stats["nfiles"] == 1
+            str(cache)
+
+            # Arguments that cannot be serialized with json are not cached.
+            bad_args = dict(args, kpoint=FakeFile("foo"))
+            with self.assertRaises(TypeError):
+                cache.get(filepath, "func", bad_args)
+            cache.get_or_compute(FakeFile(filepath), "func", bad_args, func)
+            cache.get_or_compute(FakeFile(filepath), "func", bad_args, func)
+            assert ncalls[0] == 4 and cache.get_stats()["nrows"] == 2
+
+        # Entries are persistent.
+        with RowCache(dbpath) as cache:
+            assert cache.get(filepath, "func", args) is not None
+
+            # Modified file --> stale entries are removed.
+            with open(filepath, "at") as fh:
+                fh.write("bar")
+            assert cache.get(filepath, "func", args) is None
+            assert cache.stale == 2 and cache.get_stats()["nrows"] == 0
+
+            cache.get_or_compute(FakeFile(filepath), "func", args, func)
+            assert cache.invalidate(extractor="foo") == 0
+            assert cache.invalidate(filepath=filepath, extractor="func") == 1
+
+            cache.get_or_compute(FakeFile(filepath), "func", args, func)
+            os.remove(filepath)
+            assert cache.prune() == 1
+            assert cache.clear() == 0
@@ -4,6 +4,7 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 
 import numpy as np
 import collections
+import tempfile
 import pymatgen.core.units as pmgu
 
 from collections import OrderedDict
@@ -43,6 +44,16 @@ def latexlabel_ispden(ispden, nspden):
         raise NotImplementedError()
 
 
+def _scratch_array(shape, dtype, workdir=None):
+    """
+    Return a `np.memmap` with the given shape and dtype backed by an anonymous temporary file
+    created in `workdir` (None for the default temporary directory).
+    The file is removed automatically when the array is garbage collected.
+    """
+    with tempfile.TemporaryFile(dir=workdir) as fh:
+        return np.memmap(fh, dtype=dtype, mode="w+", shape=shape)
+
+
 class _Field(Has_Structure):
     """
     Base class representing a set of spin-dependent scalar fields generated by electrons (e.g. densities, potentials).
@@ -60,10 +71,13 @@ class _Field(Has_Structure):
     latex_label = " "
 
     @classmethod
-    def from_file(cls, filepath):
-        """Initialize the object from a netCDF file."""
+    def from_file(cls, filepath, lazy=False, workdir=None):
+        """
+        Initialize the object from a netCDF file.
+        Use `lazy=True` to store the data in a memory-mapped scratch file (see `FieldReader.read_denpot`).
+        """
         with FieldReader(filepath) as r:
-            return r.read_denpot(varname=cls.netcdf_name, field_cls=cls)
+            return r.read_denpot(varname=cls.netcdf_name, field_cls=cls, lazy=lazy, workdir=workdir)
 
     def __init__(self, nspinor, nsppol, nspden, datar, structure, iorder="c"):
         """
@@ -114,45 +128,64 @@ class _Field(Has_Structure):
 
         return other.datar
 
+    def _new_field(self, func, other=None):
+        """
+        Return a new :class:`_Field` with datar = func(self.datar, other_datar) or func(self.datar) if other is None.
+        If one of the fields is memory-mapped (see `is_lazy`), the operation is performed in slabs of x-planes
+        and the result is stored in a memory-mapped scratch array so that the full grid is never loaded in memory.
+        """
+        if other is None:
+            op = lambda a, sl: func(a[sl])
+            lazy = self.is_lazy
+        else:
+            other_datar = self._check_and_get_datar(other)
+            lazy = self.is_lazy or isinstance(other_datar, np.memmap)
+            if isinstance(other_datar, np.ndarray):
+                op = lambda a, sl: func(a[sl], other_datar[sl])
+            else:
+                op = lambda a, sl: func(a[sl], other_datar)
+
+        if not lazy:
+            datar = op(self.datar, Ellipsis)
+        else:
+            # Use the result of the first x-plane to get the dtype.
+            first = op(self.datar, np.s_[:, :1])
+            datar = _scratch_array(self.datar.shape, first.dtype)
+            nplanes = max(1, 2**22 // (self.ny * self.nz))
+            for start in range(0, self.nx, nplanes):
+                sl = np.s_[:, start:start + nplanes]
+                datar[sl] = op(self.datar, sl)
+
+        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
+                      datar=datar, structure=self.structure, iorder="c")
+
     def __add__(self, other):
         """self + other"""
-        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
-                      datar=self.datar + self._check_and_get_datar(other),
-                      structure=self.structure, iorder="c")
+        return self._new_field(np.add, other)
 
     def __sub__(self, other):
         """self - other"""
-        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
-                      datar=self.datar - self._check_and_get_datar(other),
-                      structure=self.structure, iorder="c")
+        return self._new_field(np.subtract, other)
 
     def __mul__(self, other):
         """self * other"""
-        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
-                      datar=self.datar * self._check_and_get_datar(other),
-                      structure=self.structure, iorder="c")
+        return self._new_field(np.multiply, other)
 
     __rmul__ = __mul__
 
     def __truediv__(self, other):
         """self / other"""
-        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
-                      datar=self.datar / self._check_and_get_datar(other),
-                      structure=self.structure, iorder="c")
+        return self._new_field(np.true_divide, other)
 
     __div__ = __truediv__
 
     def __neg__(self):
         """-self"""
-        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
-                      datar=-self.datar,
-                      structure=self.structure, iorder="c")
+        return self._new_field(np.negative)
 
     def __abs__(self):
         """abs(self)"""
-        return _Field(nspinor=self.nspinor, nsppol=self.nsppol, nspden=self.nspden,
-                      datar=np.abs(self.datar),
-                      structure=self.structure, iorder="c")
+        return self._new_field(np.abs)
 
     @property
     def structure(self):
@@ -175,11 +208,47 @@ class _Field(Has_Structure):
         """`ndarray` with data in real space. shape: [nspden, nx, ny, nz]"""
         return self._datar
 
+    @property
+    def is_lazy(self):
+        """
+        True if datar is a memory-mapped array (e.g. field read with `read_denpot(..., lazy=True)`).
+        In this case, the data is loaded on demand and the operations are performed out of core.
+        """
+        return isinstance(self._datar, np.memmap)
+
     @lazy_property
     def datag(self):
         """`ndarrray` with data in reciprocal space. shape: [nspden, nx, ny, nz]"""
         # FFT R --> G.
-        return self.mesh.fft_r2g(self.datar)
+        if not self.is_lazy:
+            return self.mesh.fft_r2g(self.datar)
+
+        # Transform one spin component at a time and store results in a memory-mapped array.
+        datag = _scratch_array(self.datar.shape, np.complex)
+        for ispden in range(self.nspden):
+            datag[ispden] = self.mesh.fft_r2g(self.datar[ispden])
+        return datag
+
+    @property
+    def is_real(self):
+        """True if datar is real. In this case the half-spectrum `datag_half` can be used."""
+        return not np.iscomplexobj(self.datar)
+
+    @lazy_property
+    def datag_half(self):
+        """
+        `ndarray` with the half-spectrum of the real data in reciprocal space. shape: [nspden, nx, ny, nz//2+1]
+        Requires half the memory and CPU time of datag. See :meth:`Mesh3D.fft_r2g_half`.
+        """
+        if not self.is_real:
+            raise TypeError("datag_half requires real data")
+        if not self.is_lazy:
+            return self.mesh.fft_r2g_half(self.datar)
+
+        datag = _scratch_array((self.nspden,) + self.mesh.half_shape, np.complex)
+        for ispden in range(self.nspden):
+            datag[ispden] = self.mesh.fft_r2g_half(self.datar[ispden])
+        return datag
 
     @property
     def mesh(self):
@@ -189,7 +258,6 @@ class _Field(Has_Structure):
     @property
     def shape(self):
         """Shape of the array."""
-        assert self.datar.shape == self.datag.shape
         return self.datar.shape
 
     @property
@@ -307,16 +375,85 @@ class _Field(Has_Structure):
         else:
             raise visu.Error("Don't know how to export data for visualizer %s" % visu_name)
 
-    def get_interpolator(self):
+    def get_interpolator(self, method="linear"):
         """
         Return an interpolator object that interpolates periodic functions in real space.
+
+        Args:
+            method: Interpolation method: "linear", "cubic" or "fourier".
+                See :class:`BlochRegularGridInterpolator`.
         """
         from abipy.tools.numtools import BlochRegularGridInterpolator
-        return BlochRegularGridInterpolator(self.structure, self.datar)
+        return BlochRegularGridInterpolator(self.structure, self.datar, method=method)
+
+    def fourier_interp(self, new_mesh):
+        """
+        Fourier interpolation of the field on a different FFT mesh (zero-padding or truncation of datag).
+        Useful to compare fields computed with different `ngfft` or to upsample densities for visualization.
+
+        Args:
+            new_mesh: :class:`Mesh3D` or shape of the new FFT mesh.
+
+        Return:
+            New object of the same class with datar defined on `new_mesh`.
+        """
+        if hasattr(new_mesh, "vectors") and not np.allclose(new_mesh.vectors, self.mesh.vectors):
+            raise ValueError("new_mesh is defined on a different unit cell.")
+        intp_datar = self.mesh.fourier_interp(self.datar, new_mesh, inspace="r")
+        return self.__class__(self.nspinor, self.nsppol, self.nspden, intp_datar, self.structure, iorder="c")
+
+    def symmetrize(self, spacegroup=None):
+        r"""
+        Symmetrize the field with :math:`f(r) = \frac{1}{N_{sym}} \sum_S f(R^{-1}(r - \tau))`.
+        Anti-ferromagnetic operations exchange the spin-up and spin-down components.
+        The rotated points are obtained from the tables cached in the mesh (see :meth:`Mesh3D.get_irottable`).
+        The symmetrization is done in real space if the mesh is compatible with the fractional translations,
+        otherwise in G-space with the nonsymmorphic phases.
+
+        Args:
+            spacegroup: :class:`AbinitSpaceGroup`. If None, the Abinit space group of the structure is used.
 
-    #def fourier_interp(self, new_mesh):
-        #intp_datar = self.mesh.fourier_interp(self.datar, new_mesh, inspace="r")
-        #return self.__class__(self.nspinor, self.nsppol, self.nspden, self.structure, intp_datar)
+        Return:
+            New object of the same class with the symmetrized data.
+        """
+        if spacegroup is None:
+            spacegroup = self.structure.abi_spacegroup
+            if spacegroup is None:
+                raise ValueError("Structure does not have Abinit symmetries. Use structure.spgset_abi_spacegroup")
+        if self.nspden == 4:
+            raise NotImplementedError("Symmetrization of non-collinear magnetization is not implemented")
+
+        # Time-reversal does not change the real-space part of the operation.
+        symmops = spacegroup.symmops(time_sign=+1)
+        space = "r" if self.mesh.is_symmetry_compatible(symmops) else "g"
+        irottable = self.mesh.get_irottable(symmops, space=space)
+
+        data = np.reshape(self.datar if space == "r" else self.datag, (self.nspden, -1))
+        if self.is_lazy:
+            symdata = _scratch_array(data.shape, data.dtype)
+            symdata[:] = 0
+        else:
+            symdata = np.zeros_like(data)
+
+        for isym, op in enumerate(symmops):
+            phases = None if space == "r" else self.mesh.get_tnons_phases(op)
+            for ispden in range(self.nspden):
+                jspden = ispden if (op.is_fm or self.nspden == 1) else self.nspden - 1 - ispden
+                if phases is None:
+                    symdata[ispden] += data[jspden, irottable[isym]]
+                else:
+                    symdata[ispden] += data[jspden, irottable[isym]] * phases
+        symdata /= len(symmops)
+
+        symdata = np.reshape(symdata, self.datar.shape)
+        if space == "g":
+            # The phases of the Nyquist components are ill-defined as n * tau is not integer: set them to zero.
+            for i, n in enumerate(self.mesh.shape):
+                if n % 2 == 0: symdata[(slice(None),) * (i + 1) + (n // 2,)] = 0
+            symdata = self.mesh.fft_g2r(symdata)
+            if self.is_real: symdata = symdata.real.copy()
+
+        return self.__class__(self.nspinor, self.nsppol, self.nspden, symdata, self.structure, iorder="c")
 
     #def braket_waves(self, bra_wave, ket_wave):
     #    """
@@ -406,14 +543,14 @@ class _Field(Has_Structure):
         nrows = len(nn_list)
         fig, axlist = plt.subplots(nrows=nrows, ncols=1, sharex=True, sharey=True, squeeze=True)
 
+        # Interpolate all the lines in one call.
         interpolator = self.get_interpolator()
+        lines = interpolator.eval_lines([(site.frac_coords, nn[0].frac_coords) for nn in nn_list], num=num)
 
-        for i, (nn, ax) in enumerate(zip(nn_list, axlist)):
+        for i, (nn, ax, r) in enumerate(zip(nn_list, axlist, lines)):
             nn_site, nn_dist, nn_sc_index  = nn
             title = "%s, %s, dist=%.3f A" % (nn_site.species_string, str(nn_site.frac_coords), nn_dist)
 
-            r = interpolator.eval_line(site.frac_coords, nn_site.frac_coords, num=num, kpoint=None)
-
             for ispden in range(self.nspden):
                 ax.plot(r.dist, r.values[ispden],
                         label=latexlabel_ispden(ispden, self.nspden) if i == 0 else None)
@@ -429,7 +566,7 @@ class _Field(Has_Structure):
 
         return fig
 
-    def integrate_in_spheres(self, rcut_symbol=None, out=False):
+    def integrate_in_spheres(self, rcut_symbol=None, out=False, method="gspace", gcut=None, chunk_size=2**16):
         """
         Integrate field (e.g. density/potential) inside atom-centered spheres of given radius.
         Can be used to get a rough estimate of the charge/magnetization associated to a given site.
@@ -437,60 +574,136 @@ class _Field(Has_Structure):
         Args:
             rcut_symbol: dictionary mapping chemical element to the radius of the sphere in Angstrom.
                 or number if each element should have the same sphere. If None, covalent radii are used.
+                A list of numbers can be used to perform a convergence study with respect to the radius:
+                the FFT and the phases are computed only once and the results for all the radii are returned.
             out: Set it to False to disable output of final results
+            method: "gspace" to integrate the Fourier components with the spherical Bessel integrals,
+                "rspace" to sum the values on the gridpoints inside the spheres. "rspace" only reads
+                the gridpoints around the atoms and does not require the FFT of the full array
+                (useful for memory-mapped fields, see `is_lazy`) but the sharp boundary of the sphere
+                is sampled with the gridpoints: the error decreases slowly with the density of the FFT mesh
+                and results differ from "gspace" (typically in the second decimal for the charge).
+            gcut: Only the G-vectors with |G| <= gcut (Ang-1) are included in the sum ("gspace").
+                None to use all the G-vectors of the FFT mesh.
+            chunk_size: Maximum number of (G-vector, atom) pairs treated at once ("gspace").
+                The number of G-vectors in a chunk is chunk_size // natom.
 
         Return
             pandas :class:`DataFrame` with computed results (integrated density, integrated magnetization, ...)
+            If rcut_symbol is a list, the DataFrame contains natom rows for each radius.
         """
-        # Initialize rcut_symbol map.
+        # Initialize the list of rcut_symbol maps.
         if rcut_symbol is None:
             from pymatgen.analysis.molecule_structure_comparator import CovalentRadius
-            rcut_symbol = {s: CovalentRadius.radius[s] for s in self.structure.symbol_set}
-            #rcut_symbol = {s: 2 for s in self.structure.symbol_set}
-            #rcut_symbol = {s: 1 for s in self.structure.symbol_set}
+            rcut_list = [{s: CovalentRadius.radius[s] for s in self.structure.symbol_set}]
         elif duck.is_number_like(rcut_symbol):
-            rcut_symbol = {s: float(rcut_symbol) for s in self.structure.symbol_set}
-
-        # Spline bessel integrals.
-        datag = np.reshape(self.datag, (self.nspden, -1))
-        #print("datag[0]", datag[0, 0] * self.structure.volume, datag.shape)
-        gvecs = self.mesh.gvecs
-        gmods = self.mesh.gmods
-        gmax = gmods.max()
-        from abipy.tools import bessel
-        splines = {s: bessel.spline_int_jlqr(0, gmax, rcut_symbol[s]) for s in self.structure.symbol_set}
-
-        # 4 pi sum_G n(G) e^{iGRo} int_0^{rcut} r**2 j_l(Gr} dr
-        rows = []
+            rcut_list = [{s: float(rcut_symbol) for s in self.structure.symbol_set}]
+        elif isinstance(rcut_symbol, collections.Mapping):
+            rcut_list = [rcut_symbol]
+        else:
+            rcut_list = [{s: float(rc) for s in self.structure.symbol_set} for rc in rcut_symbol]
+
+        # Group the sites by species.
+        natom, nrad = len(self.structure), len(rcut_list)
+        symbol_inds = OrderedDict()
         for iatom, site in enumerate(self.structure):
-            symbol = site.specie.symbol
-            phases = np.exp(2j * np.pi * np.dot(gvecs, site.frac_coords))
-            fg = datag * phases * splines[symbol](gmods)
-            res_nspden = np.sum(fg, axis=1)  * (4 * np.pi)
-            #print("result:", res_nspden, res_nspden.shape, (datag * fg).shape)
-
-            # Compute densities and magnetization.
-            ntot, nup, ndown, mx, my, mz = 6 * (None,)
-            if self.nspinor == 1:
-                res_nspden = res_nspden.real
-                if self.nspden == 1:
-                    ntot = res_nspden[0]
-                elif self.nspden == 2:
-                    nup, ndown = res_nspden
-                    ntot, mz = nup + ndown, nup - ndown
-
-            elif self.nspinor == 2:
-                raise NotImplementedError()
-                ntot, mx, my, mz = scalvec_from_spinmat(res_nspden)
-                nup, ndown = 0.5 * (ntot + mz), 0.5 * (ntot - mz)
+            symbol_inds.setdefault(site.specie.symbol, []).append(iatom)
+
+        # results[irad, ispden, iatom]
+        results = np.zeros((nrad, self.nspden, natom), dtype=np.complex)
+
+        if method == "gspace":
+            # 4 pi sum_G n(G) e^{iGRo} int_0^{rcut} r**2 j_l(Gr} dr
+            if self.is_real:
+                # Use the half-spectrum: sum_G = Re sum_{G in half} w_G (...)
+                # For the few G-vectors whose partner -G is stored with a -n/2 component in the full box,
+                # replace the contribution of -G with the one computed with the partner vector.
+                datag = np.reshape(self.datag_half, (self.nspden, -1))
+                inds, partners = self.mesh.get_half_partners()
+                gvecs, gmods = self.mesh.gvecs_half, self.mesh.gmods_half
+                pmods = np.sqrt(np.sum(np.dot(partners, 2 * np.pi * self.mesh.inv_vectors.T) ** 2, axis=1))
+                datag = np.concatenate((datag * self.mesh.get_half_weights(),
+                                        datag[:, inds].conj(), -datag[:, inds]), axis=1)
+                gvecs = np.concatenate((gvecs, partners, gvecs[inds]))
+                gmods = np.concatenate((gmods, pmods, gmods[inds]))
+            else:
+                datag = np.reshape(self.datag, (self.nspden, -1))
+                gvecs = self.mesh.gvecs
+                gmods = self.mesh.gmods
+            #print("datag[0]", datag[0, 0] * self.structure.volume, datag.shape)
+            if gcut is not None:
+                # Keep the G-vectors inside the support of the splines.
+                gsel = np.where(gmods <= gcut)[0]
+                datag, gvecs, gmods = datag[:, gsel], gvecs[gsel], gmods[gsel]
+
+            # Spline bessel integrals (one spline per radius).
+            gmax = gmods.max()
+            from abipy.tools import bessel
+            splines = {}
+            for rcut in rcut_list:
+                for rc in rcut.values():
+                    if rc not in splines: splines[rc] = bessel.spline_int_jlqr(0, gmax, rc)
+
+            frac_coords = self.structure.frac_coords
+            # The structure factors have shape [ng, natom] so the memory is bounded by chunk_size.
+            ng_chunk = max(1, chunk_size // natom)
+            for start in range(0, len(gmods), ng_chunk):
+                stop = start + ng_chunk
+                gmods_chunk = gmods[start:stop]
+                # Structure factors for all the sites: [ng, natom]
+                phases = np.exp(2j * np.pi * np.dot(gvecs[start:stop], frac_coords.T))
+                for symbol, inds in symbol_inds.items():
+                    jlg = np.array([splines[rcut[symbol]](gmods_chunk) for rcut in rcut_list])
+                    # [nrad * nspden, ng] x [ng, nat_symbol]
+                    fg = np.reshape(jlg[:, None, :] * datag[None, :, start:stop], (-1, len(gmods_chunk)))
+                    results[:, :, inds] += np.reshape(np.dot(fg, phases[:, inds]), (nrad, self.nspden, len(inds)))
+
+            results *= 4 * np.pi
+            if self.is_real: results = results.real
+
+        elif method == "rspace":
+            # sum_{r in sphere} f(r) dv. Only the gridpoints inside the largest sphere are read.
+            datar = np.reshape(self.datar, (self.nspden, -1))
+            for iatom, site in enumerate(self.structure):
+                rcs = np.array([rcut[site.specie.symbol] for rcut in rcut_list])
+                for igp_uc, dist, _ in self.mesh.iter_gridpoints_in_sphere(site.coords, rcs.max()):
+                    lin = np.ravel_multi_index(igp_uc.T, self.mesh.shape)
+                    for irad, rc in enumerate(rcs):
+                        results[irad, :, iatom] += datar[:, np.sort(lin[dist <= rc])].sum(axis=1)
+
+            results *= self.mesh.dv
 
-            # Fill DataFrame row.
-            rows.append(OrderedDict([
-                ("iatom", iatom), ("symbol", symbol),
-                ("ntot", ntot), ("nup", nup), ("ndown", ndown),
-                ("mx", mx), ("my", my), ("mz", mz),
-                ("rsph_ang", rcut_symbol[symbol]), ("frac_coords", site.frac_coords),
-            ]))
+        else:
+            raise ValueError("Wrong method: %s" % str(method))
+
+        rows = []
+        for irad, rcut in enumerate(rcut_list):
+            for iatom, site in enumerate(self.structure):
+                symbol = site.specie.symbol
+                res_nspden = results[irad, :, iatom]
+
+                # Compute densities and magnetization.
+                ntot, nup, ndown, mx, my, mz = 6 * (None,)
+                if self.nspinor == 1:
+                    res_nspden = res_nspden.real
+                    if self.nspden == 1:
+                        ntot = res_nspden[0]
+                    elif self.nspden == 2:
+                        nup, ndown = res_nspden
+                        ntot, mz = nup + ndown, nup - ndown
+
+                elif self.nspinor == 2:
+                    raise NotImplementedError()
+                    ntot, mx, my, mz = scalvec_from_spinmat(res_nspden)
+                    nup, ndown = 0.5 * (ntot + mz), 0.5 * (ntot - mz)
+
+                # Fill DataFrame row.
+                rows.append(OrderedDict([
+                    ("iatom", iatom), ("symbol", symbol),
+                    ("ntot", ntot), ("nup", nup), ("ndown", ndown),
+                    ("mx", mx), ("my", my), ("mz", mz),
+                    ("rsph_ang", rcut[symbol]), ("frac_coords", site.frac_coords),
+                ]))
 
         import pandas as pd
         df = pd.DataFrame(rows, columns=list(rows[0].keys()))
@@ -505,6 +718,18 @@ class _Field(Has_Structure):
         return df
 
 
+def _read_rhoc_spline(fname):
+    """
+    Read the radial core density from the *rhoc* file `fname` and return the spline.
+    The file contains the radii in Bohr and the density in #/Bohr^3 multiplied by 4pi.
+    """
+    rad_rho = np.fromfile(fname, sep=' ')
+    rad_rho = rad_rho.reshape((len(rad_rho) // 2, 2))
+    radii = rad_rho[:, 0] * pmgu.bohr_to_angstrom
+    rho = rad_rho[:, 1] / (4.0*np.pi) / (pmgu.bohr_to_angstrom ** 3)
+    return Function1D(radii, rho).spline
+
+
 class _DensityField(_Field):
     """Base class for density-like fields."""
 
@@ -522,23 +747,32 @@ class Density(_DensityField):
 
     @classmethod
     def ae_core_density_on_mesh(cls, valence_density, structure, rhoc_files, maxr=2.0, nelec=None,
-                                method='mesh3d_dist_gridpoints', small_dist_mesh=(8, 8, 8), small_dist_factor=1.5):
+                                method='mesh3d_dist_gridpoints', small_dist_mesh=(8, 8, 8), small_dist_factor=1.5,
+                                dtype=np.float, chunk_size=2**20):
         """
         Initialize the all electron core density of the structure from the pseudopotentials *rhoc* files
         Note that these *rhoc* files contain one column with the radii in Bohrs and one column with the density
         in #/Bohr^3 multiplied by a factor 4pi.
+
+        Args:
+            valence_density: :class:`Density` defining the FFT mesh.
+            structure: Structure object.
+            rhoc_files: List with the rhoc files for each site or dictionary {symbol: rhoc_file}.
+            maxr: Radius of the spheres in Angstrom.
+            nelec: If not None, the density is renormalized so that it integrates to `nelec`.
+            method: "mesh3d_dist_gridpoints" (default, vectorized) or "get_sites_in_sphere" (slow reference implementation).
+            small_dist_mesh: Number of divisions of the supersampling mesh used for the points close to the nuclei.
+            small_dist_factor: Points whose distance from the nucleus is smaller than small_dist_factor times
+                the diagonal of the volume element are averaged over the supersampling mesh.
+            dtype: Floating point type used to compute distances and to accumulate the density (np.float32 saves memory).
+            chunk_size: Maximum number of gridpoints treated at once (method="mesh3d_dist_gridpoints").
         """
         rhoc_atom_splines = [None]*len(structure)
         if isinstance(rhoc_files, (list, tuple)):
             if len(structure) != len(rhoc_files):
                 raise ValueError('Number of rhoc_files should be equal to the number of sites in the structure')
-            for ifname, fname in rhoc_files:
-                rad_rho = np.fromfile(fname, sep=' ')
-                rad_rho = rad_rho.reshape((len(rad_rho)/2, 2))
-                radii = rad_rho[:, 0] * pmgu.bohr_to_angstrom
-                rho = rad_rho[:, 1] / (4.0*np.pi) / (pmgu.bohr_to_angstrom ** 3)
-                func1d = Function1D(radii, rho)
-                rhoc_atom_splines[ifname] = func1d.spline
+            for ifname, fname in enumerate(rhoc_files):
+                rhoc_atom_splines[ifname] = _read_rhoc_spline(fname)
 
         elif isinstance(rhoc_files, collections.Mapping):
             atoms_symbols = [elmt.symbol for elmt in structure.composition]
@@ -546,83 +780,68 @@ class Density(_DensityField):
                 raise ValueError('The rhoc_files should be provided for all the atoms in the structure')
             splines = {}
             for symbol, fname in rhoc_files.items():
-                rad_rho = np.fromfile(fname, sep=' ')
-                rad_rho = rad_rho.reshape((len(rad_rho)/2, 2))
-                radii = rad_rho[:, 0] * pmgu.bohr_to_angstrom
-                rho = rad_rho[:, 1] / (4.0*np.pi) / (pmgu.bohr_to_angstrom ** 3)
-                func1d = Function1D(radii, rho)
-                splines[symbol] = func1d.spline
+                splines[symbol] = _read_rhoc_spline(fname)
             for isite, site in enumerate(structure):
                 rhoc_atom_splines[isite] = splines[site.specie.symbol]
 
-        core_den = np.zeros_like(valence_density.datar)
-        dvx = valence_density.mesh.dvx
-        dvy = valence_density.mesh.dvy
-        dvz = valence_density.mesh.dvz
+        mesh = valence_density.mesh
+        core_den = np.zeros(valence_density.datar.shape, dtype=dtype)
+        dvx = mesh.dvx
+        dvy = mesh.dvy
+        dvz = mesh.dvz
         maxdiag = max([np.linalg.norm(dvx+dvy+dvz),
                        np.linalg.norm(dvx+dvy-dvz),
                        np.linalg.norm(dvx-dvy+dvz),
                        np.linalg.norm(dvx-dvy-dvz)])
         smallradius = small_dist_factor*maxdiag
 
+        # Supersampling stencil: cartesian offsets of the points of the small mesh
+        # with respect to the gridpoint. Used to average the density in the volume element around the gridpoint
+        # as the core density is extremely high close to the atom
+        nnx, nny, nnz = small_dist_mesh
+        stencil = (((np.arange(nnx) + 0.5) / nnx - 0.5)[:, None, None, None] * dvx +
+                   ((np.arange(nny) + 0.5) / nny - 0.5)[None, :, None, None] * dvy +
+                   ((np.arange(nnz) + 0.5) / nnz - 0.5)[None, None, :, None] * dvz).reshape(-1, 3).astype(dtype)
+
         if method == 'get_sites_in_sphere':
-            for ix in range(valence_density.mesh.nx):
-                for iy in range(valence_density.mesh.ny):
-                    for iz in range(valence_density.mesh.nz):
-                        rpoint = valence_density.mesh.rpoint(ix=ix, iy=iy, iz=iz)
-                        # TODO: optimize this !
+            for ix in range(mesh.nx):
+                for iy in range(mesh.ny):
+                    for iz in range(mesh.nz):
+                        rpoint = mesh.rpoint(ix=ix, iy=iy, iz=iz)
                         sites = structure.get_sites_in_sphere(pt=rpoint, r=maxr, include_index=True)
                         for site, dist, site_index in sites:
                             if dist > smallradius:
                                 core_den[0, ix, iy, iz] += rhoc_atom_splines[site_index](dist)
-                            # For small distances, integrate over the small volume dv around the point as the core
-                            # density is extremely high close to the atom
                             else:
-                                total = 0.0
-                                nnx, nny, nnz = small_dist_mesh
-                                ddvx = dvx/nnx
-                                ddvy = dvy/nny
-                                ddvz = dvz/nnz
-                                rpi = rpoint - 0.5 * (dvx + dvy + dvz) + 0.5*ddvx + 0.5*ddvy + 0.5*ddvz
-                                for iix in range(nnx):
-                                    for iiy in range(nny):
-                                        for iiz in range(nnz):
-                                            rpoint2 = rpi + iix*ddvx + iiy*ddvy + iiz*ddvz
-                                            dist2 = np.linalg.norm(rpoint2 - site.coords)
-                                            total += rhoc_atom_splines[site_index](dist2)
-                                total /= (nnx*nny*nnz)
-                                core_den[0, ix, iy, iz] += total
+                                dists = np.linalg.norm(rpoint - site.coords + stencil, axis=1)
+                                core_den[0, ix, iy, iz] += np.mean(rhoc_atom_splines[site_index](dists))
 
         elif method == 'mesh3d_dist_gridpoints':
-            site_coords = [site.coords for site in structure]
-            dist_gridpoints_sites = valence_density.mesh.dist_gridpoints_in_spheres(points=site_coords, radius=maxr)
-            for isite, dist_gridpoints_site in enumerate(dist_gridpoints_sites):
-                for igp_uc, dist, igp in dist_gridpoints_site:
-                    if dist > smallradius:
-                        core_den[0, igp_uc[0], igp_uc[1], igp_uc[2]] += rhoc_atom_splines[isite](dist)
-                    # For small distances, integrate over the small volume dv around the point as the core density
-                    # is extremely high close to the atom
-                    else:
-                        total = 0.0
-                        nnx, nny, nnz = small_dist_mesh
-                        ddvx = dvx/nnx
-                        ddvy = dvy/nny
-                        ddvz = dvz/nnz
-                        rpoint = valence_density.mesh.rpoint(ix=igp[0], iy=igp[1], iz=igp[2])
-                        rpi = rpoint - 0.5 * (dvx + dvy + dvz) + 0.5*ddvx + 0.5*ddvy + 0.5*ddvz
-                        for iix in range(nnx):
-                            for iiy in range(nny):
-                                for iiz in range(nnz):
-                                    rpoint2 = rpi + iix*ddvx + iiy*ddvy + iiz*ddvz
-                                    dist2 = np.linalg.norm(rpoint2 - site_coords[isite])
-                                    total += rhoc_atom_splines[isite](dist2)
-                        total /= (nnx*nny*nnz)
-                        core_den[0, igp_uc[0], igp_uc[1], igp_uc[2]] += total
+            core_flat = core_den[0].reshape(-1)
+            rvecs = np.array([dvx, dvy, dvz], dtype=dtype)
+            for isite, site in enumerate(structure):
+                spline = rhoc_atom_splines[isite]
+                for igp_uc, dist, igp in mesh.iter_gridpoints_in_sphere(site.coords, maxr,
+                                                                         chunk_size=chunk_size, dtype=dtype):
+                    vals = np.empty(len(dist), dtype=dtype)
+                    far = dist > smallradius
+                    # Evaluate the spline for all the points of the block in one call.
+                    vals[far] = spline(dist[far])
+                    near = ~far
+                    if np.any(near):
+                        rdiff = np.matmul(igp[near].astype(dtype), rvecs) - site.coords.astype(dtype)
+                        dists = np.sqrt(np.sum((rdiff[:, None, :] + stencil[None]) ** 2, axis=-1))
+                        vals[near] = spline(dists.ravel()).reshape(dists.shape).mean(axis=1)
+
+                    # Periodic images may give several contributions to the same gridpoint (unbuffered add).
+                    # core_flat is a view of core_den.
+                    np.add.at(core_flat, np.ravel_multi_index(igp_uc.T, mesh.shape), vals)
+
         else:
             raise ValueError('Method "{}" is not allowed'.format(method))
 
         if nelec is not None:
-            sum_elec = np.sum(core_den) * valence_density.mesh.dv
+            sum_elec = np.sum(core_den) * mesh.dv
             if np.abs(sum_elec-nelec) / nelec > 0.01:
                 raise ValueError('Summed electrons is different from the actual number of electrons by '
                                  'more than 1% ...')
@@ -763,6 +982,7 @@ class Density(_DensityField):
     def export_to_cube(self, filename, spin='total'):
         """
         Export real space density to CUBE file `filename`.
+        The data is formatted in slabs so that memory-mapped densities can be exported as well.
         """
         if spin != 'total':
             raise ValueError('Argument "spin" should be "total"')
@@ -772,14 +992,20 @@ class Density(_DensityField):
             cube.cube_write_data(file=fh, data=self.total_rhor, mesh=self.mesh)
 
     @classmethod
-    def from_cube(cls, filename, spin='total'):
+    def from_cube(cls, filename, spin='total', out=None):
         """
         Read real space density to CUBE file `filename`. Return new `Density` instance.
+
+        Args:
+            filename: Path of the CUBE file.
+            spin: Only "total" is supported.
+            out: Optional C-contiguous array of shape [nx, ny, nz] (e.g. `np.memmap`) used to store the density.
+                Useful for files that do not fit in memory.
         """
         if spin != 'total':
             raise ValueError('Argument "spin" should be "total"')
 
-        structure, mesh, datar = cube.cube_read_structure_mesh_data(file=filename)
+        structure, mesh, datar = cube.cube_read_structure_mesh_data(file=filename, out=out)
         return cls(nspinor=1, nsppol=1, nspden=1, datar=datar, structure=structure, iorder="c")
 
     #@lazy_property
@@ -934,13 +1160,23 @@ class FieldReader(ETSF_Reader):
         """Read potential data. Return :class:`VksPotential` object."""
         return self.read_denpot(varname=field_cls.netcdf_name, field_cls=field_cls)
 
-    def read_denpot(self, varname, field_cls):
+    def read_denpot(self, varname, field_cls, lazy=False, workdir=None, chunk_size=2**24):
         """
         Factory function to read den/pot data from netcdf files and instantiate _Field objects.
         Note that unlike Abinit, datar[nspden] contains the up/down components if nsppol = 2
+
+        Args:
+            varname: Name of the netcdf variable.
+            field_cls: :class:`_Field` subclass.
+            lazy: If True, the data is copied slab by slab in a memory-mapped scratch file so that
+                the full array is never loaded in memory. The field then operates out of core.
+            workdir: Directory used for the scratch file when `lazy`. None for the default temporary directory.
+            chunk_size: Approximate number of gridpoints read at once when `lazy`.
         """
         structure = self.read_structure()
         dims = self.read_den_dims()
+        if lazy:
+            return self._read_denpot_lazy(varname, field_cls, structure, dims, workdir, chunk_size)
 
         # Abinit conventions:
         # rhor(nfft, nspden) = electron density in real-space.
@@ -1002,3 +1238,35 @@ class FieldReader(ETSF_Reader):
             return field_cls(dims.nspinor, dims.nsppol, dims.nspden, datar, structure, iorder="f")
         else:
             raise NotImplementedError("cplex %s not coded" % cplex)
+
+    def _read_denpot_lazy(self, varname, field_cls, structure, dims, workdir, chunk_size):
+        """
+        Read den/pot data in slabs of z-planes and store the results in a memory-mapped scratch array
+        in C-order. Same conventions and units as `read_denpot`.
+        """
+        var = self.read_variable(varname)
+        cplex = var.shape[-1]
+        if cplex != 1:
+            raise NotImplementedError("cplex %s not coded" % cplex)
+        if dims.nspinor != 1 or dims.nspden not in (1, 2):
+            raise NotImplementedError("nspinor: %s, nspden: %s" % (dims.nspinor, dims.nspden))
+
+        if issubclass(field_cls, _DensityField):
+            fact = 1 / pmgu.bohr_to_angstrom ** 3
+        if issubclass(field_cls, _PotentialField):
+            fact = pmgu.Ha_to_eV / pmgu.bohr_to_angstrom ** 3
+
+        nx, ny, nz = dims.nfft1, dims.nfft2, dims.nfft3
+        datar = _scratch_array((dims.nspden, nx, ny, nz), np.float, workdir=workdir)
+        nplanes = max(1, chunk_size // (dims.nspden * nx * ny))
+
+        for start in range(0, nz, nplanes):
+            # Netcdf stores data in Fortran order: (nspden, z, y, x)
+            slab = np.asarray(var[:, start:start + nplanes, :, :, 0]) * fact
+            if dims.nspden == 2 and issubclass(field_cls, _DensityField):
+                # If Density: store rho_up, rho_down instead of rho_total, rho_up.
+                slab = np.array([slab[1], slab[0] - slab[1]])
+            datar[:, :, :, start:start + nplanes] = slab.transpose(0, 3, 2, 1)
+
+        datar.flush()
+        return field_cls(dims.nspinor, dims.nsppol, dims.nspden, datar, structure, iorder="c")
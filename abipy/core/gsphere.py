@@ -5,6 +5,8 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 import collections
 import numpy as np
 
+from monty.collections import dict2namedtuple
+from monty.functools import lazy_property
 from .kpoints import Kpoint
 from abipy.tools import duck
 
@@ -34,8 +36,12 @@ class GSphere(collections.Sequence):
         self.npw = self.gvecs.shape[0]
 
         self.istwfk = istwfk
-        if istwfk != 1:
-            raise NotImplementedError("istwfk %d is not implemented" % self.istwfk)
+        if istwfk not in range(1, 10):
+            raise ValueError("Invalid value for istwfk: %s" % str(istwfk))
+
+        # Cache with the index tables used to transfer data between the sphere and the FFT box.
+        # Indexed by the shape of the FFT mesh.
+        self._fft_tables = {}
 
     @property
     def gvecs(self):
@@ -60,23 +66,87 @@ class GSphere(collections.Sequence):
         return self.gvecs.__iter__()
 
     def __contains__(self, gvec):
-        return np.asarray(gvec) in self.gvecs
+        return self.indices(gvec, strict=False)[0] != -1
 
     def index(self, gvec):
         """
         return the index of the G-vector gvec in self.
         Raises ValueError if the value is not present.
         """
-        gvec = np.asarray(gvec)
-        for i, g in enumerate(self):
-            if np.all(g == gvec):
-                return i
+        return int(self.indices(gvec)[0])
+
+    def indices(self, gvecs, strict=True):
+        """
+        Return the indices of the G-vectors in self. The lookup is performed with the dense
+        index table built once for the box enclosing the sphere (see `box_index`).
+
+        Args:
+            gvecs: G-vector or array with shape [n, 3] with the reduced coordinates of the G-vectors.
+            strict: If True, raise ValueError if one of the G-vectors is not present
+                else -1 is returned for the missing G-vectors.
+
+        Returns:
+            Integer array with shape [n].
+        """
+        gvecs = np.reshape(gvecs, (-1, 3))
+        igvecs = np.array(np.rint(gvecs), dtype=np.int)
+        gmin, dims, table = self.box_index
+        igvecs -= gmin
+        inside = np.all(igvecs == gvecs - gmin, axis=1) & np.all((igvecs >= 0) & (igvecs < dims), axis=1)
+
+        inds = np.full(len(igvecs), -1, dtype=np.int)
+        inds[inside] = table[np.ravel_multi_index(igvecs[inside].T, dims)]
+
+        if strict and np.any(inds == -1):
+            raise ValueError("Cannot find %s in Gsphere" % str(gvecs[inds == -1][0]))
+
+        return inds
+
+    @lazy_property
+    def box_index(self):
+        """
+        (gmin, dims, table) where table is an integer array with the index of G - gmin in the sphere
+        (-1 if the point is not in the sphere) in the (C-ordered) box with dimensions `dims` enclosing the sphere.
+        """
+        if self.npw == 0:
+            gmin, gmax = np.zeros(3, dtype=np.int), np.zeros(3, dtype=np.int)
         else:
-            raise ValueError("Cannot find %s in Gsphere" % str(gvec))
+            gmin, gmax = self.gvecs.min(axis=0), self.gvecs.max(axis=0)
+        dims = gmax - gmin + 1
+        table = np.full(np.prod(dims), -1, dtype=np.int)
+        # Reversed order so that the index of the first occurrence is stored.
+        table[np.ravel_multi_index((self.gvecs - gmin).T, dims)[::-1]] = np.arange(self.npw)[::-1]
+        return gmin, dims, table
 
     def count(self, gvec):
         """Return number of occurrences of gvec."""
-        return np.count_nonzero(np.all(g == gvec) for g in self)
+        return np.count_nonzero(np.all(self.gvecs == np.asarray(gvec), axis=1))
+
+    @lazy_property
+    def kpg_norms(self):
+        """ndarray with the norm of k+G (units of the reciprocal lattice)."""
+        matrix = getattr(self.lattice, "matrix", self.lattice)
+        kpg = np.dot(self.gvecs + self.kpoint.frac_coords, matrix)
+        return np.sqrt(np.sum(kpg ** 2, axis=1))
+
+    def get_shells(self, atol=1e-6):
+        """
+        Group the G-vectors in shells with the same |k+G|.
+
+        Args:
+            atol: Absolute tolerance used to compare the norms.
+
+        Returns:
+            namedtuple with `norms` (array with |k+G| for each shell, in increasing order)
+            and `shells` (list of integer arrays with the indices of the G-vectors in each shell).
+        """
+        norms = self.kpg_norms
+        order = np.argsort(norms, kind="mergesort")
+        sorted_norms = norms[order]
+        starts = np.where(np.diff(sorted_norms) > atol)[0] + 1
+
+        return dict2namedtuple(norms=sorted_norms[np.concatenate(([0], starts))] if len(order) else sorted_norms,
+                               shells=np.split(order, starts))
 
     def __str__(self):
         return self.to_string()
@@ -145,114 +215,159 @@ class GSphere(collections.Sequence):
         """Returns New uninitialized 1D complex array."""
         return self._new_array(dtype=np.complex, zero=False, extra_dims=extra_dims)
 
+    def get_g0(self):
+        """
+        Return the reciprocal lattice vector G0 = 2 k associated to the storage option istwfk.
+        If istwfk != 1, only half of the sphere is stored and u(-G-G0) = u(G)^* (see sphere.F90 in Abinit).
+        Abinit convention: istwfk - 2 = 4 * G0_y + 2 * G0_z + G0_x, e.g. istwfk 4 --> k = (0, 0, 1/2).
+        Returns zero vector if istwfk == 1.
+        """
+        if self.istwfk == 1:
+            return np.zeros(3, dtype=np.int)
+        j = self.istwfk - 2
+        return np.array([(j >> 0) & 1, (j >> 2) & 1, (j >> 1) & 1], dtype=np.int)
+
+    def inverse_gvecs(self):
+        """
+        Return the G-vectors -G-G0 whose coefficients are reconstructed with time-reversal symmetry
+        (see :meth:`get_g0`). Same order as gvecs.
+        """
+        return -self.gvecs - self.get_g0()
+
+    def to_full_sphere(self, ug=None):
+        """
+        Return (gsphere, ug) on the full G-sphere (istwfk == 1). If istwfk != 1, only half of the sphere
+        is stored and the coefficients u(-G-G0) = u(G)^* are reconstructed with time-reversal symmetry.
+        The G-vectors of the new sphere are the G-vectors of self followed by the vectors -G-G0 that
+        are not mapped onto themselves (e.g. G=0 if istwfk == 2).
+
+        Args:
+            ug: Array with shape [..., npw]. None if only the G-sphere is wanted.
+        """
+        if self.istwfk == 1:
+            return self, ug
+
+        inv_gvecs = self.inverse_gvecs()
+        mask = np.any(inv_gvecs != self.gvecs, axis=1)
+        gsphere = self.__class__(self.ecut, self.lattice, self.kpoint, np.concatenate((self.gvecs, inv_gvecs[mask])),
+                                 istwfk=1)
+        if ug is None: return gsphere, None
+        return gsphere, np.concatenate((ug, ug[..., mask].conj()), axis=-1)
+
     #def build_fftbox(self, boxsph_ratio=1.05):
     #  """Returns the number of divisions of the FFT box enclosing the sphere."""
     #  #return ndivs
 
+    def get_fft_tables(self, mesh):
+        """
+        Return the tables used to transfer data between the sphere and the FFT box of `mesh`.
+        The tables are computed once and cached for each shape of the FFT mesh.
+
+        Returns:
+            (ifft, ifft_inv) where ifft is the array with the linear index of the G-vectors
+            in the (C-ordered) FFT box. ifft_inv is None if istwfk == 1 else it gives the linear
+            index of the points -G - G0 that are reconstructed with time-reversal symmetry.
+        """
+        shape = tuple(mesh.shape)
+        if shape in self._fft_tables:
+            return self._fft_tables[shape]
+
+        ndivs = np.array(shape, dtype=np.int)
+        gvecs = self.gvecs
+        if np.any(gvecs >= ndivs) or np.any(gvecs < -ndivs):
+            raise ValueError("FFT mesh %s is too small for G-sphere with gmin %s, gmax %s" % (
+                str(shape), str(gvecs.min(axis=0)), str(gvecs.max(axis=0))))
+
+        # Fortran version:
+        #  i1=kg_k(1,ipw); if(i1<0)i1=i1+n1; i1=i1+1
+        ifft = np.ravel_multi_index((gvecs % ndivs).T, shape)
+
+        ifft_inv = None
+        if self.istwfk != 1:
+            # u(-G-G0) = u(G)^* (see sphere.F90 in Abinit)
+            ifft_inv = np.ravel_multi_index((self.inverse_gvecs() % ndivs).T, shape)
+
+        self._fft_tables[shape] = (ifft, ifft_inv)
+        return ifft, ifft_inv
+
     def tofftmesh(self, mesh, arr_on_sphere):
         """
         Insert the array arr_on_sphere given on the sphere inside the FFT mesh.
 
         Args:
-            mesh:
-            arr_on_sphere:
+            mesh: :class:`Mesh3D` object.
+            arr_on_sphere: Array with shape [..., npw]. Extra dimensions (e.g. bands, spinors)
+                are treated in a single call.
+
+        Returns:
+            Array with shape [..., nx, ny, nz]. If arr_on_sphere has shape [1, npw], the first dimension is removed.
         """
         arr_on_sphere = np.atleast_2d(arr_on_sphere)
         ishape = arr_on_sphere.shape
-        s0 = ishape[0]
         assert self.npw == ishape[-1]
 
-        arr_on_mesh = np.zeros((s0,) + mesh.shape, dtype=arr_on_sphere.dtype)
+        ifft, ifft_inv = self.get_fft_tables(mesh)
+        arr_on_mesh = np.zeros(ishape[:-1] + (mesh.size,), dtype=arr_on_sphere.dtype)
 
-        if self.istwfk == 1:
-            #do ipw=1,npw
-            #  i1=kg_k(1,ipw); if(i1<0)i1=i1+n1; i1=i1+1
-            #  i2=kg_k(2,ipw); if(i2<0)i2=i2+n2; i2=i2+1
-            #  i3=kg_k(3,ipw); if(i3<0)i3=i3+n3; i3=i3+1
-            #end do
-
-            n1, n2, n3 = mesh.shape
-            for sph_idx, gvec in enumerate(self.gvecs):
-                i1 = gvec[0]
-                if i1 < 0: i1 = i1 + n1
-                i2 = gvec[1]
-                if i2 < 0: i2 = i2 + n2
-                i3 = gvec[2]
-                if i3 < 0: i3 = i3 + n3
-                arr_on_mesh[..., i1, i2, i3] = arr_on_sphere[..., sph_idx]
-
-        else:
-            raise NotImplementedError("istwfk = %s not implemented" % self.istwfk)
+        if ifft_inv is not None:
+            # Reconstruct the other half of the box with time-reversal before inserting the
+            # G-vectors so that the points that are mapped onto themselves (e.g. G=0 if istwfk == 2) are not conjugated.
+            arr_on_mesh[..., ifft_inv] = arr_on_sphere.conj()
+        arr_on_mesh[..., ifft] = arr_on_sphere
 
-        if s0 == 1:
+        if ishape[0] == 1 and len(ishape) == 2:
             # Reinstate input shape
-            arr_on_mesh.shape = mesh.shape
+            return np.reshape(arr_on_mesh, mesh.shape)
 
-        return arr_on_mesh
+        return np.reshape(arr_on_mesh, ishape[:-1] + tuple(mesh.shape))
 
     def fromfftmesh(self, mesh, arr_on_mesh):
         """
         Transfer arr_on_mesh given on the FFT mesh to the G-sphere.
-        """
-        indim =  arr_on_mesh.ndim
-        arr_on_mesh = mesh.reshape(arr_on_mesh)
-        ishape = arr_on_mesh.shape
-        s0 = ishape[0]
 
-        arr_on_sphere = np.empty((s0,) + (self.npw,), dtype=arr_on_mesh.dtype)
+        Args:
+            mesh: :class:`Mesh3D` object.
+            arr_on_mesh: Array with shape [..., nx, ny, nz] or flat array with mesh.size elements.
 
-        if self.istwfk == 1:
-            #do ig=1,npwout
-            #  i1=kg_kout(1,ig); if (i1<0) i1=i1+n1; i1=i1+1
-            #  i2=kg_kout(2,ig); if (i2<0) i2=i2+n2; i2=i2+1
-            #  i3=kg_kout(3,ig); if (i3<0) i3=i3+n3; i3=i3+1
-            #end do
-            n1, n2, n3 = mesh.shape
-
-            for sph_idx, gvec in enumerate(self.gvecs):
-                i1 = gvec[0]
-                if i1 < 0: i1 = i1 + n1
-                i2 = gvec[1]
-                if i2 < 0: i2 = i2 + n2
-                i3 = gvec[2]
-                if i3 < 0: i3 = i3 + n3
-                arr_on_sphere[..., sph_idx] = arr_on_mesh[..., i1, i2, i3]
+        Returns:
+            Array with shape [..., npw] (at least two dimensions unless arr_on_mesh is one-dimensional).
+        """
+        indim = arr_on_mesh.ndim
+        ifft, _ = self.get_fft_tables(mesh)
 
+        if indim > 4:
+            extra_dims = arr_on_mesh.shape[:-3]
         else:
-            raise NotImplementedError("istwfk %s is not implemented" % self.istwfk)
+            arr_on_mesh = mesh.reshape(arr_on_mesh)
+            extra_dims = arr_on_mesh.shape[:1]
 
-        if s0 == 1 and indim == 1:
+        arr_on_sphere = np.take(np.reshape(arr_on_mesh, extra_dims + (-1,)), ifft, axis=-1)
+
+        if indim == 1 and arr_on_sphere.shape[0] == 1:
             # Reinstate input shape
             arr_on_sphere.shape = self.npw
 
         return arr_on_sphere
 
-    #def rotate(self, symmop):
-    #    """
-    #    Returns a new `GSphere` centered on Sk.
-
-    #    Args:
-    #        symmop: Symmetry operation object.
-    #    """
-    #    # The problem in this approach is that G-spheres centered on the
-    #    # same k-point might have G-vectors ordered in a different way
-    #    # and therefore one cannot operate on two wavefunctions in reciprocal space
-    #    # on the G-sphere without checking first that gvecs1 == gvecs2.
-    #    # The best solution is to compute the list of g-vectors with a deterministic
-    #    # algorithm, similar to the one used in Abinit and then create tables
-    #    # defining the mapping btw the two sets
-    #    if self.istwfk != 1:
-    #        raise ValueError("istwfk %d not coded" % self.istwfk)
-
-    #    # Rotate the k-point and the G-vectors
-    #    rot_kpt = symmop.rotate_k(self.kpoint.frac_coords, wrap_tows=False)
-    #    rot_gvecs = symmop.rotate_gvecs(self.gvecs)
-
-    #    #rot_istwfk = istwfk(rot_kpt)
-    #    rot_istwfk = self.istwfk
-
-    #    new = self.__class__(self.ecut, self.lattice, rot_kpt, rot_gvecs, istwfk=rot_istwfk)
-    #    return new
+    def rotate(self, symmop):
+        """
+        Returns a new `GSphere` centered on Sk. The i-th G-vector of the new sphere is S(G_i)
+        i.e. the G-vectors are not reordered.
+        If istwfk != 1, the full sphere (see :meth:`to_full_sphere`) is rotated and the new sphere has istwfk == 1.
+
+        Args:
+            symmop: :class:`SymmOp` object.
+        """
+        # Note that G-spheres centered on the same k-point might have G-vectors ordered in a different way
+        # hence one should use the FFT box (see tofftmesh) to operate on wavefunctions with different spheres.
+        if self.istwfk != 1:
+            return self.to_full_sphere()[0].rotate(symmop)
+
+        # Rotate the k-point and the G-vectors
+        rot_kpt = symmop.rotate_k(self.kpoint.frac_coords, wrap_tows=False)
+        rot_gvecs = symmop.rotate_gvecs(self.gvecs)
+
+        return self.__class__(self.ecut, self.lattice, rot_kpt, rot_gvecs, istwfk=self.istwfk)
 
 
 #def kpg_sphere(lattice, kcoords, ecut):
@@ -28,6 +28,7 @@ logger = logging.getLogger(__name__)
 
 __all__ = [
     "issamek",
+    "issamek_many",
     "wrap_to_ws",
     "wrap_to_bz",
     "as_kpoints",
@@ -110,6 +111,130 @@ def issamek(k1, k2, atol=None):
     return is_integer(k1 - k2, atol=atol)
 
 
+def issamek_many(k1s, k2s, atol=None):
+    """
+    Vectorized version of `issamek`. Compare the k-points in `k1s` with the ones in `k2s`
+    (arrays of shape [..., 3], broadcasting rules apply) and return a boolean array.
+    Use _ATOL_KDIFF is atol is None.
+    """
+    if atol is None: atol = _ATOL_KDIFF
+    diff = np.asarray(k1s) - np.asarray(k2s)
+    int_diff = np.around(diff)
+    # Same criterion as np.allclose(int_diff, diff, atol=atol) used in is_integer.
+    return np.all(np.abs(int_diff - diff) <= atol + 1e-5 * np.abs(diff), axis=-1)
+
+
+class KpointHashIndex(object):
+    """
+    Hash table used to find k-points in a list of reduced coordinates.
+    Two points are considered equal with the same criterion used by `issamek` with tolerance `atol`.
+
+    The coordinates are wrapped to [0, 1[ and assigned to a grid of `nb` bins per direction.
+    A query is compared only with the points in the bins that are compatible with the tolerance
+    hence the cost of a lookup does not depend on the number of points.
+    """
+
+    def __init__(self, frac_coords, atol=None):
+        """
+        Args:
+            frac_coords: [nk, 3] array with the reduced coordinates of the points.
+            atol: Absolute tolerance. Use _ATOL_KDIFF if None.
+        """
+        self.atol = _ATOL_KDIFF if atol is None else atol
+        self.frac_coords = np.reshape(frac_coords, (-1, 3))
+        self.nk = len(self.frac_coords)
+        self.kmax = np.abs(self.frac_coords).max() if self.nk else 0.0
+
+        # Choose the size of the bins so that a point can belong to at most two bins along each direction.
+        tol = self.atol + 1e-5 * (2 * self.kmax + 1)
+        self.nb = int(max(1, min(2**20, 0.25 / tol)))
+
+        keys = self._keys(np.floor((self.frac_coords % 1) * self.nb).astype(np.int64))
+        self.iperm = np.argsort(keys, kind="mergesort")
+        self.sorted_keys = keys[self.iperm]
+        self.maxocc = np.unique(self.sorted_keys, return_counts=True)[1].max() if self.nk else 0
+
+    def _keys(self, bins):
+        """Integer key associated to the bin indices [n, 3]."""
+        bins = bins % self.nb
+        return (bins[:, 0] * self.nb + bins[:, 1]) * self.nb + bins[:, 2]
+
+    def find_many(self, frac_coords):
+        """
+        Find the points in `frac_coords`.
+
+        Return:
+            [nq] array with the index of the first point equal to the query (modulo G). -1 if not found.
+        """
+        qs = np.reshape(frac_coords, (-1, 3))
+        nq = len(qs)
+        found = -np.ones(nq, dtype=np.int)
+        if self.nk == 0 or nq == 0: return found
+
+        # Tolerance for each query (includes the relative part of issamek).
+        tol = (self.atol + 1e-5 * (np.abs(qs).max(axis=1) + self.kmax + 1))[:, None] * self.nb
+        u = (qs % 1) * self.nb
+        lo = np.floor(u - tol).astype(np.int64)
+        hi = np.floor(u + tol).astype(np.int64)
+
+        # Use brute force for the (unlikely) queries whose tolerance covers more than two bins.
+        brute = np.any(hi - lo > 1, axis=1)
+        for iq in np.nonzero(brute)[0]:
+            inds = np.nonzero(issamek_many(self.frac_coords, qs[iq], atol=self.atol))[0]
+            if len(inds): found[iq] = inds[0]
+
+        for off in product(range(2), repeat=3):
+            bins = lo + off
+            valid = ~brute & np.all(bins <= hi, axis=1)
+            if not np.any(valid): continue
+            keys = self._keys(bins)
+            pos = np.searchsorted(self.sorted_keys, keys)
+            for j in range(self.maxocc):
+                ipos = np.minimum(pos + j, self.nk - 1)
+                ok = valid & (pos + j < self.nk) & (self.sorted_keys[ipos] == keys)
+                if not np.any(ok): break
+                cand = self.iperm[ipos]
+                ok &= issamek_many(qs, self.frac_coords[cand], atol=self.atol)
+                ok &= (found == -1) | (cand < found)
+                found[ok] = cand[ok]
+
+        return found
+
+    def find_many_sym(self, frac_coords, symrecs, has_timrev):
+        """
+        Find the points in `frac_coords` taking into account the symmetry operations `symrecs`
+        and time-reversal (if `has_timrev`).
+
+        Return:
+            namedtuple with the [nq] arrays (index, isym, tsign, g0) such that
+            `q = tsign * symrecs[isym] k_index + g0`. index is set to -1 if q cannot be found.
+            The operations are tested in order (first tsign = +1 then tsign = -1).
+        """
+        qs = np.reshape(frac_coords, (-1, 3))
+        symrecs = np.reshape(symrecs, (-1, 3, 3))
+        nq = len(qs)
+        index, isym = -np.ones(nq, dtype=np.int), -np.ones(nq, dtype=np.int)
+        tsign, g0 = np.zeros(nq, dtype=np.int), np.zeros((nq, 3), dtype=np.int)
+
+        for ts in ((1, -1) if has_timrev else (1,)):
+            for isy, rot in enumerate(symrecs):
+                todo = np.nonzero(index == -1)[0]
+                if len(todo) == 0: break
+                # q = ts S k + g0 --> k = ts S^{-1} q (modulo G).
+                rot_inv = np.rint(np.linalg.inv(rot)).astype(np.int)
+                found = self.find_many(ts * np.matmul(qs[todo], rot_inv.T))
+                ok = found != -1
+                todo, found = todo[ok], found[ok]
+                # Check the direct relation with the tolerance of issamek.
+                krot = ts * np.matmul(self.frac_coords[found], np.transpose(rot))
+                ok = issamek_many(qs[todo], krot, atol=self.atol)
+                todo, found, krot = todo[ok], found[ok], krot[ok]
+                index[todo], isym[todo], tsign[todo] = found, isy, ts
+                g0[todo] = np.rint(qs[todo] - krot)
+
+        return dict2namedtuple(index=index, isym=isym, tsign=tsign, g0=g0)
+
+
 def wrap_to_ws(x):
     """
     Transforms x in its corresponding reduced number in the interval ]-1/2,1/2].
@@ -204,6 +329,66 @@ def kmesh_from_mpdivs(mpdivs, shifts, pbc=False, order="bz"):
     return np.array(kbz)
 
 
+def map_mesh2ibz(ibz, ngkpt, symrecs, has_timrev, shift=None):
+    """
+    Compute the mapping between the points of the homogeneous mesh defined by `ngkpt` and `shift`
+    and the list of k-points `ibz`. All the points in the IBZ are rotated by all the symmetries
+    at once, the images are converted to indices of the grid and the first image
+    found for each point of the mesh is used to build the tables.
+
+    Args:
+        ibz: [nibz, 3] array with the reduced coordinates of the k-points in the IBZ.
+        ngkpt: Mesh divisions.
+        symrecs: [nsym, 3, 3] array with the symmetry operations in reciprocal space.
+        has_timrev: True if time-reversal can be used.
+        shift: Shift of the mesh in units of the mesh divisions e.g. [0.5, 0.5, 0.5]. None for Gamma-centered meshes.
+
+    Returns:
+        namedtuple with the following arrays defined for the points of the mesh in the unit cell (C-order):
+
+            bz: [nbz, 3] array with the reduced coordinates of the points in [0, 1[
+            ik_ibz: Index of the k-point in the IBZ. -1 if the point cannot be reconstructed.
+            isym: Index of the symmetry operation.
+            tsign: Time-reversal sign (+1 or -1).
+            g0: [nbz, 3] array with reciprocal lattice vectors.
+
+        such that `bz[ik] = tsign * symrecs[isym] ibz[ik_ibz] + g0`.
+    """
+    ngkpt = np.asarray(ngkpt, dtype=np.int)
+    shift = np.zeros(3) if shift is None else np.asarray(shift, dtype=np.float)
+    ibz = np.reshape(ibz, (-1, 3))
+    symrecs = np.reshape(symrecs, (-1, 3, 3))
+    nibz, nsym = len(ibz), len(symrecs)
+    tsigns = np.array((1, -1) if has_timrev else (1,), dtype=np.int)
+
+    # Images with shape [ntsign, nsym, nibz, 3]. The flattened order defines the priority
+    # of the operations: first tsign = +1 then, for each tsign, isym in increasing order.
+    krots = tsigns[:, None, None, None] * np.einsum("sij,kj->ski", symrecs, ibz)[None]
+    krots = krots.reshape(-1, 3)
+    grid = krots * ngkpt - shift
+    igrid = np.rint(grid).astype(np.int)
+    # Images not belonging to the mesh (e.g. inconsistent shift) are ignored.
+    on_mesh = np.all(np.abs(grid - igrid) < 1e-6, axis=1)
+    igrid %= ngkpt
+    lin = (igrid[:, 0] * ngkpt[1] + igrid[:, 1]) * ngkpt[2] + igrid[:, 2]
+
+    inds = np.nonzero(on_mesh)[0]
+    lin_uniq, first = np.unique(lin[inds], return_index=True)
+    first = inds[first]
+
+    nbz = ngkpt.prod()
+    ik_ibz, isym = -np.ones(nbz, dtype=np.int), -np.ones(nbz, dtype=np.int)
+    tsign, g0 = np.zeros(nbz, dtype=np.int), np.zeros((nbz, 3), dtype=np.int)
+    its, rest = np.divmod(first, nsym * nibz)
+    isym_first, ik_first = np.divmod(rest, nibz)
+    ik_ibz[lin_uniq], isym[lin_uniq], tsign[lin_uniq] = ik_first, isym_first, tsigns[its]
+
+    bz = (np.indices(ngkpt).reshape(3, -1).T + shift) / ngkpt
+    g0[lin_uniq] = np.rint(bz[lin_uniq] - krots[first])
+
+    return dict2namedtuple(bz=bz, ik_ibz=ik_ibz, isym=isym, tsign=tsign, g0=g0)
+
+
 def map_bz2ibz(structure, ibz, ngkpt, has_timrev, pbc=False):
     """
     Compute the correspondence between the list of k-points in the *unit cell*
@@ -233,17 +418,7 @@ def map_bz2ibz(structure, ibz, ngkpt, has_timrev, pbc=False):
     symrec_fm = [o.rot_g for o in abispg.fm_symmops]
 
     # Compute TS k_ibz.
-    bzgrid2ibz = -np.ones(ngkpt, dtype=np.int)
-
-    for ik_ibz, kibz in enumerate(ibz):
-        gp_ibz = np.array(np.rint(kibz * ngkpt), dtype=np.int)
-        for rot in symrec_fm:
-            rot_gp = np.matmul(rot, gp_ibz)
-            gp_bz = rot_gp % ngkpt
-            bzgrid2ibz[gp_bz[0], gp_bz[1], gp_bz[2]] = ik_ibz
-            if has_timrev:
-                gp_bz = (-rot_gp) % ngkpt
-                bzgrid2ibz[gp_bz[0], gp_bz[1], gp_bz[2]] = ik_ibz
+    bzgrid2ibz = map_mesh2ibz(ibz, ngkpt, symrec_fm, has_timrev).ik_ibz.reshape(ngkpt)
 
     if pbc:
         # Add periodical replicas.
@@ -252,7 +427,6 @@ def map_bz2ibz(structure, ibz, ngkpt, has_timrev, pbc=False):
     bz2ibz = bzgrid2ibz.flatten()
 
     if np.any(bz2ibz == -1):
-        #for ik_bz, ik_ibz in enumerate(self.bz2ibz): print(ik_bz, ">>>", ik_ibz)
         msg = "Found %s/%s invalid entries in bz2ibz array" % ((bz2ibz == -1).sum(), len(bz2ibz))
         msg += "This can happen if there an inconsistency between the input IBZ and ngkpt"
         msg += "ngkpt: %s, has_timrev: %s" % (str(ngkpt), has_timrev)
@@ -260,19 +434,6 @@ def map_bz2ibz(structure, ibz, ngkpt, has_timrev, pbc=False):
 
     return bz2ibz
 
-    """
-    for ik_bz, kbz in enumerate(bz):
-        found = False
-        for ik_ibz, kibz in enumerate(ibz):
-            if found: break
-            for symmop in structure.spacegroup:
-                krot = symmop.rotate_k(kibz)
-                if issamek(krot, kbz):
-                    bz2ibz[ik_bz] = ik_ibz
-                    found = True
-                    break
-    """
-
 
 def has_timrev_from_kptopt(kptopt):
     """
@@ -289,10 +450,10 @@ def map_kpoints(other_kpoints, other_lattice, ref_lattice, ref_kpoints, ref_symr
     in the reciprocal lattice `ref_lattice` with symmetry operations `ref_symrecs`.
 
     Args:
-        other_kpoints:
+        other_kpoints: [nk, 3] array with the reduced coordinates of the k-points to be mapped.
         other_lattice: matrix whose rows are the reciprocal lattice vectors in cartesian coordinates.
         ref_lattice: same meaning as other_lattice.
-        ref_kpoints:
+        ref_kpoints: [nref, 3] array with the reduced coordinates of the reference k-points.
         ref_symrecs: [nsym,3,3] arrays with symmetry operations in the `ref_lattice` reciprocal space.
         has_timrev: True if time-reversal can be used.
 
@@ -300,7 +461,7 @@ def map_kpoints(other_kpoints, other_lattice, ref_lattice, ref_kpoints, ref_symr
         (o2r_map, nmissing)
 
         nmissing:
-            Number of k-points in ref_kpoints that cannot be mapped onto ref_kpoints.
+            Number of k-points in other_kpoints that cannot be mapped onto ref_kpoints.
 
         o2r_map[i] gives the mapping  between the i-th k-point in other_kpoints and
             ref_kpoints. Set to None if the i-th k-point does not have any image in ref.
@@ -313,33 +474,22 @@ def map_kpoints(other_kpoints, other_lattice, ref_lattice, ref_kpoints, ref_symr
 
             kpt_other = TS kpt_ref + G0
     """
-    ref_gprimd_inv = np.inv(np.asarray(ref_lattice).T)
+    ref_gprimd_inv = np.linalg.inv(np.asarray(ref_lattice).T)
     other_gprimd = np.asarray(other_lattice).T
     other_kpoints = np.asarray(other_kpoints).reshape((-1, 3))
     ref_kpoints = np.asarray(ref_kpoints).reshape((-1, 3))
-    o2r_map = len(other_kpoints) * [None]
 
-    tsigns = (1, -1) if has_timrev else (1,)
-    kmap = collections.namedtuple("kmap", "ik_ref, tsign, isym, g0")
+    # Get other k-points in reduced coordinates in the reference lattice.
+    okpts_red = np.matmul(other_kpoints, np.matmul(ref_gprimd_inv, other_gprimd).T)
 
-    for ik_oth, okpt in enumerate(other_kpoints):
-        # Get other k-point in reduced coordinates in the referece lattice.
-        okpt_red = np.matmul(ref_gprimd_inv, np.matmul(other_gprimd, okpt))
-
-        # k_other = TS k_ref + G0
-        found = False
-        for ik_ref, kref in enumerate(ref_kpoints):
-            if found: break
-            for tsign in tsign:
-                for isym, symrec in enumerate(ref_symrecs):
-                    krot = tsign * np.matmul(symrec, kref)
-                    if issamek(okpt_red, krot):
-                        g0 = np.rint(okpt_red - krot)
-                        o2r_map[ik_oth] = kmap(ik_ref, tsign, isym, g0)
-                        found = True
-                        break
+    # k_other = TS k_ref + G0
+    res = KpointHashIndex(ref_kpoints).find_many_sym(okpts_red, ref_symrecs, has_timrev)
+
+    kmap = collections.namedtuple("kmap", "ik_ref, tsign, isym, g0")
+    o2r_map = [None if ik_ref == -1 else kmap(ik_ref, tsign, isym, g0)
+               for ik_ref, tsign, isym, g0 in zip(res.index, res.tsign, res.isym, res.g0)]
 
-        return o2r_map, o2r_map.count(None)
+    return o2r_map, o2r_map.count(None)
 
 
 #def find_irred_kpoints_kmesh(structure, kfrac_coords):
@@ -401,46 +551,36 @@ def find_irred_kpoints_generic(structure, kfrac_coords, verbose=1):
         kfrac_coords: Reduced coordinates of the k-points.
 
     Return:
-        irred_map: Index of the i-th irreducible k-point in the input kfrac_coords array.
+        namedtuple with:
 
-    .. warning::
+            irred_map: Index of the i-th irreducible k-point in the input kfrac_coords array.
+            kpt2irred: For each input k-point, the index in irred_map of the equivalent irreducible point.
 
-        In the worst case, the algorithm scales as nkpt ** 2 * nsym.
-        hence this routine should be used only if `kfrac_coords` represents
-        e.g. a path in the brillouin zone or an arbitrary set of points.
+    The images of all the k-points are computed for each symmetry operation and searched
+    in a hash table so that the cost scales as nkpt * nsym.
     """
     start = time.time()
-    print("Removing redundant k-points. This is gonna take a while... ")
-
-    # Wrap points in [0,1[ interval.
-    uc_kcoords = np.reshape(kfrac_coords, (-1, 3)) % 1
-
-    irred_map = collections.deque()
-    irred_map.append(0)
-    kpts2irred = collections.deque()
-    kpts2irred.append((0, 0, +1))
-
-    for ik, kk in enumerate(uc_kcoords[1:]):
-        ik += 1
-        found = False
-        for ik_irr in irred_map:
-            kirr = kfrac_coords[ik_irr]
-            for isym, symmop in enumerate(structure.abi_spacegroup):
-                krot = symmop.rotate_k(kirr)
-                if issamek(krot, kk):
-                    found = True
-                    #kpts2irred[ik] = (ik_irr, isym, symmops.time_sign)
-                    break
-
-        if not found:
-            irred_map.append(ik)
-
-    print("Completed in", time.time() - start, "[s]")
+    kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
+    nkpt = len(kfrac_coords)
+    kindex = KpointHashIndex(kfrac_coords)
+
+    # The representative of the star is the first point of the star in the input list.
+    # Since the symmetries form a group, a point is irreducible if it's the first point of its star.
+    rep = np.arange(nkpt)
+    for symmop in structure.abi_spacegroup:
+        found = kindex.find_many(symmop.time_sign * np.matmul(kfrac_coords, np.transpose(symmop.rot_g)))
+        ok = found != -1
+        rep[ok] = np.minimum(rep[ok], found[ok])
+
+    irred_map = np.nonzero(rep == np.arange(nkpt))[0]
+    kpt2irred = np.searchsorted(irred_map, rep)
+
     if verbose:
-        print("Entered with ", len(uc_kcoords), "k-points")
+        print("Removing redundant k-points completed in", time.time() - start, "[s]")
+        print("Entered with ", nkpt, "k-points")
         print("Found ", len(irred_map), "irred k-points")
 
-    return dict2namedtuple(irred_map=np.array(irred_map, dtype=np.int))
+    return dict2namedtuple(irred_map=np.array(irred_map, dtype=np.int), kpt2irred=kpt2irred)
 
 
 class KpointsError(Exception):
@@ -486,6 +626,12 @@ def as_kpoints(obj, lattice, weights=None, names=None):
         raise ValueError("ndim > 2 is not supported")
 
 
+def _fix_kname(name):
+    """Fix typo in Latex syntax (if any)."""
+    if name is not None and name.startswith("\\"): name = "$" + name + "$"
+    return name
+
+
 class Kpoint(SlotPickleMixin):
     """
     Class defining one k-point.
@@ -576,9 +722,7 @@ class Kpoint(SlotPickleMixin):
 
     def set_name(self, name):
         """Set the name of the k-point."""
-        # Fix typo in Latex syntax (if any).
-        if name is not None and name.startswith("\\"): name = "$" + name + "$"
-        self._name = name
+        self._name = _fix_kname(name)
 
     @property
     def on_border(self):
@@ -685,6 +829,62 @@ class Kpoint(SlotPickleMixin):
         return KpointStar(self.lattice, frac_coords, weights=None, names=len(frac_coords) * [self.name])
 
 
+class _KpointView(Kpoint):
+    """
+    A :class:`Kpoint` whose data is stored in the arrays of a :class:`KpointList`.
+    Views are created on demand by the list, changing the weight or the name of the view
+    changes the data in the parent list. Operations returning new k-points produce :class:`Kpoint` objects.
+    """
+
+    __slots__ = [
+        "_klist",
+        "_ik",
+    ]
+
+    def __new__(cls, *args, **kwargs):
+        # Code calling self.__class__(frac_coords, lattice, ...) receives a standard Kpoint.
+        return Kpoint(*args, **kwargs)
+
+    @classmethod
+    def from_klist(cls, klist, ik):
+        """Build the view of the ik-th point in klist."""
+        new = object.__new__(cls)
+        new._klist, new._ik = klist, ik
+        return new
+
+    def __reduce__(self):
+        # Pickle as a standalone Kpoint.
+        return (Kpoint, (self.frac_coords.copy(), self.lattice, self.weight, self.name))
+
+    @property
+    def _frac_coords(self):
+        return self._klist._frac_coords[self._ik]
+
+    @property
+    def _lattice(self):
+        return self._klist._reciprocal_lattice
+
+    @property
+    def _weight(self):
+        return self._klist._weights[self._ik]
+
+    @_weight.setter
+    def _weight(self, weight):
+        self._klist._weights[self._ik] = 0.0 if weight is None else weight
+
+    @property
+    def _name(self):
+        names = self._klist._names
+        return None if names is None else names[self._ik]
+
+    @_name.setter
+    def _name(self, name):
+        if self._klist._names is None:
+            if name is None: return
+            self._klist._names = len(self._klist) * [None]
+        self._klist._names[self._ik] = name
+
+
 class KpointList(collections.Sequence):
     """
     Base class defining a sequence of :class:`Kpoint` objects. Essentially consists
@@ -734,7 +934,7 @@ class KpointList(collections.Sequence):
             reciprocal_lattice=self.reciprocal_lattice.as_dict(),
             frac_coords=self.frac_coords.tolist(),
             weights=weights,
-            names=[k.name for k in self],
+            names=self.names,
             ksampling=self.ksampling,
         )
 
@@ -755,18 +955,33 @@ class KpointList(collections.Sequence):
             if len(weights) != len(frac_coords):
                 raise ValueError("len(weights) != len(frac_coords):\nweights: %s\nfrac_coords: %s" %
                     (weights, frac_coords))
-            weights = np.asarray(weights)
+            self._weights = np.array(weights, dtype=np.float)
         else:
-            weights = np.zeros(len(self.frac_coords))
+            self._weights = np.zeros(len(self.frac_coords))
 
         if names is not None and len(names) != len(frac_coords):
             raise ValueError("len(names) != len(frac_coords):\nnames: %s\nfrac_coords: %s" %
                     (names, frac_coords))
 
-        self._points = []
-        for i, rcs in enumerate(frac_coords):
-            name = None if names is None else names[i]
-            self._points.append(Kpoint(rcs, self.reciprocal_lattice, weight=weights[i], name=name))
+        # Names are stored in a list only if at least one k-point has a name.
+        self._names = None
+        if names is not None and any(name is not None for name in names):
+            self._names = [_fix_kname(name) for name in names]
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        # The hash index is rebuilt on demand.
+        d.pop("_hash_index", None)
+        return d
+
+    def __setstate__(self, d):
+        if "_points" in d:
+            # Pickle produced by the previous implementation that stored a list of Kpoint objects.
+            points = d.pop("_points")
+            d["_weights"] = np.array([k.weight for k in points], dtype=np.float)
+            names = [k.name for k in points]
+            d["_names"] = names if any(name is not None for name in names) else None
+        self.__dict__.update(d)
 
     #@classmethod
     #def from_file(cls, filepath):
@@ -796,62 +1011,121 @@ class KpointList(collections.Sequence):
 
     # Sequence protocol.
     def __len__(self):
-        return len(self._points)
+        return len(self._frac_coords)
 
     def __iter__(self):
-        return self._points.__iter__()
+        for ik in range(len(self)):
+            yield _KpointView.from_klist(self, ik)
 
     def __getitem__(self, slice):
-        return self._points[slice]
+        if isinstance(slice, (int, np.integer)):
+            ik = int(slice)
+            if ik < 0: ik += len(self)
+            if ik < 0 or ik >= len(self):
+                raise IndexError("KpointList index %s out of range" % slice)
+            return _KpointView.from_klist(self, ik)
+        else:
+            # Return a list of Kpoint views.
+            return [_KpointView.from_klist(self, ik) for ik in range(len(self))[slice]]
 
     def __contains__(self, kpoint):
-        return kpoint in self._points
+        return self.find(kpoint) != -1
 
     def __reversed__(self):
-        return self._points.__reversed__()
+        for ik in reversed(range(len(self))):
+            yield _KpointView.from_klist(self, ik)
 
     def __add__(self, other):
         if self.reciprocal_lattice != other.reciprocal_lattice:
             raise ValueError("Cannot merge k-points with different reciprocal lattice.")
 
         return KpointList(self.reciprocal_lattice,
-                          frac_coords=[k.frac_coords for k in self] + [k.frac_coords for k in other],
+                          frac_coords=np.concatenate((self.frac_coords, other.frac_coords)),
                           weights=None,
-                          names=[k.name for k in self] + [k.name for k in other],
+                          names=self.names + other.names,
                         )
 
     def __eq__(self, other):
         if other is None or not isinstance(other, KpointList): return False
-        for k1, k2 in zip(self, other):
-            if k1 != k2: return False
-        return True
+        n = min(len(self), len(other))
+        return bool(np.all(issamek_many(self.frac_coords[:n], other.frac_coords[:n])))
 
     def __ne__(self, other):
         return not (self == other)
 
+    def get_hash_index(self):
+        """
+        Return the :class:`KpointHashIndex` used to find k-points in self.
+        The index is built lazily and rebuilt if the tolerance has been changed with `set_atol_kdiff`.
+        """
+        kindex = getattr(self, "_hash_index", None)
+        if kindex is None or kindex.atol != _ATOL_KDIFF:
+            kindex = self._hash_index = KpointHashIndex(self.frac_coords, atol=_ATOL_KDIFF)
+        return kindex
+
+    def find_many(self, frac_coords, symrecs=None, has_timrev=False):
+        """
+        Find the indices of the k-points `frac_coords` in self.
+        Points are compared with the same criterion used by `issamek`.
+
+        Args:
+            frac_coords: [nq, 3] array with reduced coordinates or list of :class:`Kpoint` objects.
+            symrecs: [nsym, 3, 3] array with the symmetry operations in reciprocal space.
+                If not None, symmetry-equivalent points are also considered.
+            has_timrev: True if time-reversal can be used. Used only if symrecs is not None.
+
+        Return:
+            If symrecs is None, [nq] array with the index of the first k-point in self
+            that is equal to the query (modulo G), -1 if not found.
+
+            If symrecs is not None, namedtuple with the following [nq] arrays:
+
+                index: Index of the k-point in self (-1 if not found)
+                isym: Index of the symmetry in symrecs.
+                tsign: Time-reversal sign (+1 or -1).
+                g0: [nq, 3] array with the reciprocal lattice vectors.
+
+            such that `q = tsign * symrecs[isym] k_index + g0`.
+            The operations are tested in order (first tsign = +1 then tsign = -1).
+        """
+        if hasattr(frac_coords, "frac_coords"):
+            # Kpoint or KpointList
+            frac_coords = frac_coords.frac_coords
+        elif len(frac_coords) and hasattr(frac_coords[0], "frac_coords"):
+            frac_coords = [k.frac_coords for k in frac_coords]
+        qs = np.reshape(np.asarray(frac_coords, dtype=np.float), (-1, 3))
+        kindex = self.get_hash_index()
+        if symrecs is None:
+            return kindex.find_many(qs)
+        else:
+            return kindex.find_many_sym(qs, symrecs, has_timrev)
+
     def index(self, kpoint):
         """
         Returns: the first index of kpoint in self.
 
         Raises: ValueError if not found.
         """
-        try:
-            return self._points.index(kpoint)
-        except ValueError:
+        ik = self.find(kpoint)
+        if ik == -1:
             raise ValueError("Cannot find point: %s in KpointList:\n%s" % (repr(kpoint), repr(self)))
+        return ik
 
     def find(self, kpoint):
         """
         Returns: first index of kpoint. -1 if not found
         """
+        frac_coords = kpoint.frac_coords if hasattr(kpoint, "frac_coords") else kpoint
         try:
-            return self.index(kpoint)
-        except ValueError:
+            frac_coords = np.reshape(np.asarray(frac_coords, dtype=np.float), (3,))
+        except (TypeError, ValueError):
             return -1
+        return int(self.get_hash_index().find_many(frac_coords)[0])
 
     def count(self, kpoint):
         """Return number of occurrences of kpoint"""
-        return self._points.count(kpoint)
+        frac_coords = kpoint.frac_coords if hasattr(kpoint, "frac_coords") else kpoint
+        return int(np.count_nonzero(issamek_many(self.frac_coords, frac_coords)))
 
     def find_closest(self, obj):
         """
@@ -874,9 +1148,8 @@ class KpointList(collections.Sequence):
         else:
             frac_coords = np.asarray(obj)
 
-        dist = np.empty(len(self))
-        for i, kpt in enumerate(self):
-            dist[i] = kpt.lattice.norm(kpt.frac_coords - frac_coords)
+        cart_diff = self.reciprocal_lattice.get_cartesian_coords(self.frac_coords - frac_coords)
+        dist = np.sqrt(np.sum(cart_diff ** 2, axis=1))
 
         ind = dist.argmin()
         return ind, self[ind], np.copy(dist[ind])
@@ -922,12 +1195,14 @@ class KpointList(collections.Sequence):
     @property
     def names(self):
         """List with the name of the k-points."""
-        return [k.name for k in self]
+        return len(self) * [None] if self._names is None else list(self._names)
 
     @property
     def weights(self):
-        """`ndarray` with the weights of the k-points."""
-        return np.array([kpoint.weight for kpoint in self])
+        """`ndarray` with the weights of the k-points (read-only view)."""
+        weights = self._weights.view()
+        weights.flags.writeable = False
+        return weights
 
     def sum_weights(self):
         """Returns the sum of the weights."""
@@ -937,24 +1212,16 @@ class KpointList(collections.Sequence):
         """
         Remove duplicated k-points from self. Returns new KpointList instance.
         """
-        frac_coords, good_indices = [self[0].frac_coords], [0]
-
-        for i, kpoint in enumerate(self[1:]):
-            i += 1
-            # Add it only if it's not already in the list.
-            for prev_coords in frac_coords:
-                if issamek(kpoint.frac_coords, prev_coords): break
-            else:
-                frac_coords.append(kpoint.frac_coords)
-                good_indices.append(i)
-
-        good_kpoints = [self[i] for i in good_indices]
+        # A point is kept only if it is the first occurrence in the list.
+        first = self.get_hash_index().find_many(self.frac_coords)
+        good_indices = np.nonzero(first == np.arange(len(self)))[0]
+        names = self.names
 
         return self.__class__(
                 self.reciprocal_lattice,
-                frac_coords=[k.frac_coords for k in good_kpoints],
+                frac_coords=self.frac_coords[good_indices],
                 weights=None,
-                names=[k.name for k in good_kpoints],
+                names=[names[i] for i in good_indices],
                 ksampling=self.ksampling)
 
     def to_array(self):
@@ -973,7 +1240,7 @@ class KpointList(collections.Sequence):
         fold = False
 
         if self.is_path:
-            labels = {k.name: k.frac_coords for k in self if k.name}
+            labels = {name: fc for name, fc in zip(self.names, self.frac_coords) if name}
             frac_coords_lines = [self.frac_coords[line] for line in self.lines]
             return plot_brillouin_zone(self.reciprocal_lattice, lines=frac_coords_lines, labels=labels,
                                        ax=ax, fold=fold, **kwargs)
@@ -1095,20 +1362,26 @@ class Kpath(KpointList):
         numpy array of len(self)-1 elements giving the distance between two
         consecutive k-points, i.e. ds[i] = ||k[i+1] - k[i]|| for i=0,1,...,n-1
         """
-        ds = np.zeros(len(self) - 1)
-        for i, kpoint in enumerate(self[:-1]):
-            ds[i] = (self[i + 1] - kpoint).norm
-        return ds
+        cart_diff = self.reciprocal_lattice.get_cartesian_coords(np.diff(self.frac_coords, axis=0))
+        return np.sqrt(np.sum(cart_diff ** 2, axis=1))
 
     @lazy_property
     def versors(self):
         """
         Tuple of len(self)-1 elements with the versors connecting k[i] to k[i+1].
         """
-        versors = (len(self) - 1) * [None, ]
-        for i, kpt in enumerate(self[:-1]):
-            versors[i] = (self[i + 1] - kpt).versor()
-        return tuple(versors)
+        lattice = self.reciprocal_lattice
+        return tuple(Kpoint(v, lattice, weight=0.0) if norm > 1e-12 else Kpoint.gamma(lattice, weight=0.0)
+                     for v, norm in zip(self._versors_frac_coords, self.ds))
+
+    @lazy_property
+    def _versors_frac_coords(self):
+        """[len(self)-1, 3] array with the reduced coordinates of the versors (zero if k[i+1] == k[i])."""
+        ds = self.ds
+        versors = np.zeros((len(ds), 3))
+        nonzero = ds > 1e-12
+        versors[nonzero] = np.diff(self.frac_coords, axis=0)[nonzero] / ds[nonzero, None]
+        return versors
 
     @lazy_property
     def lines(self):
@@ -1121,21 +1394,11 @@ class Kpath(KpointList):
             for line in self.lines:
                 vals_on_line = eigens[spin, line, band]
         """
-        prev = self.versors[0]
-        lines = [[0]]
-
-        for i, v in enumerate(self.versors[1:]):
-            i += 1
-            if v != prev:
-                #print("diff", v.frac_coords - prev.frac_coords)
-                prev = v
-                lines[-1].append(i)
-                lines.append([i])
-            else:
-                lines[-1].append(i)
-
-        lines[-1].append(len(self)-1)
-        return tuple(lines)
+        versors = self._versors_frac_coords
+        # A new line starts when the versor changes.
+        changes = list(np.nonzero(~issamek_many(versors[1:], versors[:-1]))[0] + 1)
+        starts, ends = [0] + changes, changes + [len(self) - 1]
+        return tuple(list(range(start, end + 1)) for start, end in zip(starts, ends))
 
     def finite_diff(self, values, order=1, acc=4):
         """
@@ -1546,12 +1809,7 @@ class Ktables(object):
         self.nbz = len(self.bz)
 
         # All k-points and mapping to ir-grid points.
-        # FIXME This is slow.
-        self.bz2ibz = np.empty(len(self.bz), dtype=np.int)
-        for ik_bz, ir_gp_id in enumerate(mapping):
-            inds = np.where(uniq == ir_gp_id)
-            assert len(inds) == 1
-            self.bz2ibz[ik_bz] = inds[0]
+        self.bz2ibz = np.searchsorted(uniq, mapping)
 
     def __str__(self):
         return self.to_string()
@@ -1574,5 +1832,5 @@ class Ktables(object):
         print("BZ points --> IBZ points", file=file)
         for ik_bz, ik_ibz in enumerate(self.bz2ibz):
             print("%6d) [%9.6f, %9.6f, %9.6f], ====> %6d) [%9.6f, %9.6f, %9.6f]," %
-                (ik_bz, self.bz[ik_ibz][0], self.bz[ik_ibz][1], self.bz[ik_ibz][2],
+                (ik_bz, self.bz[ik_bz][0], self.bz[ik_bz][1], self.bz[ik_bz][2],
                 ik_ibz, self.ibz[ik_ibz][0], self.ibz[ik_ibz][1], self.ibz[ik_ibz][2]), file=file)
@@ -4,8 +4,6 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 
 import numpy as np
 
-from itertools import product as iproduct
-from collections import deque
 from monty.functools import lazy_property
 from numpy.random import random
 from numpy.fft import fftn, ifftn, fftshift, ifftshift, fftfreq
@@ -14,9 +12,236 @@ from abipy.tools import duck
 
 __all__ = [
     "Mesh3D",
+    "FFTEngine",
+    "set_fft_engine",
+    "get_fft_engine",
 ]
 
 
+class FFTEngine(object):
+    """
+    Batched complex-to-complex 3D FFTs performed along the last three axes of arrays with shape [..., nx, ny, nz].
+    Transforms are not normalized: client code should use the methods of :class:`Mesh3D`.
+
+    Backends:
+
+        - "numpy": `numpy.fft` (always available, single thread, no in-place transforms).
+        - "scipy": `scipy.fft` with multiple `workers`. Supports in-place transforms via `overwrite_x`.
+        - "pyfftw": FFTW plans are created once for each (shape, direction) and reused.
+          Supports multiple threads and true in-place transforms.
+    """
+    BACKENDS = ("numpy", "scipy", "pyfftw")
+
+    def __init__(self, backend="numpy", nthreads=1):
+        """
+        Args:
+            backend: Name of the FFT library. See BACKENDS.
+            nthreads: Number of threads (ignored by the numpy backend).
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError("Invalid FFT backend: `%s`. Choose among %s" % (backend, str(self.BACKENDS)))
+        self.backend, self.nthreads = backend, int(nthreads)
+        self._plans = {}
+
+        if backend == "scipy":
+            try:
+                import scipy.fft
+            except ImportError:
+                raise ImportError("FFT backend `scipy` requires scipy >= 1.4")
+        elif backend == "pyfftw":
+            try:
+                import pyfftw
+            except ImportError:
+                raise ImportError("FFT backend `pyfftw` requires pyfftw. Install it with `conda install pyfftw` or pip")
+
+    def __str__(self):
+        return "%s: backend: %s, nthreads: %d, nplans: %d" % (
+            self.__class__.__name__, self.backend, self.nthreads, len(self._plans))
+
+    def forward(self, arr, inplace=False):
+        """
+        Unnormalized forward transform (e^{-iGr}) of arr[..., nx, ny, nz].
+        If inplace, arr (complex, C-contiguous) may be used to store the result.
+        """
+        return self._execute(arr, -1, inplace)
+
+    def backward(self, arr, inplace=False):
+        """
+        Unnormalized backward transform (e^{+iGr}) of arr[..., nx, ny, nz].
+        If inplace, arr (complex, C-contiguous) may be used to store the result.
+        """
+        return self._execute(arr, +1, inplace)
+
+    def rforward(self, arr):
+        """
+        Unnormalized real-to-complex forward transform of the real array arr[..., nx, ny, nz].
+        Return the half-spectrum [..., nx, ny, nz//2+1] (see `numpy.fft.rfftn`).
+        """
+        axes = (-3, -2, -1)
+        if self.backend == "numpy":
+            return np.fft.rfftn(arr, axes=axes)
+        elif self.backend == "scipy":
+            import scipy.fft
+            return scipy.fft.rfftn(arr, axes=axes, workers=self.nthreads)
+        elif self.backend == "pyfftw":
+            from pyfftw.interfaces import numpy_fft
+            return numpy_fft.rfftn(arr, axes=axes, threads=self.nthreads)
+
+        raise ValueError("Invalid backend: %s" % self.backend)
+
+    def rbackward(self, arr, shape):
+        """
+        Unnormalized complex-to-real backward transform of the half-spectrum arr[..., nx, ny, nz//2+1].
+        `shape` gives the shape (nx, ny, nz) of the real output array.
+        """
+        axes = (-3, -2, -1)
+        size = np.prod(shape)
+        if self.backend == "numpy":
+            return np.fft.irfftn(arr, s=shape, axes=axes) * size
+        elif self.backend == "scipy":
+            import scipy.fft
+            return scipy.fft.irfftn(arr, s=shape, axes=axes, norm="forward", workers=self.nthreads)
+        elif self.backend == "pyfftw":
+            from pyfftw.interfaces import numpy_fft
+            return numpy_fft.irfftn(arr, s=shape, axes=axes, threads=self.nthreads) * size
+
+        raise ValueError("Invalid backend: %s" % self.backend)
+
+    def _execute(self, arr, isign, inplace):
+        if arr.ndim < 3:
+            raise ValueError("FFTEngine requires arrays with ndim >= 3 while ndim is %d" % arr.ndim)
+        inplace = inplace and arr.dtype == np.complex and arr.flags.c_contiguous
+        if arr.dtype != np.complex:
+            arr = arr.astype(np.complex)
+        axes = (-3, -2, -1)
+
+        if self.backend == "numpy":
+            if isign == -1:
+                return fftn(arr, axes=axes)
+            out = ifftn(arr, axes=axes)
+            out *= np.prod(arr.shape[-3:])
+            return out
+
+        elif self.backend == "scipy":
+            import scipy.fft
+            func = scipy.fft.fftn if isign == -1 else scipy.fft.ifftn
+            return func(arr, axes=axes, norm="backward" if isign == -1 else "forward",
+                        overwrite_x=inplace, workers=self.nthreads)
+
+        elif self.backend == "pyfftw":
+            plan = self._get_plan(arr.shape, isign, inplace)
+            if inplace:
+                plan.update_arrays(arr, arr)
+                plan.execute()
+                return arr
+            else:
+                out = np.empty(arr.shape, dtype=np.complex)
+                plan.update_arrays(np.ascontiguousarray(arr), out)
+                plan.execute()
+                return out
+
+        raise ValueError("Invalid backend: %s" % self.backend)
+
+    def _get_plan(self, shape, isign, inplace):
+        """Return FFTW plan. Plans are created with scratch arrays and cached."""
+        key = (shape, isign, inplace)
+        if key in self._plans:
+            return self._plans[key]
+
+        import pyfftw
+        # Planning with FFTW_MEASURE overwrites the arrays hence we use scratch buffers.
+        # FFTW_UNALIGNED allows us to execute the plan with arrays allocated by numpy.
+        inp = pyfftw.empty_aligned(shape, dtype=np.complex)
+        out = inp if inplace else pyfftw.empty_aligned(shape, dtype=np.complex)
+        plan = pyfftw.FFTW(inp, out, axes=(-3, -2, -1),
+                           direction="FFTW_FORWARD" if isign == -1 else "FFTW_BACKWARD",
+                           flags=("FFTW_MEASURE", "FFTW_UNALIGNED"), threads=self.nthreads)
+        self._plans[key] = plan
+        return plan
+
+
+# Engine used by default in the batched methods of Mesh3D.
+_FFT_ENGINE = FFTEngine()
+
+
+def set_fft_engine(backend="numpy", nthreads=1):
+    """
+    Change the default :class:`FFTEngine` used for batched FFTs. Return the new engine.
+
+    Args:
+        backend: Name of the FFT library. See FFTEngine.BACKENDS.
+        nthreads: Number of threads.
+    """
+    global _FFT_ENGINE
+    _FFT_ENGINE = FFTEngine(backend=backend, nthreads=nthreads)
+    return _FFT_ENGINE
+
+
+def get_fft_engine():
+    """Return the default :class:`FFTEngine`."""
+    return _FFT_ENGINE
+
+
+def _gtransfer_maps_1d(n_in, n_out, half=False):
+    """
+    Index maps used to transfer the Fourier coefficients along one axis of the FFT box
+    from a box with n_in points to a box with n_out points.
+
+    Args:
+        n_in, n_out: Number of points along the axis.
+        half: True if the axis stores the non-negative frequencies of a real function (rfft layout).
+
+    Return:
+        (in_inds, out_inds, weights) arrays such that out[out_inds] += weights * in[in_inds]
+    """
+    m = min(n_in, n_out)
+    # Frequencies shared by the two boxes (Nyquist excluded).
+    gs = np.arange(0 if half else -((m - 1) // 2), (m - 1) // 2 + 1)
+    ins, outs, wts = list(gs % n_in), list(gs % n_out), [1.0] * len(gs)
+
+    if m % 2 == 0:
+        gn = m // 2
+        if n_in == n_out:
+            ins.append(gn); outs.append(gn); wts.append(1.0)
+        elif n_in == m:
+            # Zero padding: split the Nyquist coefficient between +gn and -gn.
+            if half:
+                ins.append(gn); outs.append(gn); wts.append(0.5)
+            else:
+                ins.extend([gn, gn]); outs.extend([gn, n_out - gn]); wts.extend([0.5, 0.5])
+        else:
+            # Truncation: +gn and -gn are folded onto the Nyquist component.
+            # For half-spectra the -gn contribution is added by Mesh3D.transfer_g.
+            if half:
+                ins.append(gn); outs.append(gn); wts.append(1.0)
+            else:
+                ins.extend([gn, n_in - gn]); outs.extend([gn, gn]); wts.extend([1.0, 1.0])
+
+    return np.array(ins, dtype=np.int), np.array(outs, dtype=np.int), np.array(wts)
+
+
+def _transfer_axis(arr, axis, n_out, maps):
+    """
+    Return new array with n_out points along `axis` filled with the values of `arr` according to `maps`.
+    See `_gtransfer_maps_1d`.
+    """
+    ins, outs, wts = maps
+    shape = list(arr.shape)
+    shape[axis] = n_out
+    out = np.zeros(shape, dtype=arr.dtype)
+    src, dst = np.moveaxis(arr, axis, 0), np.moveaxis(out, axis, 0)
+
+    # Output indices appearing more than once (Nyquist folding) must be accumulated.
+    first = np.zeros(len(outs), dtype=np.bool)
+    first[np.unique(outs, return_index=True)[1]] = True
+    wshape = (-1,) + (1,) * (src.ndim - 1)
+    dst[outs[first]] = src[ins[first]] * np.reshape(wts[first], wshape)
+    for i, o, w in zip(ins[~first], outs[~first], wts[~first]):
+        dst[o] += w * src[i]
+
+    return out
+
+
 class Mesh3D(object):
     r"""
     Descriptor-class for uniform 3D meshes.
@@ -246,28 +471,182 @@ class Mesh3D(object):
 
         return fr * self.size
 
-    #def fourier_interp(self, data, new_mesh, inspace="r"):
-    #    """
-    #    Fourier interpolation of data.
+    def fft_r2g_batch(self, fr, inplace=False, engine=None):
+        """
+        FFT R --> G of many arrays fr[..., nx, ny, nz] in a single call.
+        Same normalization as :meth:`fft_r2g`.
 
-    #    Args:
+        Args:
+            fr: Array with shape [..., nx, ny, nz].
+            inplace: True if fr can be overwritten with the results.
+                Requires a complex C-contiguous array, and an engine supporting in-place transforms.
+            engine: :class:`FFTEngine`. None to use the default engine (see :func:`set_fft_engine`).
+        """
+        assert fr.shape[-3:] == self.shape
+        engine = get_fft_engine() if engine is None else engine
+        fg = engine.forward(fr, inplace=inplace)
+        fg /= self.size
+        return fg
 
-    #        data: Input array defined on this mesh
-    #        new_mesh: Mesh where data is interpolated
-    #        inspace: string specifying if data is given in real space "r" or in reciprocal space "g".
+    def fft_g2r_batch(self, fg, inplace=False, engine=None):
+        """
+        FFT G --> R of many arrays fg[..., nx, ny, nz] in a single call.
+        Same normalization as :meth:`fft_g2r`.
 
-    #    Return:
-    #        Numpy array in real space on the new_mesh
-    #    """
-    #    raise NotImplementedError("gtransfer is missing")
-    #    assert inspace in ("r", "g")
+        Args:
+            fg: Array with shape [..., nx, ny, nz].
+            inplace: True if fg can be overwritten with the results.
+                Requires a complex C-contiguous array, and an engine supporting in-place transforms.
+            engine: :class:`FFTEngine`. None to use the default engine (see :func:`set_fft_engine`).
+        """
+        assert fg.shape[-3:] == self.shape
+        engine = get_fft_engine() if engine is None else engine
+        return engine.backward(fg, inplace=inplace)
 
-    #    # Insert data in the FFT box of new mesh.
-    #    if inspace == "r": data = self.fft_r2g(data)
-    #    intp_datag = new_mesh.gtransfer_from(self, data)
+    @property
+    def half_shape(self):
+        """
+        Shape of the half-spectrum (nx, ny, nz//2+1) used to represent the Fourier coefficients
+        of real functions (only the non-negative frequencies along z are stored).
+        """
+        return (self.nx, self.ny, self.nz // 2 + 1)
 
-    #    # FFT transform G --> R.
-    #    return new_mesh.fft_g2r(intp_datag)
+    def fft_r2g_half(self, fr, engine=None):
+        """
+        Real-to-complex FFT R --> G of the real array(s) fr[..., nx, ny, nz].
+        Return the half-spectrum [..., nx, ny, nz//2+1]. Same normalization as :meth:`fft_r2g`.
+        The other coefficients are given by :math:`f(-G) = f(G)^*`.
+
+        Args:
+            fr: Real array with shape [..., nx, ny, nz].
+            engine: :class:`FFTEngine`. None to use the default engine (see :func:`set_fft_engine`).
+        """
+        assert fr.shape[-3:] == self.shape
+        if np.iscomplexobj(fr):
+            raise TypeError("fft_r2g_half requires real arrays")
+        engine = get_fft_engine() if engine is None else engine
+        fg = engine.rforward(fr)
+        fg /= self.size
+        return fg
+
+    def fft_g2r_half(self, fg, engine=None):
+        """
+        Complex-to-real FFT G --> R of the half-spectrum fg[..., nx, ny, nz//2+1].
+        Return real array with shape [..., nx, ny, nz]. Inverse of :meth:`fft_r2g_half`.
+        """
+        assert fg.shape[-3:] == self.half_shape
+        engine = get_fft_engine() if engine is None else engine
+        return engine.rbackward(fg, self.shape)
+
+    def get_half_weights(self):
+        r"""
+        [nx * ny * (nz//2+1)] array with the weights of the G-vectors of the half-spectrum.
+        Sums over the full FFT box of products of Fourier coefficients of real functions
+        are obtained with :math:`\sum_G f(G) = \Re \sum_{G\in half} w_G f(G)`.
+        Weight is 2 if the G-vector has a partner -G that is not stored in the half-spectrum, 1 otherwise.
+        """
+        wz = np.ones(self.half_shape[2])
+        wz[1:(self.nz + 1) // 2] = 2.0
+        return np.tile(wz, self.nx * self.ny)
+
+    def get_half_partners(self):
+        """
+        Return (inds, partner_gvecs) for the G-vectors of the half-spectrum with weight 2 (see `get_half_weights`)
+        whose partner -G is not the vector stored in the full FFT box, i.e. -G has a +n/2 component
+        that is represented by -n/2 in the FFT ordering (even nx or ny).
+        partner_gvecs are the reduced coordinates of the vectors representing -G in the full box.
+        Needed to reproduce exactly sums over the full box involving explicitly the G-vectors (e.g. e^{iGr}).
+        """
+        gvecs = self.gvecs_half
+        weights = self.get_half_weights()
+        partners = -gvecs
+        for i in range(2):
+            n = self.shape[i]
+            if n % 2 == 0: partners[partners[:, i] == n // 2, i] = -n // 2
+        inds = np.where((weights == 2) & np.any(partners != -gvecs, axis=1))[0]
+        return inds, partners[inds]
+
+    @lazy_property
+    def _gtransfer_cache(self):
+        """Cache with the index maps used in `transfer_g`. Keys: (new_shape, half)."""
+        return {}
+
+    def get_gtransfer_maps(self, new_shape, half=False):
+        """
+        Return the three 1D index maps used to transfer Fourier coefficients from this FFT box
+        to the box with shape `new_shape`. Each map is a tuple (in_inds, out_inds, weights)
+        such that out[out_inds] += weights * in[in_inds] along the corresponding axis.
+        The maps are computed once and cached.
+
+        Args:
+            new_shape: Shape of the new FFT box.
+            half: True if the last axis stores the half-spectrum of a real function (rfftn layout).
+        """
+        key = (tuple(new_shape), half)
+        if key not in self._gtransfer_cache:
+            self._gtransfer_cache[key] = [_gtransfer_maps_1d(n_in, n_out, half=(half and i == 2))
+                                          for i, (n_in, n_out) in enumerate(zip(self.shape, new_shape))]
+        return self._gtransfer_cache[key]
+
+    def transfer_g(self, fg, new_mesh, half=False):
+        """
+        Transfer the Fourier coefficients fg[..., nx, ny, nz] defined on this mesh to the FFT box of `new_mesh`
+        (zero-padding if the new box is larger, truncation if it is smaller). The Nyquist components of
+        even-sized boxes are split (padding) or folded (truncation) so that real functions stay real.
+        Coefficients are normalized as in :meth:`fft_r2g` hence no rescaling is needed.
+
+        Args:
+            fg: Array with shape [..., nx, ny, nz] or [..., nx, ny, nz//2+1] if `half`.
+            new_mesh: :class:`Mesh3D` object or shape of the new FFT box.
+            half: True if `fg` stores the half-spectrum of a real function (see `numpy.fft.rfftn`).
+        """
+        new_shape = tuple(new_mesh.shape if hasattr(new_mesh, "shape") else new_mesh)
+        maps = self.get_gtransfer_maps(new_shape, half=half)
+        nzout = new_shape[2] // 2 + 1 if half else new_shape[2]
+
+        out = fg
+        for axis, (n_out, m) in enumerate(zip(new_shape[:2] + (nzout,), maps)):
+            out = _transfer_axis(out, fg.ndim - 3 + axis, n_out, m)
+
+        if half and new_shape[2] < self.nz and new_shape[2] % 2 == 0:
+            # Truncation of the last axis to an even number of points: the Nyquist plane
+            # must contain c(g, +N) + c(g, -N) with c(g, -N) = conj(c(-g, +N)).
+            plane = out[..., -1]
+            ix, iy = [(-np.arange(n)) % n for n in new_shape[:2]]
+            out[..., -1] = plane + plane[..., ix, :][..., iy].conj()
+
+        return out
+
+    def fourier_interp(self, data, new_mesh, inspace="r"):
+        """
+        Fourier interpolation of data. Real arrays are transformed with real-to-complex FFTs.
+        All the leading dimensions (e.g. spin components) are transformed with a single call.
+
+        Args:
+            data: Input array [..., nx, ny, nz] defined on this mesh
+            new_mesh: Mesh where data is interpolated (:class:`Mesh3D` or shape of the FFT box).
+            inspace: string specifying if data is given in real space "r" or in reciprocal space "g".
+
+        Return:
+            Numpy array in real space on the new_mesh
+        """
+        assert inspace in ("r", "g")
+        new_shape = tuple(new_mesh.shape if hasattr(new_mesh, "shape") else new_mesh)
+        new_size = np.prod(new_shape)
+        axes = (-3, -2, -1)
+
+        if inspace == "r" and not np.iscomplexobj(data):
+            # Half-spectrum, insert data in the FFT box of the new mesh and FFT transform G --> R.
+            datag = self.fft_r2g_half(data)
+            intp_datag = self.transfer_g(datag, new_shape, half=True)
+            return get_fft_engine().rbackward(intp_datag, new_shape)
+
+        # Insert data in the FFT box of new mesh.
+        datag = self.fft_r2g(data) if inspace == "r" else data
+        intp_datag = self.transfer_g(datag, new_shape)
+
+        # FFT transform G --> R.
+        return ifftn(intp_datag, axes=axes) * new_size
 
     def integrate(self, fr):
         """
@@ -286,6 +665,81 @@ class Mesh3D(object):
         else:
             raise NotImplementedError("ndim < 3 are not supported")
 
+    def get_g1d(self, half=False):
+        """
+        Return list with the three 1D arrays of reduced coordinates of the G-vectors
+        along the directions of the FFT box (FFT ordering: 0, 1, ..., -2, -1).
+        If half, only the first nz//2+1 frequencies are returned along z (see :meth:`fft_r2g_half`).
+        """
+        g1d = [np.rint(fftfreq(n) * n).astype(np.int) for n in self.shape]
+        if half: g1d[2] = g1d[2][:self.nz // 2 + 1]
+        return g1d
+
+    def get_gvecs(self, dtype=np.int, half=False):
+        """
+        [size, 3] array with the reduced coordinates of the G-vectors of the FFT box. C-ordering, x is the slowest index.
+
+        Args:
+            dtype: Type of the output array (e.g. np.int32 to save memory).
+            half: True for the G-vectors of the half-spectrum [nx * ny * (nz//2+1), 3].
+        """
+        shape = self.half_shape if half else self.shape
+        gvecs = np.empty(shape + (3,), dtype=dtype)
+        gx, gy, gz = self.get_g1d(half=half)
+        gvecs[..., 0] = gx[:, None, None]
+        gvecs[..., 1] = gy[None, :, None]
+        gvecs[..., 2] = gz[None, None, :]
+        return np.reshape(gvecs, (-1, 3))
+
+    def get_g2(self, dtype=np.float, shape3d=False, half=False):
+        """
+        Array with :math:`|G|^2` in Angstrom^-2 computed from the three 1D arrays of reduced coordinates
+        with broadcasting. The [size, 3] array with the G-vectors is never allocated.
+
+        Args:
+            dtype: Type of the output array (e.g. np.float32 to save memory).
+            shape3d: If True, the array has shape [nx, ny, nz] else [size].
+            half: True for the G-vectors of the half-spectrum (shape [nx, ny, nz//2+1]).
+        """
+        gmet = (2 * np.pi) ** 2 * np.dot(self.inv_vectors.T, self.inv_vectors)
+        gx, gy, gz = [g.astype(dtype) for g in self.get_g1d(half=half)]
+        gx, gy, gz = gx[:, None, None], gy[None, :, None], gz[None, None, :]
+
+        # Accumulate the metric contributions in place. Temporaries are at most 2D.
+        shape = self.half_shape if half else self.shape
+        g2 = np.empty(shape, dtype=dtype)
+        g2[...] = gmet[0, 0] * gx ** 2
+        g2 += gmet[1, 1] * gy ** 2
+        g2 += gmet[2, 2] * gz ** 2
+        g2 += 2 * gmet[0, 1] * gx * gy
+        g2 += 2 * gmet[0, 2] * gx * gz
+        g2 += 2 * gmet[1, 2] * gy * gz
+
+        return g2 if shape3d else np.reshape(g2, -1)
+
+    def get_gmods(self, dtype=np.float, shape3d=False, half=False):
+        """
+        Array with :math:`|G|` in Angstrom^-1. See :meth:`get_g2` for the meaning of the arguments.
+        """
+        g2 = self.get_g2(dtype=dtype, shape3d=shape3d, half=half)
+        # Clip negative values produced by rounding errors before the in-place sqrt.
+        np.maximum(g2, 0, out=g2)
+        return np.sqrt(g2, out=g2)
+
+    def get_rpoints(self, dtype=np.float):
+        """
+        [size, 3] array with the points of the mesh in reduced coordinates. C-ordering, x is the slowest index.
+
+        Args:
+            dtype: Type of the output array (e.g. np.float32 to save memory).
+        """
+        rpoints = np.empty(self.shape + (3,), dtype=dtype)
+        rx, ry, rz = [np.arange(n, dtype=dtype) / n for n in self.shape]
+        rpoints[..., 0] = rx[:, None, None]
+        rpoints[..., 1] = ry[None, :, None]
+        rpoints[..., 2] = rz[None, None, :]
+        return np.reshape(rpoints, (self.size, 3))
+
     @lazy_property
     def gvecs(self):
         """
@@ -298,31 +752,22 @@ class Mesh3D(object):
             These vectors differ from the gvecs stored in `GSphere` that
             are k-centered and enclosed by a sphere whose radius is defined by ecut.
         """
-        gx_list = np.rint(fftfreq(self.nx) * self.nx)
-        gy_list = np.rint(fftfreq(self.ny) * self.ny)
-        gz_list = np.rint(fftfreq(self.nz) * self.nz)
-        #print(gz_list, gy_list, gx_list)
-
-        gvecs = np.empty((self.size, 3), dtype=np.int)
-
-        idx = -1
-        for gx in gx_list:
-            for gy in gy_list:
-                for gz in gz_list:
-                    idx += 1
-                    gvecs[idx, :] = gx, gy, gz
-
-        return gvecs
+        return self.get_gvecs()
 
     @lazy_property
     def gmods(self):
         """[ng] array with |G|"""
-        gmet = np.dot(self.inv_vectors.T, self.inv_vectors)
-        gmods = np.empty(self.size)
-        for i, g in enumerate(self.gvecs):
-            gmods[i] = np.dot(g, np.dot(gmet, g))
+        return self.get_gmods()
 
-        return 2 * np.pi * np.sqrt(gmods)
+    @lazy_property
+    def gvecs_half(self):
+        """Reduced coordinates of the G-vectors of the half-spectrum. See :meth:`fft_r2g_half`."""
+        return self.get_gvecs(half=True)
+
+    @lazy_property
+    def gmods_half(self):
+        """Array with |G| for the G-vectors of the half-spectrum."""
+        return self.get_gmods(half=True)
 
     #@lazy_property
     #def gmax(self)
@@ -331,13 +776,7 @@ class Mesh3D(object):
     @lazy_property
     def rpoints(self):
         """Array with the points in real space in reduced coordinates."""
-        nx, ny, nz = self.nx, self.ny, self.nz
-        rpoints = np.empty((self.size, 3))
-
-        for ifft, p1_fft in enumerate(iproduct(range(nx), range(ny), range(nz))):
-            rpoints[ifft,:] = p1_fft[0]/nx, p1_fft[1]/ny, p1_fft[2]/nz
-
-        return rpoints
+        return self.get_rpoints()
 
     #def ogrid_rfft(self):
     #    return np.ogrid[0:1:1/self.nx,
@@ -387,72 +826,118 @@ class Mesh3D(object):
     #    else:
     #        raise ValueError("Wrong plane %s" % plane)
 
-    #def irottable(self, symmops):
-    #    nsym = len(symmops)
-    #    nx, ny, nz = self.nx, self.ny, self.nz
+    @lazy_property
+    def _irottable_cache(self):
+        """Cache with the tables computed by `get_irottable`. Keys: (space, bytes of the operations)."""
+        return {}
+
+    def is_symmetry_compatible(self, symmops, atol=1e-6):
+        """
+        True if the real-space FFT mesh is compatible with `symmops` i.e. if all the points
+        :math:`R^{-1}(r - \tau)` belong to the mesh so that `get_irottable(symmops, space="r")` can be used.
+        """
+        try:
+            self._get_symmetry_fft(symmops, "r", atol)
+            return True
+        except ValueError:
+            return False
+
+    def _get_symmetry_fft(self, symmops, space, atol):
+        """
+        Return the integer matrices (nsym, 3, 3) and the integer shifts (nsym, 3) defining the symmetry
+        operations in the basis of the FFT grid (real space) or of the G-vectors (reciprocal space).
+        Raise `ValueError` if the mesh is not compatible with the operations.
+        """
+        ndivs = np.array(self.shape, dtype=np.int)
+        if space == "r":
+            # R^{-1} and tau in the basis of the FFT grid.
+            mats = np.reshape([op.rotm1_r for op in symmops], (-1, 3, 3)) * ndivs[None, :, None] / ndivs[None, None, :]
+            shifts = np.reshape([op.tau for op in symmops], (-1, 3)) * ndivs
+        elif space == "g":
+            # R^t maps G onto the G-vectors of the box if n_i divides R^t_ij n_j (tau enters only via the phases).
+            mats = np.reshape([op.rot_r.T for op in symmops], (-1, 3, 3))
+            ratios = mats * ndivs[None, None, :] / ndivs[None, :, None]
+            if not np.allclose(ratios, np.rint(ratios), atol=atol):
+                raise ValueError("FFT mesh %s is not compatible with the symmetry operations" % str(self.shape))
+            shifts = np.zeros((len(mats), 3))
+        else:
+            raise ValueError("Wrong space: %s" % str(space))
+
+        if not (np.allclose(mats, np.rint(mats), atol=atol) and np.allclose(shifts, np.rint(shifts), atol=atol)):
+            raise ValueError("FFT mesh %s is not compatible with the symmetry operations" % str(self.shape))
+
+        return np.array(np.rint(mats), dtype=np.int), np.array(np.rint(shifts), dtype=np.int) % ndivs
+
+    def get_irottable(self, symmops, space="r", atol=1e-6):
+        r"""
+        Return the integer array irottable[nsym, nfft] with the (C-ordered) linear indices of the rotated
+        points of the FFT box for all the operations in `symmops`. The table is computed with integer arithmetic
+        and cached in the mesh.
+
+        If space == "r", irottable gives the index of :math:`R^{-1}(r - \tau)` (same convention as
+        :meth:`SymmOp.rotate_r`) so that f(R^{-1}(r - tau)) = f.ravel()[irottable[isym]].
+        If space == "g", irottable gives the index of :math:`R^t G` so that the Fourier components
+        of f(R^{-1}(r - tau)) are f_G.ravel()[irottable[isym]] * exp(-i 2pi G.tau) (see `get_tnons_phases`).
+        This is the only option if the fractional translations are not compatible with the real-space mesh.
+
+        Args:
+            symmops: Sequence of :class:`SymmOp` e.g. `spacegroup.symmops(time_sign=+1)`.
+            space: "r" for real space, "g" for reciprocal space.
+            atol: Tolerance used to check that the mesh is compatible with the symmetries.
 
-    #    red2fft = np.diag([nx, ny, nz])
-    #    fft2red = np.diag([1/nx, 1/ny, 1/nz])
-
-    #    # For a fully compatible mesh, each mat in rotsm1_fft should be integer
-    #    rotsm1_fft, tnons_fft = np.empty((nsym, 3, 3)), np.empty((nsym, 3))
-
-    #    for isym, symmop in enumerate(symmops):
-    #        rotm1_r, tau = symmop.rotm1_r, symmop.tau
-    #        rotsm1_fft[isym] = np.dot(np.dot(red2fft, rotm1_r), fft2red)
-    #        tnons_fft[isym] = np.dot(red2fft, tau)
-
-    #    # Indeces of $R^{-1}(r-\tau)$ in the FFT box.
-    #    irottable = np.empty((nsym, nx*ny*nz), dtype=np.int)
-
-    #    #max_err = 0.0
-    #    nxyz = np.array((nx, ny, nz), np.int)
-    #    for isym in range(nsym):
-    #        rm1_fft = rotsm1_fft[isym]
-    #        tau_fft = tnons_fft[isym]
-    #        for ifft, p1_fft in enumerate(iproduct(range(nx), range(ny), range(nz))):
-    #            # Form R^-1 (r-\tau) in the FFT basis.
-    #            p1_fft = np.array(p1_fft)
-    #            prot_fft = np.dot(rm1_fft, p1_fft - tau_fft)
-    #            #err = ABS(prot_fft - (ix, iy, iz)) / (nx, ny, nz)
-    #            prot_fft = np.round(prot_fft)
-    #            jx, jy, jz = prot_fft % nxyz
-    #            irottable[isym, ifft] = jz + (jy * nz) + (jx * nx * ny)
-
-    #    # Test
-    #    #for isym in range(nsym):
-    #    #    irottable[isym, ifft]
-    #    #    rm1_fft = rotsm1_fft[isym]
-    #    #    tau_fft = tnons_fft[isym]
-    #    #    for ifft, p1_fft in enumerate(itertools.product(range(nx), range(ny), range(nz))):
-    #    #        irot_fft == irottable[isym, ifft]
-
-    #    return irottable
+        Raises:
+            `ValueError` if the FFT mesh is not compatible with the symmetries.
+        """
+        mats, shifts = self._get_symmetry_fft(symmops, space, atol)
+
+        key = (space, mats.tobytes(), shifts.tobytes())
+        if key in self._irottable_cache:
+            return self._irottable_cache[key]
+
+        nsym = len(mats)
+        ndivs = self.shape
+        irottable = np.empty((nsym, self.size), dtype=np.int)
+        # Grid indices along the three directions, shaped for broadcasting.
+        igrid = np.ogrid[0:self.nx, 0:self.ny, 0:self.nz]
+        for isym in range(nsym):
+            jfft = [0, 0, 0]
+            for i in range(3):
+                for j in range(3):
+                    if mats[isym, i, j] != 0:
+                        jfft[i] = jfft[i] + mats[isym, i, j] * (igrid[j] - shifts[isym, j])
+                jfft[i] = np.asarray(jfft[i]) % ndivs[i]
+            irottable[isym] = ((jfft[0] * self.ny + jfft[1]) * self.nz + jfft[2] +
+                               np.zeros(self.shape, dtype=np.int)).ravel()
+
+        self._irottable_cache[key] = irottable
+        return irottable
+
+    def get_tnons_phases(self, symmop):
+        r"""
+        Return the phases :math:`e^{-i 2\pi G \cdot \tau}` for all the G-vectors of the box (C-order).
+        The phases are computed as the outer product of three 1D arrays.
+        """
+        phases = [np.exp(-2j * np.pi * g1d * symmop.tau[i]) for i, g1d in enumerate(self.get_g1d())]
+        return np.ravel(phases[0][:, None, None] * phases[1][None, :, None] * phases[2][None, None, :])
 
     def i_closest_gridpoints(self, points):
         """
         Given a list of points, this function return a numpy array with the indices of the closest gridpoint.
         """
-        points = np.reshape(points, (-1, 3))
-        inv_vectors = self.inv_vectors
-        fcoords = [np.dot(point, inv_vectors) for point in points]
-        inds = [[np.mod(int(np.rint(pc[ii]*self.shape[ii])), self.nx) for ii in range(3)] for pc in fcoords]
-        return np.array(inds)
+        return np.mod(self._i_closest_gridpoints_nowrap(points), self.shape)
 
-        # return [(int(np.rint(pc[ii]*self.nx)), int(np.rint(pc[0]*self.nx)),int(np.rint(pc[0]*self.nx))) for pc in coords]
-        # ix = int(np.rint(coords[0]*self.nx))
-        # iy = int(np.rint(coords[1]*self.ny))
-        # iz = int(np.rint(coords[2]*self.nz))
-        # return (ix, iy, iz)
+    def _i_closest_gridpoints_nowrap(self, points):
+        """
+        Indices of the closest gridpoints, without wrapping them inside the unit cell.
+        """
+        fcoords = np.dot(np.reshape(points, (-1, 3)), self.inv_vectors)
+        return np.array(np.rint(fcoords * self.shape), dtype=np.int)
 
-    # @DW TODO Add test.
-    def dist_gridpoints_in_spheres(self, points, radius):
-        # c_ab = np.cross(self.vectors[0], self.vectors[1])
-        # c_bc = np.cross(self.vectors[1], self.vectors[2])
-        # c_ca = np.cross(self.vectors[2], self.vectors[0])
-        # h_ab = np.abs(np.dot(c_ab, self.vectors[2]) / np.linalg.norm(c_ab))
-        # h_bc = np.abs(np.dot(c_bc, self.vectors[0]) / np.linalg.norm(c_bc))
-        # h_ca = np.abs(np.dot(c_ca, self.vectors[1]) / np.linalg.norm(c_ca))
+    def _sphere_box_bounds(self, radius):
+        """
+        Return the offsets (mins, maxes) with respect to the closest gridpoint defining the box of points
+        that must be considered to find all the points in a sphere of given radius.
+        """
         maxdiag = max([np.linalg.norm(self.dvx+self.dvy+self.dvz),
                        np.linalg.norm(self.dvx+self.dvy-self.dvz),
                        np.linalg.norm(self.dvx-self.dvy+self.dvz),
@@ -466,30 +951,62 @@ class Mesh3D(object):
         a_factor = 1.01 * (radius+0.5*maxdiag) / h_bc
         b_factor = 1.01 * (radius+0.5*maxdiag) / h_ca
         c_factor = 1.01 * (radius+0.5*maxdiag) / h_ab
-        # print('HEIGHTS')
-        # print(h_ab, h_bc, h_ca)
-        # print(c_factor*h_ab, a_factor* h_bc, b_factor*h_ca)
-        mins = np.array(np.floor([-a_factor, -b_factor, -c_factor]), dtype=int)
-        maxes = np.array(np.ceil([a_factor, b_factor, c_factor]), dtype=int)
-        # print('AAAMINS AND MAXES', mins, maxes)
-        # maxes = np.ceil(nmax)
-        i_closest_gridpoint_points = self.i_closest_gridpoints(points=points)
+        mins = np.array(np.floor([-a_factor, -b_factor, -c_factor]), dtype=np.int)
+        maxes = np.array(np.ceil([a_factor, b_factor, c_factor]), dtype=np.int)
+        return mins, maxes
+
+    def iter_gridpoints_in_sphere(self, point, radius, chunk_size=2**20, dtype=np.float):
+        """
+        Generate the gridpoints (periodic images included) inside the sphere centered on `point`.
+        The box enclosing the sphere is processed in blocks of planes along x
+        so that at most `chunk_size` points are treated at once.
+
+        Args:
+            point: Center of the sphere in cartesian coordinates.
+            radius: Radius of the sphere.
+            chunk_size: Maximum number of points in a block.
+            dtype: Floating point type used to compute the distances.
+
+        Yields:
+            (igp_uc, dist, igp) where `igp_uc` is a [n, 3] array with the indices of the points in the unit cell,
+            `dist` is the array with the distances from `point`and `igp` gives the indices
+            of the points without wrapping.
+        """
+        point = np.asarray(point, dtype=dtype)
+        mins, maxes = self._sphere_box_bounds(radius)
+        center = self._i_closest_gridpoints_nowrap(point)[0]
+        ioffs = [np.arange(center[i] + mins[i], center[i] + maxes[i]) for i in range(3)]
+        dvs = [np.asarray(dv, dtype=dtype) for dv in (self.dvx, self.dvy, self.dvz)]
+
+        # Contributions of the y and z indices to the cartesian coordinates: [ny, nz, 3]
+        ryz = ioffs[1][:, None, None] * dvs[1] + ioffs[2][None, :, None] * dvs[2] - point
+        nplanes = max(1, chunk_size // max(1, ryz.shape[0] * ryz.shape[1]))
+        r2 = radius ** 2
+
+        for start in range(0, len(ioffs[0]), nplanes):
+            ixs = ioffs[0][start:start + nplanes]
+            rdiff = ixs[:, None, None, None] * dvs[0] + ryz[None]
+            dist2 = np.sum(rdiff ** 2, axis=-1)
+            ix, iy, iz = np.nonzero(dist2 <= r2)
+            if len(ix) == 0: continue
+            igp = np.stack((ixs[ix], ioffs[1][iy], ioffs[2][iz]), axis=-1)
+            yield np.mod(igp, self.shape), np.sqrt(dist2[ix, iy, iz]), igp
+
+    def dist_gridpoints_in_spheres(self, points, radius):
+        """
+        Find the gridpoints inside the spheres centered on `points`.
+
+        Return:
+            List with one entry for each point. Each entry is a list of tuples
+            (igp_uc, dist, igp) with the indices of the gridpoint in the unit cell,
+            the distance from the point and the indices of the gridpoint without wrapping.
+            Use `iter_gridpoints_in_sphere` to get the same data in array form.
+        """
         dist_gridpoints_points = []
-        r2 = radius**2
-        for ipoint, point_i_closest_gridpoint in enumerate(i_closest_gridpoint_points):
-            pp = points[ipoint]
+        for pp in np.reshape(points, (-1, 3)):
             dist_gridpoints = []
-            for ix in range(int(mins[0]), int(maxes[0])):
-                ipx = point_i_closest_gridpoint[0] + ix
-                for iy in range(int(mins[1]), int(maxes[1])):
-                    ipy = point_i_closest_gridpoint[1] + iy
-                    for iz in range(int(mins[2]), int(maxes[2])):
-                        ipz = point_i_closest_gridpoint[2] + iz
-                        gp = ipx*self.dvx + ipy * self.dvy + ipz * self.dvz
-                        dist2_gp_pp = np.dot(pp-gp, pp-gp)
-                        if dist2_gp_pp <= r2:
-                            dist_gridpoints.append(((np.mod(ipx, self.nx), np.mod(ipy, self.ny), np.mod(ipz, self.nz)),
-                                                    np.sqrt(dist2_gp_pp), (ipx, ipy, ipz)))
+            for igp_uc, dist, igp in self.iter_gridpoints_in_sphere(pp, radius):
+                dist_gridpoints.extend(zip(map(tuple, igp_uc), dist, map(tuple, igp)))
             dist_gridpoints_points.append(dist_gridpoints)
         return dist_gridpoints_points
 
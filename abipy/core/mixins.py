@@ -159,6 +159,17 @@ class AbinitNcFile(_File):
         """Returns a string with the output of ncdump."""
         return NcDumper(*nc_args, **nc_kwargs).dump(self.filepath)
 
+    def set_handle_pool(self, pool):
+        """
+        Register the netCDF readers of the object in `pool` (:class:`NcHandlePool`).
+        The file is closed when the capacity of the pool is exceeded and reopened on demand.
+        None to disable pooling.
+        """
+        from abipy.iotools import ETSF_Reader
+        for obj in list(self.__dict__.values()):
+            if isinstance(obj, ETSF_Reader):
+                obj.set_handle_pool(pool)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class AbinitFortranFile(_File):
@@ -4,16 +4,18 @@ Shankland-Koelling-Wood Fourier interpolation scheme.
 """
 from __future__ import print_function, division, unicode_literals, absolute_import
 
-import itertools
+import os
+import hashlib
+import tempfile
 import pickle
 import numpy as np
 import scipy
 import time
 
-from collections import deque, OrderedDict
+from collections import OrderedDict
 from monty.collections import dict2namedtuple
 from pymatgen.util.plotting import add_fig_kwargs, get_ax_fig_plt
-from abipy.tools import gaussian
+from abipy.tools import gaussian, gaussians_sum, tetra_dos
 from abipy.core.kpoints import Ktables, Kpath
 from abipy.core.symmetries import mati3inv
 
@@ -71,46 +73,6 @@ def find_degs_sk(enesb, atol):
     return degs
 
 
-def map_bz2ibz(structure, ibz, ngkpt, has_timrev):
-    ngkpt = np.asarray(ngkpt, dtype=dp.int)
-
-    #ibz_grid = [k * ngkpt for k in ibz]
-    #ibz_grid = ibz[..., :] * ngkpt
-    #for i, k in enumerate(ibz_grid):
-    #    ibz_grid[ik] = ibz_grid[ik] % ngkpt
-
-    bzgrid2ibz = np.array(ngkpt.shape, dtype=np.int)
-    #for i, gp in enumerate(itertools.product(range(ngkpt[0] + 1), range(ngkpt[1] + 1), range(ngkpt[2] + 1))):
-    #      bzgrid2ibz[gp] = i
-
-    symrec_fm = structure.spacegroup.symrec
-    time_signs = (1, -1)
-
-    for ik_ibz, kibz in enumerate(ibz):
-        gp_ibz = np.rint(kibz * mesh)
-        rotated_gps = np.dot(symref_fm, gp_ibz).T
-        for tsign in tsigns:
-            if tsign == -1: rotated_gps = tsign * rotated_gps
-            for rot_gp in rotated_gps:
-                gp_bz = rot_gp % ngkpt
-                bzgrid2ibz[gp_bz] = ik_ibz
-
-    #bz2ibz = -np.ones(len(bz), dtype=np.int)
-    #from abipy.core.kpoints import issamek
-    #for ik_bz, kbz in enumerate(bz):
-    #    found = False
-    #    for ik_ibz, kibz in enumerate(ibz):
-    #        if found: break
-    #        for symmop in structure.spacegroup:
-    #            krot = symmop.rotate_k(kibz)
-    #            if issamek(krot, kbz):
-    #                bz2ibz[ik_bz] = ik_ibz
-    #                found = True
-    #                break
-
-    return bz2ibz
-
-
 class EDOS(object):
     def __init__(self, mesh, values, integral, is_shift, method, step, width):
         self.mesh, self.values, self.integral = mesh, values, integral
@@ -133,6 +95,10 @@ class ElectronInterpolator(object):
     # Disable cache
     use_cache = True
 
+    # Directory used to cache the R-points generating the stars (SkwInterpolator).
+    # The disk cache is disabled by default (None). Files are never removed by abipy.
+    rstar_cache_dir = None
+
     @classmethod
     def pickle_load(cls, filepath):
         """Loads the object from a pickle file."""
@@ -178,14 +144,7 @@ class ElectronInterpolator(object):
         bz = (grid + kshift) / mesh
 
         # All k-points and mapping to ir-grid points
-        bz2ibz = np.empty(len(bz), dtype=np.int)
-        for i, (ir_gp_id, gp) in enumerate(zip(mapping, grid)):
-            inds = np.where(uniq == ir_gp_id)
-            #print("inds", inds, "inds[0]", inds[0])
-            assert len(inds) == 1
-            bz2ibz[i] = inds[0]
-            #print("%3d ->%3d %s" % (i, ir_gp_id, (gp + [0.5, 0.5, 0.5]) / mesh))
-            #print("%3d ->%3d %s" % (i, ir_gp_id, (gp + kshift) / mesh))
+        bz2ibz = np.searchsorted(uniq, mapping)
 
         return dict2namedtuple(mesh=mesh, shift=kshift,
                                ibz=ibz, nibz=len(ibz), weights=weights,
@@ -286,6 +245,7 @@ class ElectronInterpolator(object):
             is_shift: three integers (spglib API). When is_shift is not None, the kmesh is shifted along
                 the axis in half of adjacent mesh points irrespective of the mesh numbers. None means unshited mesh.
             method: String defining the method for the computation of the DOS.
+                "gaussian" for gaussian broadening, "tetra" for the linear tetrahedron method.
             step: Energy step (eV) of the linear mesh.
             width: Standard deviation (eV) of the gaussian.
             mesh: Frequency mesh to use. If None, the mesh is computed automatically from the eigenvalues.
@@ -306,19 +266,25 @@ class ElectronInterpolator(object):
         nw = len(wmesh)
         values = np.zeros((self.nsppol, nw))
 
-        # TODO: Write cython version.
         if method == "gaussian":
             for spin in range(self.nsppol):
-                for ik, wtk in enumerate(k.weights):
-                    for band in range(self.nband):
-                        values[spin] += wtk * gaussian(wmesh, width, center=eigens[spin, ik, band])
+                weights = np.broadcast_to(k.weights[:, None], eigens[spin].shape)
+                values[spin] = gaussians_sum(wmesh, eigens[spin], width, weights=weights)
 
-            # Compute IDOS
-            integral = scipy.integrate.cumtrapz(values, x=wmesh, initial=0.0)
+        elif method == "tetra":
+            # Unfold the eigenvalues on the full k-grid.
+            grid_inds = tuple((k.grid % k.mesh).T)
+            for spin in range(self.nsppol):
+                eigens_grid = np.empty(tuple(k.mesh) + (self.nband,))
+                eigens_grid[grid_inds] = eigens[spin, k.bz2ibz]
+                values[spin] = tetra_dos(wmesh, eigens_grid)
 
         else:
             raise ValueError("Method %s is not supported" % method)
 
+        # Compute IDOS
+        integral = scipy.integrate.cumtrapz(values, x=wmesh, initial=0.0)
+
         return dict2namedtuple(mesh=wmesh, values=values, integral=integral)
         #return ElectronDos(wmesh, values, integral, is_shift, method, step, width)
 
@@ -354,12 +320,11 @@ class ElectronInterpolator(object):
         if self.occtype == "insulator":
             if method == "gaussian":
                 for spin in range(self.nsppol):
-                    for ik, wtk in enumerate(k.weights):
-                        for icb in range(self.val_ib + 1, self.nband):
-                            ec = eigens[spin, ik, icb]
-                            for icv in range(self.val_ib):
-                                ev = eigens[spin, ik, icv]
-                                values[spin] += wtk * gaussian(wmesh, width, center=ec-ev)
+                    ec = eigens[spin, :, self.val_ib + 1:]
+                    ev = eigens[spin, :, :self.val_ib]
+                    enes = ec[:, :, None] - ev[:, None, :]
+                    weights = np.broadcast_to(k.weights[:, None, None], enes.shape)
+                    values[spin] = gaussians_sum(wmesh, enes, width, weights=weights)
 
             else:
                 raise ValueError("Method %s is not supported" % method)
@@ -827,9 +792,7 @@ class SkwInterpolator(ElectronInterpolator):
 
         # Construct star functions for the ab-initio k-points.
         nsppol, nband, nkpt, nr = self.nsppol, self.nband, self.nkpt, self.nr
-        self.skr = np.empty((nkpt, nr), dtype=np.complex)
-        for ik, kpt in enumerate(kpts):
-            self.skr[ik] = self.get_stark(kpt)
+        self.skr = self.get_stark_batch(kpts)
 
         # Build H(k,k') matrix (Hermitian)
         hmat = np.empty((nkpt-1, nkpt-1), dtype=np.complex)
@@ -896,9 +859,10 @@ class SkwInterpolator(ElectronInterpolator):
 
         # Compare ab-initio data with interpolated results.
         mae = 0.0
+        skw_eigens = self._interp_kpts_batch(kpts)[0]
         for spin in range(nsppol):
             for ik, kpt in enumerate(kpts):
-                skw_eb = self.eval_sk(spin, kpt)
+                skw_eb = skw_eigens[spin, ik]
                 mae += np.abs(eigens[spin, ik] - skw_eb).sum()
                 if self.verbose >= 10:
                     # print interpolated eigenvales
@@ -936,15 +900,20 @@ class SkwInterpolator(ElectronInterpolator):
 
         return "\n".join(lines)
 
-    def interp_kpts(self, kfrac_coords, dk1=False, dk2=False):
+    def interp_kpts(self, kfrac_coords, dk1=False, dk2=False, kchunk=None):
         """
         Interpolate energies on an arbitrary set of k-points. Optionally, compute
         gradients and Hessian matrices.
 
+        Energies and gradients are computed in blocks of k-points: the star functions of the block
+        are evaluated as a single [nk, nr] matrix that is multiplied by the coefficients with one GEMM.
+
         Args:
             kfrac_coords: K-points in reduced coordinates.
             dk1 (bool): True if gradient is wanted.
             dk2 (bool): True to compute 2nd order derivatives.
+            kchunk: Number of k-points treated in a block. Used to limit the memory required
+                by the [kchunk, nr] work arrays. None to use an automatic value.
 
         Return:
             namedtuple with:
@@ -963,12 +932,16 @@ class SkwInterpolator(ElectronInterpolator):
         dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3))
         dedk2 = None if not dk2 else np.empty((self.nsppol, new_nkpt, self.nband, 3, 3))
 
-        der1, der2 = None, None
-        for spin in range(self.nsppol):
-            for ik, newk in enumerate(kfrac_coords):
-                if dk1: der1 = dedk[spin, ik]
-                if dk2: der2 = dedk2[spin, ik]
-                new_eigens[spin, ik] = self.eval_sk(spin, newk, der1=der1, der2=der2)
+        if not dk2:
+            new_eigens, dedk = self._interp_kpts_batch(kfrac_coords, dk1=dk1, kchunk=kchunk)
+        else:
+            # 2nd order derivatives are computed one k-point at a time.
+            der1, der2 = None, None
+            for spin in range(self.nsppol):
+                for ik, newk in enumerate(kfrac_coords):
+                    if dk1: der1 = dedk[spin, ik]
+                    if dk2: der2 = dedk2[spin, ik]
+                    new_eigens[spin, ik] = self.eval_sk(spin, newk, der1=der1, der2=der2)
 
         if self.verbose:
             print("Interpolation completed", time.time() - start)
@@ -1076,6 +1049,115 @@ class SkwInterpolator(ElectronInterpolator):
 
     #    return oeig, der1, der2
 
+    def _interp_kpts_batch(self, kfrac_coords, dk1=False, kchunk=None):
+        """
+        Interpolate energies (and gradients if dk1) for all the k-points in `kfrac_coords`
+        processing blocks of `kchunk` k-points.
+
+        Return:
+            (eigens[nsppol, nk, nband], dedk[nsppol, nk, nband, 3]). dedk is None if not dk1.
+        """
+        kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
+        nk = len(kfrac_coords)
+        if kchunk is None:
+            # Limit the size of the [kchunk, nr] work arrays to ~32 Mb.
+            kchunk = max(1, 2**21 // self.nr)
+
+        dtype = np.complex if self.iscomplexobj else np.float
+        eigens = np.empty((self.nsppol, nk, self.nband), dtype=dtype)
+        dedk = None if not dk1 else np.empty((self.nsppol, nk, self.nband, 3), dtype=dtype)
+
+        # coefs are stored as [nsppol, nband, nr] --> transpose so that we can use [nk, nr] x [nr, nband]
+        coefs_t = np.transpose(self.coefs, (0, 2, 1))
+        for start in range(0, nk, kchunk):
+            stop = min(start + kchunk, nk)
+            kpts = kfrac_coords[start:stop]
+            skr = self.get_stark_batch(kpts)
+            skr_dk1 = self.get_stark_dk1_batch(kpts) if dk1 else None
+            for spin in range(self.nsppol):
+                value = np.matmul(skr, coefs_t[spin])
+                eigens[spin, start:stop] = value if self.iscomplexobj else value.real
+                if dk1:
+                    for ii in range(3):
+                        value = np.matmul(skr_dk1[ii], coefs_t[spin])
+                        dedk[spin, start:stop, :, ii] = value if self.iscomplexobj else value.real
+
+        return eigens, dedk
+
+    def _get_star_ops(self):
+        """
+        Return the rotations used to compute the star functions in batched mode and a boolean flag.
+        If the point group contains the inversion (always the case if time-reversal is used),
+        the flag is True and only half of the operations is returned as S and -S give complex conjugate terms.
+        """
+        symrel = self.ptg_symrel
+        nsym = len(symrel)
+        half, done = [], np.zeros(nsym, dtype=np.bool)
+        for isym in range(nsym):
+            if done[isym]: continue
+            done[isym] = True
+            inv = [jsym for jsym in range(nsym) if not done[jsym] and np.all(symrel[jsym] == -symrel[isym])]
+            if not inv:
+                return symrel, False
+            done[inv[0]] = True
+            half.append(symrel[isym])
+
+        return np.array(half), True
+
+    def get_stark_batch(self, kpts):
+        """
+        Return the star functions for a block of k-points.
+
+        Args:
+            kpts: [nk, 3] array with k-points in reduced coordinates.
+
+        Return:
+            complex array of shape [nk, self.nr]
+        """
+        kpts = np.reshape(kpts, (-1, 3))
+        ops, use_cos = self._get_star_ops()
+        # k.(S R) for all S, and R: S^T k . R = k . S R
+        skr = np.zeros((len(kpts), self.nr), dtype=np.float if use_cos else np.complex)
+        for omat in ops:
+            arg = 2.0 * np.pi * np.matmul(kpts, np.matmul(omat, self.rpts.T))
+            if use_cos:
+                skr += np.cos(arg)
+            else:
+                skr += np.exp(1.j * arg)
+
+        skr *= (2.0 if use_cos else 1.0) / self.ptg_nsym
+        return skr.astype(np.complex) if use_cos else skr
+
+    def get_stark_dk1_batch(self, kpts):
+        """
+        Compute the 1st-order derivative of the star functions wrt k for a block of k-points.
+        Same conventions as :meth:`get_stark_dk1`.
+
+        Args:
+            kpts: [nk, 3] array with k-points in reduced coordinates.
+
+        Return:
+            complex array [3, nk, self.nr]
+        """
+        kpts = np.reshape(kpts, (-1, 3))
+        ops, use_cos = self._get_star_ops()
+        srk_dk1 = np.zeros((3, len(kpts), self.nr), dtype=np.float if use_cos else np.complex)
+        for omat in ops:
+            srpts = np.matmul(omat, self.rpts.T)
+            arg = 2.0 * np.pi * np.matmul(kpts, srpts)
+            # exp(i a) SR + exp(-i a) (-SR) = 2i sin(a) SR
+            fact = np.sin(arg) if use_cos else np.exp(1.j * arg)
+            for ii in range(3):
+                srk_dk1[ii] += fact * srpts[ii]
+
+        if use_cos:
+            # 1j * 2j / nsym = -2 / nsym
+            srk_dk1 *= -2.0 / self.ptg_nsym
+            return srk_dk1.astype(np.complex)
+        else:
+            srk_dk1 *= 1.j / self.ptg_nsym
+            return srk_dk1
+
     def get_stark(self, kpt):
         """
         Return the star function for k-point `kpt`.
@@ -1174,7 +1256,9 @@ class SkwInterpolator(ElectronInterpolator):
 
     def _find_rstar_gen(self, nrwant, rmax):
         """
-        Find all lattice points generating the stars inside the supercell defined by `rmax`
+        Find all lattice points generating the stars inside the supercell defined by `rmax`.
+        Results are cached on disk in `self.rstar_cache_dir` (if not None) and the cache
+        is keyed by (metric, point group, nrwant, rmax).
 
         Args:
             nrwant: Number of star-functions required.
@@ -1183,92 +1267,101 @@ class SkwInterpolator(ElectronInterpolator):
         Returns:
             tuple: (rpts, r2vals, ok)
         """
-        msize = (2 * rmax + 1).prod()
-        rtmp = np.empty((msize, 3), dtype=np.int)
-        r2tmp = np.empty(msize)
-        if self.verbose: print("rmax", rmax, "msize:", msize)
+        cache_path = self._get_rstar_cache_path(nrwant, rmax)
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as data:
+                    if self.verbose: print("Reading R-stars from cache file:", cache_path)
+                    return data["rpts"], data["r2vals"], bool(data["ok"])
+            except Exception as exc:
+                if self.verbose: print("Ignoring corrupted cache file:", cache_path, "\n", str(exc))
+
+        rpts, r2vals, ok = self._compute_rstar_gen(nrwant, rmax)
+
+        if cache_path is not None:
+            try:
+                dirpath = os.path.dirname(cache_path)
+                if not os.path.exists(dirpath): os.makedirs(dirpath)
+                # Write to a temporary file and rename it so that concurrent processes never read partial files.
+                fd, tmp_path = tempfile.mkstemp(suffix=".npz", dir=dirpath)
+                with os.fdopen(fd, "wb") as fh:
+                    np.savez(fh, rpts=rpts, r2vals=r2vals, ok=ok)
+                os.rename(tmp_path, cache_path)
+            except (IOError, OSError) as exc:
+                if self.verbose: print("Cannot write R-stars to cache file:", cache_path, "\n", str(exc))
+
+        return rpts, r2vals, ok
+
+    def _get_rstar_cache_path(self, nrwant, rmax):
+        """
+        Return the path of the file used to cache the output of `_compute_rstar_gen`. None if cache is disabled.
+        """
+        if self.rstar_cache_dir is None: return None
+        h = hashlib.sha1()
+        h.update(np.round(self.rmet, decimals=8).astype(np.float64).tobytes())
+        h.update(np.asarray(self.ptg_symrel, dtype=np.int64).tobytes())
+        h.update(np.asarray(rmax, dtype=np.int64).tobytes())
+        h.update(str(int(nrwant)).encode("ascii"))
+        return os.path.join(self.rstar_cache_dir, "rstars_%s.npz" % h.hexdigest())
+
+    def _compute_rstar_gen(self, nrwant, rmax):
+        """
+        Find all lattice points generating the stars inside the supercell defined by `rmax`.
+        Same signature as `_find_rstar_gen` but without disk cache.
 
+        All the points in the box are sorted by length, then each R is associated to its star via
+        a canonical representative, i.e. the smallest integer key among the images S R.
+        The generator of the star is the first point of the star in the sorted list.
+        """
         start = time.time()
-        for cnt, l in enumerate(itertools.product(range(-rmax[0], rmax[0] + 1),
-            range(-rmax[1], rmax[1] + 1), range(-rmax[2], rmax[2] + 1))):
-              rtmp[cnt] = l
-              r2tmp[cnt] = np.dot(l, np.matmul(self.rmet, l))
+        rmax = np.asarray(rmax, dtype=np.int)
+        # Points in the box with the same ordering as itertools.product.
+        rtmp = np.indices(2 * rmax + 1).reshape(3, -1).T - rmax
+        msize = len(rtmp)
+        if self.verbose: print("rmax", rmax, "msize:", msize)
+        r2tmp = np.einsum("ri,ij,rj->r", rtmp, self.rmet, rtmp)
         if self.verbose: print("gen points", time.time() - start)
 
-        start = time.time()
         # Sort r2tmp and rtmp
+        start = time.time()
         iperm = np.argsort(r2tmp)
         r2tmp = r2tmp[iperm]
         rtmp = rtmp[iperm]
-        #return rtmp, r2tmp, True
-
-        # Find shells
-        r2sh = np.empty(msize, dtype=np.int)    # Correspondence between R and shell index.
-        shlim = np.empty(msize, dtype=np.int)   # For each shell, the index of the initial G-vector.
-        nsh = 1
-        r2sh[0] = 0
-        shlim[0] = 0
-        r2_prev = 0.0
-        for ir in range(1, msize):
-            if (abs(r2tmp[ir] - r2_prev) > r2tmp[ir] * 1e-8):
-                r2_prev = r2tmp[ir]
-                shlim[nsh] = ir
-                nsh += 1
-            r2sh[ir] = nsh
-        shlim[nsh] = msize
         if self.verbose:
+            nsh = 1 + np.count_nonzero(np.abs(np.diff(r2tmp)) > r2tmp[1:] * 1e-8)
             print("nshells", nsh)
             print("shells", time.time() - start)
 
         # Find R-points generating the stars.
-        # This is the most CPU critical part. I think it's difficult to do better than this without cython
-        start = time.time()
-        rgen = deque()
-
-        for ish in range(nsh):
-            ss, ee = shlim[ish], shlim[ish + 1]
-            if ss + 1 == ee:
-                rgen.append(rtmp[ss])
-                continue
-
-            if True:
-                # This is faster
-                rs = set([tuple(rtmp[ss])])
-                for ir in range(ss + 1, ee):
-                    rvec = rtmp[ir]
-                    if all(tuple(np.matmul(rot, rvec)) not in rs for rot in self.ptg_symrel):
-                        rs.add(tuple(rvec))
-            else:
-                rs = deque([rtmp[ss]])
-                for ir in range(ss + 1, ee):
-                    for rot in self.ptg_symrel:
-                        rot_r = np.matmul(rot, rtmp[ir])
-                        if any(np.all(rot_r == x) for x in rs): break
-                    else:
-                        # We have new R-point.
-                        #print("Adding new point")
-                        rs.append(rtmp[ir])
-
-            #print(len(rs), rs)
-            rgen.extend(rs)
-        #print(rgen)
-        if self.verbose: print("stars", time.time() - start)
-
+        # Encode S R as an integer in [0, base**3), the canonical key of R is min_S key(S R).
         start = time.time()
-        rgen = np.array(rgen, dtype=np.int)
+        symrel = np.asarray(self.ptg_symrel, dtype=np.int)
+        bound = int(np.abs(symrel).sum(axis=2).max() * rmax.max()) + 1
+        base = 2 * bound + 1
+        weights = np.array([base ** 2, base, 1], dtype=np.int64)
+        keys = np.empty(msize, dtype=np.int64)
+        # Process points in blocks to limit the memory for the [nsym, npts, 3] images.
+        chunk = max(1, 2**21 // len(symrel))
+        for ss in range(0, msize, chunk):
+            ee = min(ss + chunk, msize)
+            images = np.matmul(symrel, rtmp[ss:ee].T) + bound
+            keys[ss:ee] = np.einsum("i,sir->sr", weights, images).min(axis=0)
+
+        # First occurrence of each star in the sorted list.
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        rgen = rtmp[first]
         nstars = len(rgen)
+        if self.verbose: print("stars", time.time() - start)
 
         # Store rpts and compute ||R||**2.
         ok = nstars >= nrwant
         nr = min(nstars, nrwant)
         rpts = rgen[:nr].copy()
-        r2vals = np.empty(nr)
-        for ir in range(nr):
-            r2vals[ir] = np.dot(rpts[ir], np.matmul(self.rmet, rpts[ir]))
+        r2vals = r2tmp[first[:nr]].copy()
 
         if self.verbose:
             print("r2max ", rpts[nr-1])
-            print("end ", time.time() - start)
             if self.verbose > 10:
                 print("nstars:", nstars)
                 for r, r2 in zip(rpts, r2vals):
@@ -334,22 +334,17 @@ class SymmOp(Operation, SlotPickleMixin):
 
         return wrap_in_ucell(rotm1_rmt) if in_ucell else rotm1_rmt
 
-    #def rotate_gvecs(self, gvecs):
-    #    """
-    #    Apply the symmetry operation to the list of gvectors gvecs in reduced coordinates.
-
-    #    Args:
-    #        gvecs: `ndarray` with shape [ng, 3] containing the reduced coordinates of the G-vectors.
-
-    #    Returns:
-    #        rot_gvecs: `ndarray` with shape [ng, 3] containing the result of self(G).
-    #    """
-    #    rot_gvecs = np.empty_like(gvecs)
+    def rotate_gvecs(self, gvecs):
+        """
+        Apply the symmetry operation to the list of gvectors gvecs in reduced coordinates.
 
-    #    for ig, gvec in enumerate(gvecs):
-    #        rot_gvecs[ig] = np.dot(self.rot_g, gvec) * self.time_sign
+        Args:
+            gvecs: `ndarray` with shape [ng, 3] containing the reduced coordinates of the G-vectors.
 
-    #    return rot_gvecs
+        Returns:
+            rot_gvecs: `ndarray` with shape [ng, 3] containing the result of self(G).
+        """
+        return np.dot(gvecs, self.rot_g.T) * self.time_sign
 
 
 class OpSequence(collections.Sequence):
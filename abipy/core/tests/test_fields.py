@@ -96,6 +96,9 @@ class TestScalarField(AbipyTest):
         assert not si_den.is_potential_like
 
         self.assert_almost_equal(si_den.mesh.fft_g2r(si_den.datag), si_den.datar)
+        assert si_den.is_real
+        self.assert_almost_equal(si_den.datag_half, si_den.datag[..., :si_den.mesh.half_shape[2]])
+        self.assert_almost_equal(si_den.mesh.fft_g2r_half(si_den.datag_half), si_den.datar)
 
         # Read data directly from file.
         with ETSF_Reader(abidata.ref_file("si_DEN.nc")) as r:
@@ -110,6 +113,12 @@ class TestScalarField(AbipyTest):
         totden = si_den.total_rhor_as_density()
         self.assert_equal(totden.datar.flatten(), si_den.total_rhor.flatten())
 
+        # The density computed by Abinit is already symmetric.
+        sym_den = si_den.symmetrize()
+        assert sym_den.__class__ is si_den.__class__ and sym_den.mesh == si_den.mesh
+        self.assert_almost_equal(sym_den.get_nelect(), ne)
+        assert np.abs(sym_den.datar - si_den.datar).max() < 1e-3 * si_den.datar.max()
+
         other = si_den - si_den
         assert other.nspden == si_den.nspden
         self.assert_equal(other.datar, 0)
@@ -129,6 +138,38 @@ class TestScalarField(AbipyTest):
         self.assert_almost_equal(df["ntot"].values, 2 * [2.010537])
         self.assert_almost_equal(df["rsph_ang"].values, 2 * [1.11])
         df = si_den.integrate_in_spheres(rcut_symbol=2, out=False)
+        # Radius scan: same results as the calls with a single radius.
+        df_scan = si_den.integrate_in_spheres(rcut_symbol=[1.11, 2], chunk_size=100)
+        assert len(df_scan) == 2 * len(si_den.structure)
+        self.assert_almost_equal(df_scan["ntot"].values[:2], 2 * [2.010537])
+        self.assert_almost_equal(df_scan["ntot"].values[2:], df["ntot"].values)
+        self.assert_almost_equal(df_scan["rsph_ang"].values, [1.11, 1.11, 2, 2])
+        df_gcut = si_den.integrate_in_spheres(rcut_symbol=2, gcut=1000)
+        self.assert_almost_equal(df_gcut["ntot"].values, df["ntot"].values)
+
+        # Fourier interpolation on a denser mesh and back.
+        dense_den = si_den.fourier_interp((24, 24, 24))
+        assert isinstance(dense_den, Density) and dense_den.mesh.shape == (24, 24, 24)
+        self.assert_almost_equal(dense_den.get_nelect(), ne)
+        self.assert_almost_equal(dense_den.fourier_interp(si_den.mesh).datar, si_den.datar)
+
+        # Memory-mapped density: same results but the operations are performed out of core.
+        lazy_den = Density.from_file(abidata.ref_file("si_DEN.nc"), lazy=True)
+        assert lazy_den.is_lazy and not si_den.is_lazy
+        self.assert_almost_equal(lazy_den.datar, si_den.datar)
+        self.assert_almost_equal(lazy_den.datag, si_den.datag)
+        other = lazy_den - si_den
+        assert other.is_lazy
+        self.assert_almost_equal(other.datar, 0)
+        self.assert_almost_equal((lazy_den + 1.0).datar, si_den.datar + 1.0)
+        points = np.random.rand(10, 3)
+        self.assert_almost_equal(lazy_den.get_interpolator().eval_points(points),
+                                 si_den.get_interpolator().eval_points(points))
+        df = lazy_den.integrate_in_spheres(rcut_symbol=None)
+        self.assert_almost_equal(df["ntot"].values, 2 * [2.010537])
+        # Sum over the gridpoints inside the spheres: less accurate.
+        df = lazy_den.integrate_in_spheres(rcut_symbol=None, method="rspace")
+        assert np.all(np.abs(df["ntot"].values - 2.010537) < 0.1)
 
         if self.has_matplotlib():
             assert si_den.plot_line(0, 1, num=1000, show=False)
@@ -158,9 +199,24 @@ class TestScalarField(AbipyTest):
         assert total_den.structure == si_den.structure
         assert abs(total_den.get_nelect().sum() - ne) < 1e-3
 
-        # TODO@DW
-        #den.ae_core_density_on_mesh(cls, valence_density, structure, rhoc_files, maxr=2.0, nelec=None,
-        #                        method='mesh3d_dist_gridpoints', small_dist_mesh=(8, 8, 8), small_dist_factor=1.5):
+        # Read the CUBE file in a memory-mapped array.
+        mmap = np.lib.format.open_memmap(self.get_tmpname(suffix=".npy"), mode="w+", shape=si_den.mesh.shape)
+        mmap_den = Density.from_cube(tmp_cubefile, out=mmap)
+        assert np.may_share_memory(mmap_den.datar, mmap)
+        self.assert_almost_equal(mmap_den.datar, total_den.datar)
+
+        # Core density from a model rhoc file: compare the vectorized engine with the reference implementation.
+        rhoc_path = self.get_tmpname(text=True)
+        rr = np.linspace(0, 6, num=300)
+        np.savetxt(rhoc_path, np.array([rr, 4 * np.pi * 10 * np.exp(-4 * rr ** 2)]).T)
+        kwargs = dict(rhoc_files={"Si": rhoc_path}, maxr=0.8, small_dist_mesh=(4, 4, 4), small_dist_factor=1.5)
+        core_den = Density.ae_core_density_on_mesh(si_den, si_den.structure, **kwargs)
+        ref_den = Density.ae_core_density_on_mesh(si_den, si_den.structure, method="get_sites_in_sphere", **kwargs)
+        self.assert_almost_equal(core_den.datar, ref_den.datar)
+        core_den32 = Density.ae_core_density_on_mesh(si_den, si_den.structure, dtype=np.float32, chunk_size=100, **kwargs)
+        assert core_den32.datar.dtype == np.float32
+        scale = core_den.datar.max()
+        self.assert_almost_equal(core_den32.datar / scale, core_den.datar / scale, decimal=4)
 
     def test_ni_density(self):
         """Testing density object (spin polarized, collinear)."""
@@ -177,6 +233,7 @@ class TestScalarField(AbipyTest):
         assert ni_den.is_collinear
         assert ni_den.structure.formula == "Ni1"
         assert ni_den.mesh.shape == (27, 27, 27)
+        self.assert_almost_equal(Density.from_file(abidata.ref_file("ni_666k_DEN.nc"), lazy=True).datar, ni_den.datar)
         assert ni_den.is_density_like
         assert not ni_den.is_potential_like
         ne = 18
@@ -43,6 +43,36 @@ class TestGSphere(AbipyTest):
         assert len(gsphere.empty()) == len(gsphere)
         assert len(gsphere.cempty()) == len(gsphere)
 
+    def test_indices_and_shells(self):
+        """G-vector lookup and shells of the G-sphere"""
+        lattice = np.eye(3)
+        gvecs = np.array([g for g in np.ndindex(5, 5, 5)]) - 2
+        np.random.shuffle(gvecs)
+        gsphere = GSphere(2, lattice, [0, 0, 0], gvecs, istwfk=1)
+
+        assert gsphere.box_index is gsphere.box_index
+        assert gsphere.kpg_norms is gsphere.kpg_norms
+        for ig in (0, 10, len(gvecs) - 1):
+            assert gsphere.index(gvecs[ig]) == ig
+            assert list(gvecs[ig]) in gsphere
+        assert [3, 0, 0] not in gsphere and [0.5, 0, 0] not in gsphere
+        with self.assertRaises(ValueError):
+            gsphere.index([3, 0, 0])
+
+        self.assert_equal(gsphere.indices(gvecs[::-1]), np.arange(len(gvecs))[::-1])
+        self.assert_equal(gsphere.indices([[0, 0, 0], [3, 0, 0]], strict=False)[1], -1)
+        with self.assertRaises(ValueError):
+            gsphere.indices([[0, 0, 0], [3, 0, 0]])
+
+        # Shells ordered by |k+G|: G = 0, then the 6 G-vectors of type (1, 0, 0) ...
+        shells = gsphere.get_shells()
+        assert len(shells.norms) == len(shells.shells)
+        assert np.all(np.diff(shells.norms) > 0)
+        assert [len(sh) for sh in shells.shells[:4]] == [1, 6, 12, 8]
+        self.assert_equal(gvecs[shells.shells[0][0]], [0, 0, 0])
+        self.assert_almost_equal(shells.norms[1], 1.0)
+        self.assert_equal(np.sort(np.concatenate(shells.shells)), np.arange(len(gvecs)))
+
     def test_fft(self):
         """FFT transforms"""
         rprimd = np.array([1.,0,0, 0,1,0, 0,0,1])
@@ -64,3 +94,79 @@ class TestGSphere(AbipyTest):
                 int_r = mesh.integrate(fr)
                 int_g = fg[...,0,0,0]
                 self.assert_almost_equal(int_r, int_g)
+
+    def test_fftmesh_transfer(self):
+        """Transfer of data between G-sphere and FFT mesh."""
+        rprimd = np.eye(3)
+        mesh = Mesh3D((6, 5, 7), rprimd)
+        gvecs = np.array([[0, 0, 0], [1, 0, 0], [-1, 2, 0], [2, -2, 3], [0, 1, -3]])
+        gsphere = GSphere(2, rprimd, [0, 0, 0], gvecs, istwfk=1)
+
+        # Multiple bands in a single call.
+        ug = np.random.random((4, gsphere.npw)) + 1j * np.random.random((4, gsphere.npw))
+        ug_mesh = gsphere.tofftmesh(mesh, ug)
+        assert ug_mesh.shape == (4,) + mesh.shape
+        for ib in range(4):
+            for ig, g in enumerate(gvecs):
+                assert ug_mesh[ib][tuple(g % mesh.shape)] == ug[ib, ig]
+        assert np.count_nonzero(ug_mesh) == ug.size
+        self.assert_equal(gsphere.fromfftmesh(mesh, ug_mesh), ug)
+        assert gsphere.tofftmesh(mesh, ug[0]).shape == mesh.shape
+        self.assert_equal(gsphere.fromfftmesh(mesh, ug_mesh[0].flatten()), ug[0])
+
+        # Tables are cached.
+        assert gsphere.get_fft_tables(mesh) is gsphere.get_fft_tables(mesh)
+        with self.assertRaises(ValueError):
+            gsphere.tofftmesh(Mesh3D((2, 2, 2), rprimd), ug)
+
+        # Time-reversal storage at Gamma: u(-G) = u(G)^*.
+        gvecs = np.array([[0, 0, 0], [1, 0, 0], [1, 2, 0], [2, -2, 3]])
+        gsphere = GSphere(2, rprimd, [0, 0, 0], gvecs, istwfk=2)
+        ug = np.random.random(gsphere.npw) + 1j * np.random.random(gsphere.npw)
+        ug[0] = ug[0].real
+        ug_mesh = gsphere.tofftmesh(mesh, ug)
+        for ig, g in enumerate(gvecs):
+            assert ug_mesh[tuple(g % mesh.shape)] == ug[ig]
+            assert ug_mesh[tuple(-g % mesh.shape)] == ug[ig].conjugate()
+        # The reconstructed function is real in r-space.
+        assert np.allclose(mesh.fft_g2r(ug_mesh).imag, 0)
+        self.assert_equal(gsphere.fromfftmesh(mesh, ug_mesh.flatten()), ug)
+
+        # istwfk 3: k = (1/2, 0, 0) --> u(-G-G0) = u(G)^* with G0 = (1, 0, 0)
+        gsphere = GSphere(2, rprimd, [0.5, 0, 0], gvecs, istwfk=3)
+        ug_mesh = gsphere.tofftmesh(mesh, ug)
+        for ig, g in enumerate(gvecs):
+            assert ug_mesh[tuple((-g - [1, 0, 0]) % mesh.shape)] == ug[ig].conjugate()
+
+        with self.assertRaises(ValueError):
+            GSphere(2, rprimd, [0, 0, 0], gvecs, istwfk=10)
+
+    def test_istwfk_roundtrip(self):
+        """Sphere --> box --> sphere for all the time-reversal storage options."""
+        rprimd = np.eye(3)
+        mesh = Mesh3D((8, 8, 8), rprimd)
+        # Abinit convention: istwfk --> k
+        istwfk2kpt = {2: [0, 0, 0], 3: [0.5, 0, 0], 4: [0, 0, 0.5], 5: [0.5, 0, 0.5],
+                      6: [0, 0.5, 0], 7: [0.5, 0.5, 0], 8: [0, 0.5, 0.5], 9: [0.5, 0.5, 0.5]}
+        cube = np.array([g for g in np.ndindex(5, 5, 5)]) - 2
+        rred = np.indices(mesh.shape).reshape(3, -1).T / np.array(mesh.shape, dtype=np.float)
+
+        for istwfk, kpt in istwfk2kpt.items():
+            g0 = np.rint(2 * np.array(kpt)).astype(np.int)
+            # Keep one G-vector of each pair (G, -G-G0).
+            gvecs = np.array([g for g in cube if tuple(g) >= tuple(-g - g0)])
+            gsphere = GSphere(2, rprimd, kpt, gvecs, istwfk=istwfk)
+            self.assert_equal(gsphere.get_g0(), g0)
+            self.assert_equal(gsphere.inverse_gvecs(), -gvecs - g0)
+
+            ug = np.random.random(gsphere.npw) + 1j * np.random.random(gsphere.npw)
+            self_inv = np.all(gsphere.inverse_gvecs() == gvecs, axis=1)
+            ug[self_inv] = ug[self_inv].real
+            ug_mesh = gsphere.tofftmesh(mesh, ug)
+            assert np.count_nonzero(ug_mesh) == 2 * gsphere.npw - np.count_nonzero(self_inv)
+            self.assert_equal(gsphere.fromfftmesh(mesh, ug_mesh.flatten()), ug)
+
+            # psi(r) = e^{ikr} u(r) is real.
+            ur = mesh.fft_g2r(ug_mesh).flatten()
+            psi = np.exp(2j * np.pi * np.dot(rred, kpt)) * ur
+            assert np.allclose(psi.imag, 0), "istwfk: %d" % istwfk
@@ -3,6 +3,7 @@
 from __future__ import print_function, division
 
 import itertools
+import pickle
 import unittest
 import numpy as np
 import abipy.data as abidata
@@ -10,7 +11,8 @@ import abipy.data as abidata
 from pymatgen.core.lattice import Lattice
 from abipy import abilab
 from abipy.core.kpoints import (wrap_to_ws, wrap_to_bz, issamek, Kpoint, KpointList, KpointsReader, has_timrev_from_kptopt,
-    KSamplingInfo, as_kpoints, rc_list, kmesh_from_mpdivs, Ktables, map_bz2ibz, set_atol_kdiff, set_spglib_tols)
+    KSamplingInfo, as_kpoints, rc_list, kmesh_from_mpdivs, Ktables, map_bz2ibz, set_atol_kdiff, set_spglib_tols,
+    map_mesh2ibz, map_kpoints, find_irred_kpoints_generic)
 from abipy.core.testing import AbipyTest
 
 
@@ -176,6 +178,20 @@ class TestKpointList(AbipyTest):
         # Changing the weight of the Kpoint object should change the weights of klist.
         for kpoint in klist: kpoint.set_weight(1.0)
         assert np.all(klist.weights == 1.0)
+        # weights is a read-only view of the internal array.
+        with self.assertRaises(ValueError):
+            klist.weights[0] = 2.0
+
+        # Kpoint objects are views created on demand.
+        assert klist[-1] == klist[2] and len(klist[1:]) == 2
+        assert [k.frac_coords[0] for k in reversed(klist)] == [1/3, 1/2, 0]
+        assert klist.names == [None, None, None]
+        klist[1].set_name("\\Lambda")
+        assert klist.names == [None, "$\\Lambda$", None] and klist[1].name == "$\\Lambda$"
+        klist[1].set_name(None)
+        same_kpoint = pickle.loads(pickle.dumps(klist[0], protocol=-1))
+        assert type(same_kpoint) is Kpoint and same_kpoint == klist[0] and same_kpoint.weight == 1.0
+        assert type(klist[0] + klist[1]) is Kpoint
 
         # Test find_closest
         iclose, kclose, dist = klist.find_closest([0, 0, 0])
@@ -202,6 +218,30 @@ class TestKpointList(AbipyTest):
         assert len(add_klist) == 4
         assert add_klist == add_klist.remove_duplicated()
 
+        # Test hash index and find_many.
+        assert [0, 0, 1] in klist and [0.1, 0, 0] not in klist
+        assert klist.index([1/2, -1/2, 3/2]) == 1
+        self.assert_equal(klist.find_many([[0, 0, 0], [1/3, 1/3, -2/3], [0.1, 0, 0]]), [0, 2, -1])
+        self.assert_equal(klist.find_many(list(klist)), [0, 1, 2])
+        # Results must be consistent with issamek and the tolerance set with set_atol_kdiff.
+        assert klist.find([1e-6, 0, 0]) == -1
+        atol_default = set_atol_kdiff(1e-5)
+        assert klist.find([1e-6, 0, 0]) == 0
+        set_atol_kdiff(atol_default)
+        assert klist.find([1e-6, 0, 0]) == -1
+
+        # Symmetry-equivalent points.
+        symrecs = [np.eye(3, dtype=np.int), [[0, 1, 0], [0, 0, 1], [1, 0, 0]]]
+        qs = [[-1/3, -1/3, -1/3], [1/2, 1/2, 1/2], [0.1, 0.2, 0.3]]
+        res = klist.find_many(qs, symrecs=symrecs, has_timrev=False)
+        self.assert_equal(res.index, [-1, 1, -1])
+        res = klist.find_many(qs, symrecs=symrecs, has_timrev=True)
+        self.assert_equal(res.index, [2, 1, -1])
+        self.assert_equal(res.tsign[:2], [-1, 1])
+        for iq in range(2):
+            krot = res.tsign[iq] * np.matmul(symrecs[res.isym[iq]], klist[res.index[iq]].frac_coords)
+            self.assert_almost_equal(qs[iq], krot + res.g0[iq])
+
 #class TestIrredZone(AbipyTest):
 #class TestKpath(AbipyTest):
 
@@ -509,6 +549,33 @@ class TestKmappingTools(AbipyTest):
 
         assert not errors
 
+    def test_map_mesh2ibz(self):
+        """Testing map_mesh2ibz and map_kpoints."""
+        abispg = self.mgb2.abi_spacegroup
+        symrecs = np.array([o.rot_g for o in abispg.fm_symmops])
+        tables = map_mesh2ibz(self.kibz, self.ngkpt, symrecs, self.has_timrev)
+        assert np.all(tables.ik_ibz != -1)
+        self.assert_equal(tables.ik_ibz, map_bz2ibz(self.mgb2, self.kibz, self.ngkpt, self.has_timrev))
+
+        # bz = tsign * S k_ibz + g0
+        kibz = np.reshape(self.kibz, (-1, 3))
+        krots = tables.tsign[:, None] * np.einsum("kij,kj->ki", symrecs[tables.isym], kibz[tables.ik_ibz])
+        self.assert_almost_equal(krots + tables.g0, tables.bz)
+
+        # Map a subset of the mesh onto the IBZ.
+        lattice = self.mgb2.reciprocal_lattice.matrix
+        o2r_map, nmissing = map_kpoints(tables.bz[:100], lattice, lattice, kibz, symrecs, self.has_timrev)
+        assert nmissing == 0
+        for ik, kmap in enumerate(o2r_map):
+            assert kmap.ik_ref == tables.ik_ibz[ik]
+            krot = kmap.tsign * np.matmul(symrecs[kmap.isym], kibz[kmap.ik_ref])
+            self.assert_almost_equal(krot + kmap.g0, tables.bz[ik])
+
+        # All the points of the mesh are reduced to the IBZ.
+        nmt = find_irred_kpoints_generic(self.mgb2, tables.bz, verbose=0)
+        assert len(nmt.irred_map) == len(kibz)
+        self.assert_equal(nmt.irred_map[nmt.kpt2irred][nmt.irred_map], nmt.irred_map)
+
     #def test_with_from_structure_with_symrec(self):
     #    """Generate Ktables from a structure with Abinit symmetries."""
     #    self.mgb2 = self.get_abistructure.mgb2("mgb2_kpath_FATBANDS.nc")
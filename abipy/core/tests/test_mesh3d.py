@@ -1,9 +1,11 @@
 """Tests for mesh3d module"""
 from __future__ import print_function, division
 
+import itertools
 import numpy as np
 
 from abipy.core.mesh3d import *
+from abipy.core.symmetries import SymmOp
 from abipy.core.testing import AbipyTest
 
 
@@ -79,6 +81,54 @@ class TestMesh3D(AbipyTest):
                     r += shift
                     self.assert_equal(mesh_443.i_closest_gridpoints(r), [[ix, iy, iz]])
 
+    def test_gvecs_gmods_rpoints(self):
+        """Test vectorized G-vectors, |G| and r-points"""
+        rprimd = np.reshape([0.0, 2.5, 2.5, 2.5, 0.0, 2.5, 2.5, 2.5, 0.0], (3, 3))
+        mesh = Mesh3D((6, 5, 4), rprimd)
+
+        # Reference values computed with loops.
+        gmet = np.dot(mesh.inv_vectors.T, mesh.inv_vectors)
+        g1d = [np.rint(np.fft.fftfreq(n) * n) for n in mesh.shape]
+        ref_gvecs = np.array([(gx, gy, gz) for gx in g1d[0] for gy in g1d[1] for gz in g1d[2]])
+        ref_gmods = np.array([2 * np.pi * np.sqrt(np.dot(g, np.dot(gmet, g))) for g in ref_gvecs])
+        ref_rpoints = np.array([(ix / 6, iy / 5, iz / 4) for ix in range(6) for iy in range(5) for iz in range(4)])
+
+        self.assert_equal(mesh.gvecs, ref_gvecs)
+        self.assert_almost_equal(mesh.gmods, ref_gmods)
+        self.assert_almost_equal(mesh.rpoints, ref_rpoints)
+
+        gvecs32 = mesh.get_gvecs(dtype=np.int32)
+        assert gvecs32.dtype == np.int32
+        self.assert_equal(gvecs32, ref_gvecs)
+        g2 = mesh.get_g2(shape3d=True)
+        assert g2.shape == mesh.shape
+        self.assert_almost_equal(g2.flatten(), ref_gmods ** 2)
+        gmods32 = mesh.get_gmods(dtype=np.float32)
+        assert gmods32.dtype == np.float32
+        self.assert_almost_equal(gmods32, ref_gmods, decimal=4)
+        assert mesh.get_rpoints(dtype=np.float32).dtype == np.float32
+
+    def test_gridpoints_in_sphere(self):
+        """Test the search of the gridpoints inside spheres."""
+        mesh = Mesh3D((12, 15, 17), [[3., 0, 0], [1., 4, 0], [0.5, 0.3, 5]])
+        center, radius = np.array([2.9, 0.1, 4.8]), 2.5
+
+        # Reference computed with a large box of periodic images.
+        ref = set()
+        for ix, iy, iz in itertools.product(range(-20, 35), range(-20, 35), range(-20, 40)):
+            if np.linalg.norm(mesh.rpoint(ix, iy, iz) - center) <= radius: ref.add((ix, iy, iz))
+
+        found = set()
+        for igp_uc, dist, igp in mesh.iter_gridpoints_in_sphere(center, radius, chunk_size=300):
+            self.assert_equal(igp_uc, np.mod(igp, mesh.shape))
+            self.assert_almost_equal(dist, np.linalg.norm(np.matmul(igp, [mesh.dvx, mesh.dvy, mesh.dvz]) - center, axis=1))
+            found.update(map(tuple, igp))
+        assert found == ref
+
+        dist_gridpoints = mesh.dist_gridpoints_in_spheres([center], radius)
+        assert len(dist_gridpoints) == 1 and len(dist_gridpoints[0]) == len(ref)
+        self.assert_equal(mesh.i_closest_gridpoints([mesh.rpoint(13, -1, 3)]), [[1, 14, 3]])
+
     def test_fft(self):
         """Test FFT transforms with mesh3d"""
         rprimd = np.array([1.,0,0, 0,1,0, 0,0,1])
@@ -100,6 +150,141 @@ class TestMesh3D(AbipyTest):
                 int_g = fg[..., 0, 0, 0]
                 self.assert_almost_equal(int_r, int_g)
 
+    def test_fft_batch(self):
+        """Test batched FFTs with FFTEngine"""
+        mesh = Mesh3D((12, 3, 5), np.eye(3))
+        fg = mesh.crandom(extra_dims=(4, 2))
+        ref_fr = mesh.fft_g2r(fg)
+
+        engines = [FFTEngine()]
+        for backend in ("scipy", "pyfftw"):
+            try:
+                engines.append(FFTEngine(backend=backend, nthreads=2))
+            except ImportError:
+                pass
+
+        with self.assertRaises(ValueError):
+            FFTEngine(backend="foo")
+
+        for engine in engines:
+            str(engine)
+            fr = mesh.fft_g2r_batch(fg, engine=engine)
+            self.assert_almost_equal(fr, ref_fr)
+            self.assert_almost_equal(mesh.fft_r2g_batch(fr, engine=engine), fg)
+
+            # In-place transforms.
+            work = fg.copy()
+            fr = mesh.fft_g2r_batch(work, inplace=True, engine=engine)
+            self.assert_almost_equal(fr, ref_fr)
+            self.assert_almost_equal(mesh.fft_r2g_batch(fr, inplace=True, engine=engine), fg)
+
+            # Real input.
+            rr = mesh.random()
+            self.assert_almost_equal(mesh.fft_r2g_batch(rr, engine=engine), mesh.fft_r2g(rr))
+
+        old_engine = get_fft_engine()
+        try:
+            engine = set_fft_engine(backend="numpy")
+            assert get_fft_engine() is engine
+            self.assert_almost_equal(mesh.fft_g2r_batch(fg), ref_fr)
+        finally:
+            set_fft_engine(old_engine.backend, old_engine.nthreads)
+
+    def test_fft_half(self):
+        """Test real-to-complex FFTs and half-spectrum G-vectors"""
+        for shape in [(6, 7, 8), (5, 6, 7)]:
+            mesh = Mesh3D(shape, [[3., 0, 0], [1, 4, 0], [0.5, 0.3, 5]])
+            nzh = shape[2] // 2 + 1
+            assert mesh.half_shape == shape[:2] + (nzh,)
+            fr = mesh.random(extra_dims=2)
+            fg_half = mesh.fft_r2g_half(fr)
+            fg = mesh.fft_r2g(fr)
+            assert fg_half.shape == (2,) + mesh.half_shape
+            self.assert_almost_equal(fg_half, fg[..., :nzh])
+            self.assert_almost_equal(mesh.fft_g2r_half(fg_half), fr)
+            with self.assertRaises(TypeError):
+                mesh.fft_r2g_half(fr + 1j)
+
+            # G-vectors of the half-spectrum are a subset of the full box.
+            self.assert_equal(mesh.gvecs_half, np.reshape(mesh.gvecs, shape + (3,))[..., :nzh, :].reshape(-1, 3))
+            self.assert_almost_equal(mesh.gmods_half, np.reshape(mesh.gmods, shape)[..., :nzh].ravel())
+
+            # Sums over the full box with the weights of the half-spectrum.
+            other = mesh.random()
+            ref = np.sum(fg[0] * mesh.fft_r2g(other))
+            self.assert_almost_equal(np.sum(fg_half[0].ravel() * mesh.fft_r2g_half(other).ravel() *
+                                            mesh.get_half_weights()).real, ref.real)
+
+            # Partners of the G-vectors with components equal to -n/2.
+            inds, partners = mesh.get_half_partners()
+            gset = set(map(tuple, mesh.gvecs))
+            assert all(tuple(g) in gset for g in partners)
+            assert np.all(np.any(partners != -mesh.gvecs_half[inds], axis=1))
+
+    def test_irottable(self):
+        """Test rotation tables for symmetry operations"""
+        mesh = Mesh3D((8, 8, 12), 5 * np.eye(3))
+        rot4 = np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]])
+        symmops = [SymmOp(np.eye(3, dtype=np.int), [0, 0, 0], 1, 1),
+                   SymmOp(rot4, [0.5, 0, 0.25], 1, 1),
+                   SymmOp(-np.eye(3, dtype=np.int), [0, 0.5, 0], 1, 1)]
+
+        irottable = mesh.get_irottable(symmops)
+        assert irottable.shape == (3, mesh.size)
+        assert mesh.get_irottable(symmops) is irottable
+        assert mesh.is_symmetry_compatible(symmops)
+        self.assert_equal(irottable[0], np.arange(mesh.size))
+        for isym, op in enumerate(symmops):
+            assert sorted(irottable[isym]) == list(range(mesh.size))
+            for ifft, (ixyz, _) in enumerate(mesh.iter_ixyz_r()):
+                if ifft % 37 != 0: continue
+                jxyz = np.rint(op.rotate_r(np.array(ixyz) / mesh.shape) * mesh.shape).astype(np.int) % mesh.shape
+                assert irottable[isym, ifft] == np.ravel_multi_index(jxyz, mesh.shape)
+
+        # Rotated points in G-space with the nonsymmorphic phases.
+        fr = mesh.random()
+        fg = mesh.fft_r2g(fr).ravel()
+        irottable_g = mesh.get_irottable(symmops, space="g")
+        for isym, op in enumerate(symmops):
+            rot_fr = fr.ravel()[irottable[isym]]
+            rot_fg = fg[irottable_g[isym]] * mesh.get_tnons_phases(op)
+            self.assert_almost_equal(mesh.fft_r2g(np.reshape(rot_fr, mesh.shape)).ravel(), rot_fg)
+
+        # tau = 1/3 is not compatible with n = 8.
+        badops = [SymmOp(np.eye(3, dtype=np.int), [1/3, 0, 0], 1, 1)]
+        assert not mesh.is_symmetry_compatible(badops)
+        with self.assertRaises(ValueError):
+            mesh.get_irottable(badops)
+        assert mesh.get_irottable(badops, space="g").shape == (1, mesh.size)
+
+    def test_fourier_interp(self):
+        """Test Fourier interpolation between FFT meshes"""
+        def band_limited(shape):
+            x, y, z = np.meshgrid(*[np.arange(n) / n for n in shape], indexing="ij")
+            return np.array([np.cos(2 * np.pi * (x + 2 * y - z)) + 0.3 * np.sin(2 * np.pi * (2 * x + z)),
+                             np.cos(2 * np.pi * (y - x)) + 1])
+
+        mesh = Mesh3D((10, 12, 14), np.eye(3))
+        for new_shape in [(15, 16, 20), (9, 11, 13), (10, 13, 8), mesh.shape]:
+            new_mesh = Mesh3D(new_shape, np.eye(3))
+            # Real data uses the half-spectrum, complex data the full FFT box.
+            intp = mesh.fourier_interp(band_limited(mesh.shape), new_mesh)
+            assert intp.dtype == np.float and intp.shape == (2,) + new_shape
+            self.assert_almost_equal(intp, band_limited(new_shape))
+            cplx_intp = mesh.fourier_interp(band_limited(mesh.shape) * (1 + 1j), new_shape)
+            self.assert_almost_equal(cplx_intp, band_limited(new_shape) * (1 + 1j))
+
+            # Arbitrary real data: real and complex paths must agree.
+            rr = mesh.random(extra_dims=2)
+            self.assert_almost_equal(mesh.fourier_interp(rr, new_mesh), mesh.fourier_interp(rr.astype(np.complex), new_mesh))
+            self.assert_almost_equal(mesh.fourier_interp(mesh.fft_r2g(rr), new_mesh, inspace="g"),
+                                     mesh.fourier_interp(rr, new_mesh))
+
+        # Zero-padding followed by truncation gives the initial data.
+        big_mesh = Mesh3D((15, 16, 21), np.eye(3))
+        self.assert_almost_equal(big_mesh.fourier_interp(mesh.fourier_interp(rr, big_mesh), mesh), rr)
+        assert (big_mesh.shape, True) in mesh._gtransfer_cache
+
     #def test_trilinear_interp(self):
     #    rprimd = np.array([1.,0,0, 0,1,0, 0,0,1])
     #    rprimd.shape = (3,3)
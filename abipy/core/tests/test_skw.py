@@ -1,6 +1,8 @@
 """Tests for core.skw module"""
 from __future__ import print_function, division, unicode_literals
 
+import os
+import tempfile
 import numpy as np
 import abipy.data as abidata
 
@@ -58,6 +60,17 @@ class TestSkwInterpolator(AbipyTest):
         assert res1.dedk.shape == (skw.nsppol, len(new_kcoords), skw.nband, 3)
         # Group velocities at Gamma should be zero by symmetry.
         self.assert_almost_equal(res1.dedk[0, 0], 0.0)
+
+        # Batched evaluation must agree with the k-by-k evaluation of the star functions.
+        for ik, kpt in enumerate(new_kcoords):
+            self.assert_almost_equal(skw.get_stark_batch([kpt])[0], skw.get_stark(kpt))
+            self.assert_almost_equal(skw.get_stark_dk1_batch([kpt])[:, 0], skw.get_stark_dk1(kpt))
+            der1 = np.empty((skw.nband, 3))
+            self.assert_almost_equal(res1.eigens[0, ik], skw.eval_sk(0, kpt, der1=der1))
+            self.assert_almost_equal(res1.dedk[0, ik], der1)
+        res2 = skw.interp_kpts(new_kcoords, dk1=True, kchunk=2)
+        self.assert_almost_equal(res2.eigens, res1.eigens)
+        self.assert_almost_equal(res2.dedk, res1.dedk)
         #assert 0
         #res12 = skw.interp_kpts(new_kcoords, dk1=True, dk2=True)
         #print(res12.dedk2)
@@ -67,6 +80,24 @@ class TestSkwInterpolator(AbipyTest):
         jdos = skw.get_jdos_q0(kmesh, is_shift=None, method="gaussian", step=0.1, width=0.2, wmesh=None)
         #nest = skw.get_nesting_at_e0(qpoints, kmesh, e0, width=0.2, is_shift=None)
 
+        # R-points generating the stars: all stars must be distinct and sorted by length.
+        rkeys = set(min(tuple(np.matmul(rot, r)) for rot in skw.ptg_symrel) for r in skw.rpts)
+        assert len(rkeys) == skw.nr
+        r2vals = np.einsum("ri,ij,rj->r", skw.rpts, skw.rmet, skw.rpts)
+        assert np.all(np.diff(r2vals) >= -1e-8 * r2vals[-1])
+
+        # Test disk cache of the stars.
+        assert SkwInterpolator.rstar_cache_dir is None
+        skw.rstar_cache_dir = tempfile.mkdtemp()
+        rmax = np.array([4, 4, 4])
+        rpts, r2vals, ok = skw._find_rstar_gen(skw.nr, rmax)
+        assert len(os.listdir(skw.rstar_cache_dir)) == 1
+        same_rpts, same_r2vals, same_ok = skw._find_rstar_gen(skw.nr, rmax)
+        self.assert_equal(rpts, same_rpts)
+        self.assert_equal(r2vals, same_r2vals)
+        assert ok == same_ok
+        skw.rstar_cache_dir = None
+
         # Test pickle
         tmpname = self.get_tmpname(text=True)
         skw.pickle_dump(tmpname)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmark the time needed to import a module (default: abipy.abilab) with `python -X importtime`.
+
+The import is executed in a fresh interpreter `nrep` times and the best cumulative time is compared
+with the budget given in seconds. The script returns a non-zero exit status if the budget is exceeded
+so that it can be used to detect regressions (e.g. a heavy package imported at the module level).
+
+Usage: bench_import_abilab.py [budget] [module] [nrep] [ntop]
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import sys
+import subprocess
+
+
+def importtime(modname):
+    """
+    Import `modname` in a new python process with `-X importtime`.
+
+    Returns:
+        (cumulative time in seconds, list of (self time in seconds, module name))
+    """
+    p = subprocess.Popen([sys.executable, "-X", "importtime", "-c", "import %s" % modname],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    _, err = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError("Cannot import %s:\n%s" % (modname, err))
+
+    # Output format: import time: self [us] | cumulative | imported package
+    cumulative, selftimes = None, []
+    for line in err.splitlines():
+        if not line.startswith("import time:"): continue
+        tokens = line[len("import time:"):].split("|")
+        try:
+            tself, tcum = int(tokens[0]), int(tokens[1])
+        except ValueError:
+            # Header
+            continue
+        name = tokens[2].strip()
+        selftimes.append((tself * 1e-6, name))
+        if name == modname: cumulative = tcum * 1e-6
+
+    if cumulative is None:
+        raise RuntimeError("%s not found in importtime output. Module already imported by site?" % modname)
+
+    return cumulative, selftimes
+
+
+def main():
+    if sys.version_info < (3, 7):
+        print("python -X importtime requires py >= 3.7")
+        return 0
+
+    args = sys.argv[1:]
+    budget = float(args[0]) if len(args) > 0 else 1.0
+    modname = args[1] if len(args) > 1 else "abipy.abilab"
+    nrep = int(args[2]) if len(args) > 2 else 3
+    ntop = int(args[3]) if len(args) > 3 else 15
+
+    results = [importtime(modname) for i in range(nrep)]
+    cumulative, selftimes = min(results, key=lambda t: t[0])
+
+    print("Slowest modules (self time):")
+    for tself, name in sorted(selftimes, reverse=True)[:ntop]:
+        print("%8.3f s  %s" % (tself, name))
+    print("")
+
+    heavy = [name for name in ("pandas", "matplotlib", "netCDF4") if any(n == name for _, n in selftimes)]
+    if heavy:
+        print("Heavy packages imported by %s: %s" % (modname, ", ".join(heavy)))
+
+    print("import %s: %.3f s (best of %d), budget: %.3f s" % (modname, cumulative, nrep, budget))
+    if cumulative > budget:
+        print("Import time exceeds budget!")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Benchmark the SKW interpolation of band energies: k-by-k evaluation of the star functions
+(`SkwInterpolator.eval_sk`) vs the batched version used by `SkwInterpolator.interp_kpts`.
+
+Usage: bench_skw_interp.py [nkpt] [lpratio] [kchunk]
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import sys
+import time
+import numpy as np
+import abipy.data as abidata
+
+from abipy.abilab import abiopen
+from abipy.core.skw import SkwInterpolator
+
+
+def main():
+    args = sys.argv[1:]
+    nkpt = int(args[0]) if len(args) > 0 else 2000
+    lpratio = float(args[1]) if len(args) > 1 else 5.0
+    kchunk = int(args[2]) if len(args) > 2 else None
+
+    with abiopen(abidata.ref_file("si_scf_GSR.nc")) as gsr:
+        structure, ebands = gsr.structure, gsr.ebands
+        kcoords = [k.frac_coords for k in ebands.kpoints]
+        cell = (structure.lattice.matrix, structure.frac_coords, structure.atomic_numbers)
+        abispg = structure.abi_spacegroup
+        fm_symrel = [s for (s, afm) in zip(abispg.symrel, abispg.symafm) if afm == 1]
+        skw = SkwInterpolator(lpratio, kcoords, ebands.eigens, ebands.fermie, ebands.nelect, cell,
+                              fm_symrel, True, filter_params=None, verbose=0)
+
+    print("nr: %d, ptg_nsym: %d, nkpt: %d" % (skw.nr, skw.ptg_nsym, nkpt))
+    new_kcoords = np.random.random((nkpt, 3))
+
+    start = time.time()
+    ref_eigens = np.empty((skw.nsppol, nkpt, skw.nband))
+    for spin in range(skw.nsppol):
+        for ik, kpt in enumerate(new_kcoords):
+            ref_eigens[spin, ik] = skw.eval_sk(spin, kpt)
+    time_loop = time.time() - start
+
+    start = time.time()
+    eigens = skw.interp_kpts(new_kcoords, kchunk=kchunk).eigens
+    time_batch = time.time() - start
+
+    assert np.allclose(eigens, ref_eigens)
+    print("k-by-k evaluation: %.3f s" % time_loop)
+    print("batched evaluation: %.3f s" % time_batch)
+    print("speedup: %.1f" % (time_loop / time_batch))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark per-band vs block reads of the wavefunction coefficients stored in a WFK file.
+
+The script generates a synthetic netCDF file containing only the `coefficients_of_wavefunctions`
+variable (ETSF-IO layout) and compares the time needed to read all the bands with
+`WFK_Reader.read_ug` (one netCDF read per band) and `WFK_Reader.read_ug_block`.
+
+Usage: bench_wfk_read.py [nband] [npw] [nkpt] [chunk]
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import sys
+import os
+import time
+import tempfile
+import numpy as np
+import netCDF4
+
+from pymatgen.io.abinit.netcdf import NetcdfReader
+from abipy.waves.wfkfile import WFK_Reader
+
+
+def make_synthetic_wfk(path, nsppol=1, nkpt=2, nband=200, nspinor=1, npw=4000):
+    """Write a netCDF file with random wavefunction coefficients."""
+    with netCDF4.Dataset(path, mode="w") as root:
+        root.createDimension("number_of_spins", nsppol)
+        root.createDimension("number_of_kpoints", nkpt)
+        root.createDimension("max_number_of_states", nband)
+        root.createDimension("number_of_spinor_components", nspinor)
+        root.createDimension("max_number_of_coefficients", npw)
+        root.createDimension("real_or_complex_coefficients", 2)
+        var = root.createVariable("coefficients_of_wavefunctions", np.float64,
+            ("number_of_spins", "number_of_kpoints", "max_number_of_states", "number_of_spinor_components",
+             "max_number_of_coefficients", "real_or_complex_coefficients"))
+        for spin in range(nsppol):
+            for ik in range(nkpt):
+                var[spin, ik] = np.random.random((nband, nspinor, npw, 2))
+
+
+def open_reader(path, nsppol, nkpt, nband, nspinor, npw):
+    """
+    Build a WFK_Reader for the synthetic file.
+    The synthetic file does not contain the crystalline structure
+    hence we bypass WFK_Reader.__init__ and set the attributes used by read_ug_block.
+    """
+    reader = WFK_Reader.__new__(WFK_Reader)
+    NetcdfReader.__init__(reader, path)
+    reader.cplex_ug = 2
+    reader.nspinor = nspinor
+    reader.npwarr = np.full(nkpt, npw, dtype=np.int)
+    reader.nband_sk = np.full((nsppol, nkpt), nband, dtype=np.int)
+    return reader
+
+
+def main():
+    args = [int(a) for a in sys.argv[1:]]
+    nband, npw, nkpt, chunk = args + [200, 4000, 2, 32][len(args):]
+    nsppol, nspinor = 1, 1
+
+    path = tempfile.mkstemp(suffix="_WFK.nc")[1]
+    print("Generating synthetic WFK file %s with nkpt: %d, nband: %d, npw: %d" % (path, nkpt, nband, npw))
+    make_synthetic_wfk(path, nsppol=nsppol, nkpt=nkpt, nband=nband, nspinor=nspinor, npw=npw)
+    reader = open_reader(path, nsppol, nkpt, nband, nspinor, npw)
+
+    spin = 0
+    start = time.time()
+    checksum_band = 0.0
+    for ik in range(nkpt):
+        for band in range(nband):
+            checksum_band += reader.read_ug(spin, ik, band).sum()
+    time_band = time.time() - start
+
+    start = time.time()
+    checksum_block = 0.0
+    for ik in range(nkpt):
+        for bstart in range(0, nband, chunk):
+            ug = reader.read_ug_block(spin, ik, band_range=(bstart, min(bstart + chunk, nband)))
+            checksum_block += ug.sum()
+    time_block = time.time() - start
+
+    reader.close()
+    os.remove(path)
+
+    assert np.allclose(checksum_band, checksum_block)
+    print("per-band reads: %.3f s" % time_band)
+    print("block reads (chunk=%d): %.3f s" % (chunk, time_block))
+    print("speedup: %.1f" % (time_band / time_block))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
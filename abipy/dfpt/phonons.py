@@ -23,7 +23,7 @@ from abipy.core.func1d import Function1D
 from abipy.core.mixins import AbinitNcFile, Has_Structure, Has_PhononBands, NotebookWriter
 from abipy.core.kpoints import Kpoint, KpointList
 from abipy.iotools import ETSF_Reader
-from abipy.tools import gaussian, duck
+from abipy.tools import gaussians_sum, duck
 from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt, set_axlims
 
 
@@ -565,13 +565,9 @@ class PhononBands(object):
 
         mesh, step = np.linspace(w_min, w_max, num=nw, endpoint=True, retstep=True)
 
-        values = np.zeros(nw)
         if method == "gaussian":
-            for q, qpoint in enumerate(self.qpoints):
-                weight = qpoint.weight
-                for nu in self.branches:
-                    w = self.phfreqs[q, nu]
-                    values += weight * gaussian(mesh, width, center=w)
+            weights = np.broadcast_to(self.qpoints.weights[:, None], self.phfreqs.shape)
+            values = gaussians_sum(mesh, self.phfreqs, width, weights=weights)
 
         else:
             raise ValueError("Method %s is not supported" % method)
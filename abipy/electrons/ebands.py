@@ -27,7 +27,7 @@ from abipy.core.kpoints import (Kpoint, KpointList, Kpath, IrredZone, KSamplingI
     kmesh_from_mpdivs, Ktables, has_timrev_from_kptopt, map_bz2ibz)
 from abipy.core.structure import Structure
 from abipy.iotools import ETSF_Reader, bxsf_write
-from abipy.tools import gaussian, duck
+from abipy.tools import gaussians_sum, duck
 from abipy.tools.plotting import set_axlims, add_fig_kwargs, get_ax_fig_plt
 
 
@@ -1299,14 +1299,13 @@ class ElectronBands(Has_Structure):
         mesh, step = np.linspace(e_min, e_max, num=nw, endpoint=True, retstep=True)
         dos = np.zeros((self.nsppol, nw))
 
-        # TODO: Write cython version.
         if method == "gaussian":
+            weights = self.kpoints.weights
             for spin in self.spins:
-                for k, kpoint in enumerate(self.kpoints):
-                    weight = kpoint.weight
-                    for band in range(self.nband_sk[spin,k]):
-                        e = self.eigens[spin,k,band]
-                        dos[spin] += weight * gaussian(mesh, width, center=e)
+                # Exclude the bands that are not computed if nband_sk depends on (spin, k).
+                valid = np.arange(self.mband)[None, :] < self.nband_sk[spin][:, None]
+                wsk = np.broadcast_to(weights[:, None], valid.shape)
+                dos[spin] = gaussians_sum(mesh, self.eigens[spin][valid], width, weights=wsk[valid])
 
         else:
             raise NotImplementedError("Method %s is not supported" % method)
@@ -1379,16 +1378,14 @@ class ElectronBands(Has_Structure):
         full = 2.0 if self.nsppol == 1 else 1.0
 
         if method == "gaussian":
-            for k, kpoint in enumerate(self.kpoints):
-                weight = kpoint.weight
-                for c in conduction:
-                    ec = self.eigens[spin,k,c]
-                    fc = 1.0 - self.occfacts[spin,k,c] / full
-                    for v in valence:
-                        ev = self.eigens[spin,k,v]
-                        fv = self.occfacts[spin,k,v] / full
-                        fact = weight * fv * fc
-                        jdos += fact * gaussian(mesh, width, center=ec-ev)
+            conduction, valence = list(conduction), list(valence)
+            # Transition energies and weights with shape [nkpt, nc, nv]
+            ec = self.eigens[spin][:, conduction]
+            ev = self.eigens[spin][:, valence]
+            fc = 1.0 - self.occfacts[spin][:, conduction] / full
+            fv = self.occfacts[spin][:, valence] / full
+            weights = self.kpoints.weights[:, None, None] * fc[:, :, None] * fv[:, None, :]
+            jdos = gaussians_sum(mesh, ec[:, :, None] - ev[:, None, :], width, weights=weights)
 
         else:
             raise NotImplementedError("Method %s is not supported" % method)
@@ -1819,11 +1816,7 @@ class ElectronBands(Has_Structure):
         bz2ibz = map_bz2ibz(self.structure, self.kpoints.frac_coords, mpdivs, self.has_timrev, pbc=True)
 
         # Construct bands in BZ: e_{TSk} = e_{k}
-        len_bz = len(bz2ibz)
-        emesh_sbk = np.empty((self.nsppol, self.nband, len_bz))
-        for ik_bz in range(len_bz):
-            ik_ibz = bz2ibz[ik_bz]
-            emesh_sbk[:, :, ik_bz] = self.eigens[:, ik_ibz, :]
+        emesh_sbk = np.transpose(self.eigens[:, bz2ibz, :], (0, 2, 1)).copy()
 
         # Write BXSF file.
         with open(filepath, "wt") as fh:
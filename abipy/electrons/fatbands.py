@@ -14,14 +14,13 @@ from pymatgen.core.periodic_table import Element
 from abipy.tools.plotting import add_fig_kwargs, get_ax_fig_plt
 from abipy.core.mixins import AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWriter
 from abipy.electrons.ebands import ElectronsReader
-from abipy.tools import gaussian
+from abipy.tools import gaussians_sum
 from abipy.tools.plotting import set_axlims
 
 
 def gaussians_dos(dos, mesh, width, values, energies, weights):
     assert len(dos) == len(mesh) and len(values) == len(energies) == len(weights)
-    for vw, e, w in zip(values * weights, energies, weights):
-        dos += vw * gaussian(mesh, width, center=e)
+    dos += gaussians_sum(mesh, energies, width, weights=values * weights)
     return dos
 
 
@@ -1389,17 +1388,18 @@ class FatBandsFile(AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWrite
         pawt1dos_al = np.zeros((self.natom, self.lsize, self.nsppol, nw))
 
         if method == "gaussian":
+            weights = kpoints.weights
             for spin in range(self.nsppol):
-                for k, kpoint in enumerate(kpoints):
-                    weight = kpoint.weight
-                    for band in range(nband_sk[spin, k]):
-                        gs = gaussian(mesh, width, center=eigens[spin,k,band])
-                        for iatom in range(self.natom):
-                            if not self.has_atom[iatom]: continue
-                            for l in range(min(self.lmax_atom[iatom] + 1, mylsize)):
-                                totdos_al[iatom, l, spin] += weight * gs * wal_sbk[iatom, l, spin, band, k]
-                                paw1dos_al[iatom, l, spin] += weight * gs * paw1_wal_sbk[iatom, l, spin, band, k]
-                                pawt1dos_al[iatom, l, spin] += weight * gs * pawt1_wal_sbk[iatom, l, spin, band, k]
+                # Select the (band, k) pairs that have been computed. Arrays are indexed by [band, k].
+                valid = np.arange(self.mband)[:, None] < nband_sk[spin][None, :]
+                enes = eigens[spin].T[valid]
+                for iatom in range(self.natom):
+                    if not self.has_atom[iatom]: continue
+                    lsize = min(self.lmax_atom[iatom] + 1, mylsize)
+                    for dos_al, w_sbk in ((totdos_al, wal_sbk), (paw1dos_al, paw1_wal_sbk), (pawt1dos_al, pawt1_wal_sbk)):
+                        # All l-channels are computed in a single call.
+                        wl = (w_sbk[iatom, :lsize, spin] * weights)[:, valid]
+                        dos_al[iatom, :lsize, spin] += gaussians_sum(mesh, enes, width, weights=wl)
 
         else:
             raise ValueError("Method %s is not supported" % method)
@@ -1617,18 +1617,16 @@ class _DosIntegrator(object):
         symbols_lso = OrderedDict()
         if self.method == "gaussian":
 
+            weights = ebands.kpoints.weights
             for symbol in fbfile.symbols:
                 lmax = fbfile.lmax_symbol[symbol]
                 wlsbk = fbfile.get_wl_symbol(symbol)
                 lso = np.zeros((fbfile.lsize, fbfile.nsppol, len(self.mesh)))
                 for spin in range(fbfile.nsppol):
-                    for k, kpoint in enumerate(ebands.kpoints):
-                        weight = kpoint.weight
-                        for band in range(ebands.nband_sk[spin, k]):
-                            e = ebands.eigens[spin, k, band]
-                            for l in range(lmax + 1):
-                                lso[l, spin] += wlsbk[l, spin, band, k] *\
-                                                weight * gaussian(self.mesh, self.width, center=e)
+                    # Select the (band, k) pairs that have been computed. Arrays are indexed by [band, k].
+                    valid = np.arange(ebands.mband)[:, None] < ebands.nband_sk[spin][None, :]
+                    wl = (wlsbk[:lmax + 1, spin] * weights)[:, valid]
+                    lso[:lmax + 1, spin] = gaussians_sum(self.mesh, ebands.eigens[spin].T[valid], self.width, weights=wl)
                 symbols_lso[symbol] = lso
 
         else:
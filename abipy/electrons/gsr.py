@@ -162,9 +162,7 @@ class GsrFile(AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWriter):
     @lazy_property
     def pressure(self):
         """Pressure in Gpa"""
-        HaBohr3_GPa = 29421.033 # 1 Ha/Bohr^3, in GPa
-        pressure = - (HaBohr3_GPa/3) * self.cart_stress_tensor.trace()
-        return units.FloatWithUnit(pressure, unit="GPa", unit_type="pressure")
+        return self.reader.read_pressure(stress_tensor=self.cart_stress_tensor)
 
     @lazy_property
     def residm(self):
@@ -346,6 +344,16 @@ class GsrReader(ElectronsReader):
 
         return tensor
 
+    def read_pressure(self, stress_tensor=None):
+        """
+        Return the pressure in GPa computed from the stress tensor.
+        stress_tensor is read from file if not provided.
+        """
+        if stress_tensor is None: stress_tensor = self.read_cart_stress_tensor()
+        HaBohr3_GPa = 29421.033 # 1 Ha/Bohr^3, in GPa
+        pressure = - (HaBohr3_GPa/3) * stress_tensor.trace()
+        return units.FloatWithUnit(pressure, unit="GPa", unit_type="pressure")
+
     def read_energy_terms(self, unit="eV"):
         """
         Return a dictionary of `Energies` with the different contributions to the total electronic energy.
@@ -370,7 +370,6 @@ class ScrReader(ETSF_Reader):
         kpoint, ik = self.find_kpoint_fileindex(kpoint)
 
         # FIXME ecuteps is missing
-        # TODO: Gpshere.find is very slow if we don't take advantage of shells
         ecuteps = 2
         gsphere = GSphere(ecuteps, self.structure.reciprocal_lattice, kpoint, gvecs)
 
@@ -552,6 +551,23 @@ class _AwggMatrix(object):
         if duck.is_intlike(gvec): return int(gvec)
         return self.gsphere.index(gvec)
 
+    def gindices(self, gvecs):
+        """
+        Find the indices of the G-vectors in `gvecs` with a single call.
+        Raises `ValueError` if one of the G-vectors is not found.
+        """
+        return self.gsphere.indices(gvecs)
+
+    def get_shell_block(self, ishell, jshell=None, atol=1e-6):
+        """
+        Return the [nw, ng_ishell, ng_jshell] block of the matrix for the G-vectors
+        in the shells `ishell` and `jshell` (default: ishell). See :meth:`GSphere.get_shells`.
+        """
+        shells = self.gsphere.get_shells(atol=atol).shells
+        ig1 = shells[ishell]
+        ig2 = ig1 if jshell is None else shells[jshell]
+        return self.wggmat[:, ig1[:, None], ig2[None, :]]
+
     def latex_label(self, cplx_mode):
         """Return a latex string that can be used in matplotlib plots."""
         return _latex_symbol_cplxmode(self.latex_name, cplx_mode)
@@ -47,6 +47,9 @@ class AwggMatTest(AbipyTest):
         assert f.windex(3j) == 3
         assert f.gindex([1, 0, 0]) == 1
         assert f.gindex(0) == 0
+        self.assert_equal(f.gindices([[1, 0, 0], [0, 0, 0]]), [1, 0])
+        block = f.get_shell_block(0)
+        assert block.shape == (f.nw, len(gsphere.get_shells().shells[0]), len(gsphere.get_shells().shells[0]))
 
         for cplx_mode in ("re", "im", "abs", "angle"):
             assert len(f.latex_label(cplx_mode))
@@ -3,6 +3,7 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 
 from .xsf import *
 from .visualizer import *
+from .ncpool import *
 
 import pymatgen.io.abinit.netcdf as ionc
 
@@ -13,7 +14,62 @@ class ETSF_Reader(ionc.ETSF_Reader):
     """
     Overrides the read_structure method so that we always return
     an instance of our Structure object
+
+    The reader can be registered in a :class:`NcHandlePool` that closes the file
+    when too many files are open. The file is reopened when `rootgrp` is accessed.
     """
+    # Handle pool (None if pooling is disabled) and True if the file has been closed by the pool.
+    _pool = None
+    _suspended = False
+
+    @property
+    def rootgrp(self):
+        """netCDF4 Dataset."""
+        if self._pool is None: return self._rootgrp
+        return self._pool.acquire(self)
+
+    @rootgrp.setter
+    def rootgrp(self, rootgrp):
+        self._rootgrp = rootgrp
+
+    @property
+    def handle_pool(self):
+        """:class:`NcHandlePool` managing the file. None if pooling is disabled."""
+        return self._pool
+
+    @property
+    def is_suspended(self):
+        """True if the file has been closed by the handle pool."""
+        return self._suspended
+
+    def set_handle_pool(self, pool):
+        """Register the reader in `pool`. None to disable pooling."""
+        if pool is self._pool: return
+        if self._pool is not None: self._pool.discard(self)
+        if self._suspended: self._resume()
+        self._pool = pool
+        if pool is not None: pool.acquire(self)
+
+    def _suspend(self):
+        """Close the file. Called by the pool."""
+        if self._suspended: return
+        self._rootgrp.close()
+        self._suspended = True
+
+    def _resume(self):
+        """Reopen the file closed by the pool."""
+        import netCDF4
+        self._rootgrp = netCDF4.Dataset(self.path, mode="r")
+        self._suspended = False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.discard(self)
+            self._pool = None
+        # The file has been already closed by the pool.
+        if self._suspended: return
+        super(ETSF_Reader, self).close()
+
     def read_structure(self):
         from abipy.core.structure import Structure
         return Structure.from_file(self.path)
@@ -15,6 +15,8 @@ from pymatgen.core.units import bohr_to_angstrom
 __all__ = [
     "cube_write_structure_mesh",
     "cube_write_data",
+    "cube_read_data",
+    "cube_read_structure_mesh_data",
 ]
 
 
@@ -34,16 +36,76 @@ def cube_write_structure_mesh(file, structure, mesh):
         fwrite('{:d} {:.10f} {:.10f} {:.10f} {:.10f}\n'.format(site.specie.Z, 0.0, cc[0], cc[1], cc[2]))
 
 
-def cube_write_data(file, data, mesh):
+def cube_write_data(file, data, mesh, chunk_size=2**20):
+    """
+    Write the volumetric data in the cube format (one value per line, C-order).
+
+    Args:
+        file: file-like object.
+        data: [nx, ny, nz] array in Angstrom units. Any object supporting slicing along the first
+            dimension can be used (e.g. `np.memmap` or netCDF variables) as the data is read and formatted
+            in slabs of planes along x.
+        mesh: :class:`Mesh3D` object.
+        chunk_size: Approximate number of values formatted at once.
+    """
     fwrite = file.write
-    data_bohrs = data * (bohr_to_angstrom ** 3)
-    for ix in range(mesh.nx):
-        for iy in range(mesh.ny):
-            for iz in range(mesh.nz):
-                fwrite('{:.5e}\n'.format(data_bohrs[ix, iy, iz]))
+    nx, ny, nz = mesh.shape
+    nplanes = max(1, chunk_size // (ny * nz))
+    factor = bohr_to_angstrom ** 3
+    for start in range(0, nx, nplanes):
+        slab = np.asarray(data[start:start + nplanes]).ravel() * factor
+        fwrite(("{:.5e}\n" * len(slab)).format(*slab))
+
+
+def cube_read_data(fh, shape, out=None, chunk_bytes=2**24):
+    """
+    Read the volumetric data from the file object `fh` positioned after the header of a cube file.
+    Data is parsed in chunks of lines and returned in Angstrom units.
+
+    Args:
+        fh: File object.
+        shape: Shape of the mesh (nx, ny, nz).
+        out: Optional array (e.g. `np.memmap`) of shape `shape` used to store the results.
+        chunk_bytes: Approximate number of bytes parsed at once.
+
+    Return:
+        [nx, ny, nz] array.
+    """
+    size = int(np.prod(shape))
+    data = np.empty(shape) if out is None else out
+    flat = data.reshape(-1)
+    if not np.may_share_memory(flat, data):
+        raise ValueError("out must be a contiguous array")
+
+    factor = 1.0 / (bohr_to_angstrom ** 3)
+    ii = 0
+    while True:
+        lines = fh.readlines(chunk_bytes)
+        if not lines: break
+        vals = np.fromstring(" ".join(lines), sep=" ")
+        if ii + len(vals) > size:
+            raise ValueError('Wrong number of data points ...')
+        flat[ii:ii + len(vals)] = vals * factor
+        ii += len(vals)
+
+    if ii != size:
+        raise ValueError('Wrong number of data points ...')
+
+    return data
 
 
-def cube_read_structure_mesh_data(file):
+def cube_read_structure_mesh_data(file, out=None):
+    """
+    Read the structure, the mesh and the volumetric data from the cube file `file`.
+
+    Args:
+        file: Path of the cube file.
+        out: Optional array (e.g. `np.memmap`) of shape [nx, ny, nz] used to store the data.
+            Useful to read files that do not fit in memory.
+
+    Return:
+        (structure, mesh, data)
+    """
     with open(file, 'r') as fh:
         # The two first lines are comments
         for ii in range(2):
@@ -68,15 +130,7 @@ def cube_read_structure_mesh_data(file):
             cc = np.array([float(sp[ii]) for ii in range(2, 5)]) * bohr_to_angstrom
             sites.append(PeriodicSite(int(sp[0]), coords=cc, lattice=lattice, to_unit_cell=False,
                                       coords_are_cartesian=True))
-        data = np.zeros((nx, ny, nz))
-        ii = 0
-        for line in fh:
-            for val in line.split():
-                data[ii//(ny*nz), (ii//nz)%ny, ii%nz] = float(val)
-                ii += 1
-        data = data / (bohr_to_angstrom ** 3)
-        if ii != nx*ny*nz:
-            raise ValueError('Wrong number of data points ...')
+        data = cube_read_data(fh, (nx, ny, nz), out=out)
         from abipy.core.structure import Structure
         structure = Structure.from_sites(sites=sites)
         from abipy.core.mesh3d import Mesh3D
@@ -0,0 +1,99 @@
+# coding: utf-8
+"""Pool of open netCDF handles with LRU replacement."""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import threading
+
+from collections import OrderedDict
+from abipy.tools.cachetools import CacheStatsMixin
+
+
+__all__ = [
+    "NcHandlePool",
+]
+
+
+class NcHandlePool(CacheStatsMixin):
+    """
+    Pool with the netCDF readers that are allowed to keep their file open.
+
+    At most `maxsize` files are kept open. When the capacity is exceeded, the least recently used file
+    is closed and reopened transparently the next time the reader accesses the file.
+    The objects built from the file (e.g. lazy properties) are not affected.
+
+    The pool keeps a reference to the readers until they are closed.
+    Note that readers must not be used by other threads while the pool closes their files.
+
+    Usage example:
+
+    .. code-block:: python
+
+        pool = NcHandlePool(maxsize=256)
+        gsr.set_handle_pool(pool)
+        print(pool.get_stats())
+    """
+    # Counters. See CacheStatsMixin.
+    # hits: file already open. misses: reader not in the pool.
+    # reopens: misses that required reopening a file closed by the pool.
+    # evictions: files closed by the pool.
+    COUNTERS = ("hits", "misses", "reopens", "evictions")
+
+    def __init__(self, maxsize=128):
+        """
+        Args:
+            maxsize: Maximum number of files that can be open at the same time.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize should be >= 1 but got %s" % maxsize)
+        self.maxsize = maxsize
+        self._readers = OrderedDict()
+        self._lock = threading.RLock()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._readers)
+
+    def __contains__(self, reader):
+        return id(reader) in self._readers
+
+    def _extra_stats(self):
+        """Size of the pool."""
+        return OrderedDict([("maxsize", self.maxsize), ("nopen", len(self))])
+
+    def acquire(self, reader):
+        """
+        Return the netCDF4 Dataset of `reader` and mark it as the most recently used.
+        The file is reopened if it has been closed by the pool.
+        """
+        key = id(reader)
+        with self._lock:
+            if key in self._readers:
+                self.hits += 1
+                # Move to the end.
+                self._readers[key] = self._readers.pop(key)
+            else:
+                self.misses += 1
+                if reader.is_suspended:
+                    reader._resume()
+                    self.reopens += 1
+                self._readers[key] = reader
+
+                while len(self._readers) > self.maxsize:
+                    _, lru_reader = self._readers.popitem(last=False)
+                    lru_reader._suspend()
+                    self.evictions += 1
+
+            return reader._rootgrp
+
+    def discard(self, reader):
+        """Remove `reader` from the pool. The file is not closed."""
+        with self._lock:
+            self._readers.pop(id(reader), None)
+
+    def suspend_all(self):
+        """Close all the files in the pool. They will be reopened on demand."""
+        with self._lock:
+            for reader in self._readers.values():
+                reader._suspend()
+                self.evictions += 1
+            self._readers.clear()
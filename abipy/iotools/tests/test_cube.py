@@ -32,6 +32,28 @@ from abipy.core.mesh3d import Mesh3D
 
 class TestCubeUtils(AbipyTest):
 
+    def test_cube_write_read(self):
+        """Testing CUBE files written and read in chunks."""
+        from abipy.iotools.cube import cube_write_structure_mesh, cube_write_data, cube_read_structure_mesh_data
+        structure = data.structure_from_ucell("Si")
+        mesh = Mesh3D((3, 4, 5), structure.lattice.matrix)
+        values = np.random.rand(*mesh.shape)
+
+        tmp_cubefile = self.get_tmpname(text=True)
+        with open(tmp_cubefile, mode="wt") as fh:
+            cube_write_structure_mesh(fh, structure, mesh)
+            cube_write_data(fh, values, mesh, chunk_size=1)
+
+        new_structure, new_mesh, new_values = cube_read_structure_mesh_data(tmp_cubefile)
+        assert len(new_structure) == len(structure)
+        assert new_mesh.shape == mesh.shape
+        self.assert_almost_equal(new_values, values, decimal=5)
+
+        mmap = np.lib.format.open_memmap(self.get_tmpname(suffix=".npy"), mode="w+", shape=mesh.shape)
+        _, _, mmap_values = cube_read_structure_mesh_data(tmp_cubefile, out=mmap)
+        assert mmap_values is mmap
+        self.assert_equal(mmap_values, new_values)
+
     @unittest.skip("Si.in.rhoc file is missing!")
     def test_aecore_density(self):
         """Testing ae_core_density_on_mesh."""
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""Tests for ncpool module"""
+from __future__ import print_function, division
+
+import abipy.data as abidata
+
+from abipy.core.testing import AbipyTest
+from abipy.iotools import ETSF_Reader, NcHandlePool
+
+
+class TestNcHandlePool(AbipyTest):
+
+    def test_lru_pool(self):
+        """Testing NcHandlePool with ETSF_Reader."""
+        with self.assertRaises(ValueError):
+            NcHandlePool(maxsize=0)
+
+        pool = NcHandlePool(maxsize=1)
+        filepaths = [abidata.ref_file("si_scf_GSR.nc"), abidata.ref_file("si_nscf_GSR.nc")]
+        readers = [ETSF_Reader(path) for path in filepaths]
+        etotals = [r.read_value("etotal") for r in readers]
+
+        for r in readers:
+            r.set_handle_pool(pool)
+            assert r.handle_pool is pool
+        assert len(pool) == 1 and pool.evictions == 1
+        assert readers[0].is_suspended and not readers[1].is_suspended
+
+        # Files are reopened on demand.
+        for i in range(3):
+            for r, etotal in zip(readers, etotals):
+                self.assert_equal(r.read_value("etotal"), etotal)
+        stats = pool.get_stats()
+        assert stats["nopen"] == 1 and stats["reopens"] >= 6 and stats["hits"] > 0
+        str(pool)
+
+        for r in readers:
+            r.close()
+        assert len(pool) == 0
+
+        # Readers are not registered in a pool when they are created.
+        with ETSF_Reader(filepaths[0]) as r:
+            assert r.handle_pool is None and len(pool) == 0
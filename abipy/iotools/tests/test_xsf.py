@@ -99,6 +99,15 @@ END_BLOCK_DATAGRID_3D
         with self.assertRaises(ValueError):
             xsf_write_data(tmp_file, self.mgb2, cplx_data, cplx_mode="foobar", add_replicas=True)
 
+        # Stream the data in slabs of one z-plane from a memory-mapped array.
+        tmp_file.seek(0)
+        tmp_file.truncate()
+        mmap = np.lib.format.open_memmap(self.get_tmpname(suffix=".npy"), mode="w+", dtype=data.dtype, shape=data.shape)
+        mmap[...] = data
+        xsf_write_data(tmp_file, self.mgb2, mmap, add_replicas=True, chunk_size=1)
+        tmp_file.seek(0)
+        self.assertMultiLineEqual(tmp_file.read(), xsf_string)
+
         tmp_file.close()
 
     def test_bxsf_write(self):
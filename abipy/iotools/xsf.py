@@ -5,7 +5,6 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 import numpy as np
 
 from pymatgen.core.units import Energy, EnergyArray, ArrayWithUnit
-from abipy.tools import transpose_last3dims, add_periodic_replicas
 
 
 __all__ = [
@@ -65,14 +64,16 @@ def xsf_write_structure(file, structures):
                 fwrite(' %20.14f %20.14f %20.14f\n' % tuple(cart_forces[a]))
 
 
-def xsf_write_data(file, structure, data, add_replicas=True, cplx_mode=None):
+def xsf_write_data(file, structure, data, add_replicas=True, cplx_mode=None, chunk_size=2**20):
     """
     Write data in the Xcrysden format (XSF)
 
     Args:
         file: file-like object.
         structure: :class:`Structure` object.
-        data: array-like object in C-order, i.e data[nx,ny,nz]
+        data: array-like object in C-order, i.e data[nx,ny,nz] or data[ngrids,nx,ny,nz].
+            Any object supporting numpy slicing can be used (e.g. `np.memmap` or netCDF variables)
+            since the data is extracted and formatted in slabs of z-planes.
         add_replicas: If True, data is padded with redundant data points.
             in order to have a periodic 3D array of shape=(nx+1,ny+1,nz+1).
         cplx_mode: string defining the data to print when data is a complex array.
@@ -81,40 +82,41 @@ def xsf_write_data(file, structure, data, add_replicas=True, cplx_mode=None):
                 - "re"  for real part.
                 - "im" for imaginary part.
                 - "abs" for the absolute value
+        chunk_size: Approximate number of values formatted at once.
     """
     fwrite = file.write
 
-    # Check this one
-    if add_replicas:
-        data = add_periodic_replicas(data)
-
     if np.iscomplexobj(data):
         if cplx_mode is None:
             raise TypeError("cplx_mode must be specified when data is a complex array.")
         cplx_mode = cplx_mode.lower()
-        if cplx_mode == "re":
-            data = data.real
-        elif cplx_mode == "im":
-            data = data.imag
-        elif cplx_mode == "abs":
-            data = np.abs(data)
-        else:
+        if cplx_mode not in ("re", "im", "abs"):
             raise ValueError("Wrong value for cplx_mode: %s" % cplx_mode)
+    else:
+        cplx_mode = None
 
-    shape, ndim = data.shape, data.ndim
+    def tofloat(values):
+        if cplx_mode is None: return values
+        return dict(re=np.real, im=np.imag, abs=np.abs)[cplx_mode](values)
 
+    shape, ndim = tuple(data.shape), len(data.shape)
     if ndim == 3:
         ngrids = 1
-        data = np.asarray([data])
     elif ndim == 4:
         ngrids = shape[0]
     else:
         raise ValueError("ndim %d is not supported" % ndim)
 
-    # Xcrysden uses Fortran-order.
-    # Transpose (...,x,y,z) --> (...,z,y,x) to speed up the write below.
-    fdata = transpose_last3dims(data)
-    fgrid = fdata.shape[-3:]
+    # Indices of the points along x, y, z (including the periodic replicas).
+    nx, ny, nz = shape[-3:]
+    ix, iy = np.arange(nx), np.arange(ny)
+    if add_replicas:
+        ix, iy = np.append(ix, 0), np.append(iy, 0)
+    npx, npy, npz = len(ix), len(iy), nz + 1 if add_replicas else nz
+    # Xcrysden uses Fortran-order: each line contains the x-values for given (y, z),
+    # a blank line separates the z-planes.
+    plane_fmt = (" ".join(["%f"] * npx) + "\n") * npy + "\n"
+    nplanes = max(1, chunk_size // (npx * npy))
 
     cell = structure.lattice_vectors(space="r")
     origin = np.zeros(3)
@@ -124,18 +126,23 @@ def xsf_write_data(file, structure, data, add_replicas=True, cplx_mode=None):
 
     for dg in range(ngrids):
         fwrite(" BEGIN_DATAGRID_3Dgrid#" + str(dg+1) + "\n")
-        fwrite('%d %d %d\n' % shape[-3:])
+        fwrite('%d %d %d\n' % (npx, npy, npz))
 
         fwrite('%f %f %f\n' % tuple(origin))
         for i in range(3):
             fwrite('%f %f %f\n' % tuple(cell[i]))
 
-        for z in range(fgrid[0]):
-            for y in range(fgrid[1]):
-                slice_x = fdata[dg,z,y]
-                fwrite(' '.join(['%f' % d for d in slice_x]) )
-                fwrite('\n')
-            fwrite('\n')
+        for start in range(0, npz, nplanes):
+            # Extract the slab [nx, ny, z0:z1] (plus the replica of the first plane if needed)
+            # and transpose it to (z, y, x).
+            stop = min(start + nplanes, npz)
+            zs = slice(start, min(stop, nz))
+            slab = np.asarray(data[dg, :, :, zs] if ndim == 4 else data[:, :, zs])
+            if stop > nz:
+                first = np.asarray(data[dg, :, :, :1] if ndim == 4 else data[:, :, :1])
+                slab = np.concatenate((slab, first), axis=-1)
+            slab = tofloat(slab)[ix][:, iy].transpose(2, 1, 0).reshape(stop - start, -1)
+            fwrite("".join(plane_fmt % tuple(vals) for vals in slab))
 
         fwrite(' END_DATAGRID_3D\n')
     fwrite('END_BLOCK_DATAGRID_3D\n')
@@ -0,0 +1,72 @@
+# coding: utf-8
+"""Helper functions and mixin classes shared by the caches (row cache, abiget cache, handle pool)."""
+from __future__ import print_function, division, unicode_literals, absolute_import
+
+import json
+import numpy as np
+
+from collections import OrderedDict
+
+
+__all__ = [
+    "json_key",
+    "CacheStatsMixin",
+]
+
+
+def _json_key_default(obj):
+    """
+    Convert the objects that are not supported by json. numpy objects are converted to python objects,
+    :class:`Kpoint` objects to the list with the full-precision reduced coordinates.
+    Raise TypeError for the other objects: repr may lose information (or contain the memory address)
+    and cannot be used to build a key.
+    """
+    if isinstance(obj, np.ndarray): return obj.tolist()
+    if isinstance(obj, np.generic): return obj.item()
+    from abipy.core.kpoints import Kpoint
+    if isinstance(obj, Kpoint): return obj.frac_coords.tolist()
+    raise TypeError("Object of type %s cannot be used to build the key of a cache" % type(obj))
+
+
+def json_key(obj):
+    """
+    Return string with the json representation of `obj` (keys are sorted) used to build the key of a cache.
+    Raise TypeError if obj contains objects that cannot be converted unambiguously.
+    """
+    return json.dumps(obj, sort_keys=True, default=_json_key_default)
+
+
+class CacheStatsMixin(object):
+    """
+    Mixin class providing the counters of a cache and the methods to report them.
+    Subclasses define the names of the counters in `COUNTERS` and may add entries
+    with `_extra_stats` and change the title of the report with `_stats_title`.
+    """
+    # Names of the counters.
+    COUNTERS = ()
+
+    def reset_stats(self):
+        """Reset the counters."""
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def get_stats(self):
+        """Return OrderedDict with the counters and the additional info provided by the cache."""
+        stats = OrderedDict([(name, getattr(self, name)) for name in self.COUNTERS])
+        stats.update(self._extra_stats())
+        return stats
+
+    def _extra_stats(self):
+        return OrderedDict()
+
+    def _stats_title(self):
+        return self.__class__.__name__
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, verbose=0):
+        """String with the statistics of the cache."""
+        lines = [self._stats_title()]
+        lines.extend("%s: %s" % (k, v) for k, v in self.get_stats().items())
+        return "\n".join(lines)
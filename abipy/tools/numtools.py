@@ -3,9 +3,11 @@
 from __future__ import print_function, division, unicode_literals, absolute_import
 
 import numpy as np
+import itertools
 import bisect as bs
 
 from monty.collections import dict2namedtuple
+from monty.functools import lazy_property
 from abipy.tools import duck
 
 #########################################################################################
@@ -50,15 +52,10 @@ def add_periodic_replicas(arr):
         oshape[-3:] = oshape[-3:] + 1
         oarr = np.empty(oshape, dtype=arr.dtype)
 
-        for x in range(ishape[-3]):
-            for y in range(ishape[-2]):
-                oarr[..., x, y, :-1] = arr[..., x, y, :]
-                oarr[..., x, y, -1] = arr[..., x, y, 0]
-
-            oarr[..., x, y + 1, :-1] = arr[..., x, 0, :]
-            oarr[..., x, y + 1, -1] = arr[..., x, 0, 0]
-
-        oarr[..., x + 1, :, :] = oarr[..., 0, :, :]
+        oarr[..., :-1, :-1, :-1] = arr
+        oarr[..., :-1, :-1, -1] = arr[..., 0]
+        oarr[..., :-1, -1, :] = oarr[..., :-1, 0, :]
+        oarr[..., -1, :, :] = oarr[..., 0, :, :]
 
     return oarr
 
@@ -131,6 +128,170 @@ def gaussian(x, width, center=0.0, height=None):
 
     return height * np.exp(-((x - center) / width) ** 2 / 2.)
 
+
+def _is_linear_mesh(mesh, rtol=1e-6):
+    """True if mesh is a linear mesh with at least two points."""
+    if len(mesh) < 2: return False
+    step = mesh[1] - mesh[0]
+    return step > 0 and np.allclose(np.diff(mesh), step, rtol=rtol, atol=0)
+
+
+def gaussians_sum(mesh, centers, width, weights=None, algo="truncated", nsigma=8.0, chunk_size=2**22):
+    r"""
+    Compute the sum of normalized gaussians on `mesh`:
+
+        :math:`f(x) = \sum_i w_i g(x - c_i)`
+
+    This is the kernel used to compute DOS-like quantities with gaussian broadening.
+
+    Args:
+        mesh: Array with the points where f(x) is evaluated. "truncated" and "histogram"
+            require a linear mesh, "direct" is used for non-linear meshes.
+        centers: Array with the centers of the gaussians. Any shape.
+        width: Standard deviation of the gaussian.
+        weights: None for unit weights. Array broadcastable to the shape of `centers`.
+            Leading extra dimensions, i.e. shape (..., \*centers.shape), compute
+            several weighted sums in one call (e.g. projected DOS).
+        algo: "truncated": gaussians are evaluated only within `nsigma` standard deviations
+                from the center and accumulated with `np.bincount`. Equivalent to "direct" to within exp(-nsigma**2/2).
+            "histogram": linear binning of the weights on the mesh (weight and center of mass are conserved)
+                followed by FFT convolution with the gaussian kernel. Fastest option for large numbers of centers,
+                the error scales as (step/width)**2.
+            "direct": dense evaluation in blocks (reference implementation).
+        nsigma: Support of the gaussians in units of width (used by "truncated" and "histogram")
+        chunk_size: Maximum number of floats allocated for temporary arrays.
+
+    Returns:
+        Array with shape (nw,) or (..., nw) if weights has extra dimensions.
+    """
+    mesh = np.asarray(mesh)
+    centers = np.asarray(centers)
+    nw, cshape = len(mesh), centers.shape
+    centers = centers.ravel()
+    nc = len(centers)
+
+    if weights is None:
+        extra_dims = ()
+        weights = np.ones((1, nc))
+    else:
+        weights = np.asarray(weights)
+        extra_dims = weights.shape[:max(weights.ndim - len(cshape), 0)]
+        weights = np.reshape(np.broadcast_to(weights, extra_dims + cshape), (-1, nc))
+    nsets = weights.shape[0]
+
+    if algo not in ("truncated", "histogram", "direct"):
+        raise ValueError("Invalid algo: %s" % str(algo))
+    if algo != "direct" and not _is_linear_mesh(mesh):
+        algo = "direct"
+
+    out = np.zeros((nsets, nw))
+    if nc == 0:
+        return np.reshape(out, extra_dims + (nw,))
+
+    if algo == "direct":
+        bsize = max(1, chunk_size // nw)
+        for start in range(0, nc, bsize):
+            stop = min(start + bsize, nc)
+            gmat = gaussian(mesh[None, :], width, center=centers[start:stop, None])
+            out += np.dot(weights[:, start:stop], gmat)
+
+    else:
+        step = mesh[1] - mesh[0]
+        nhalf = int(np.ceil(nsigma * width / step))
+        offsets = np.arange(-nhalf, nhalf + 1)
+
+        if algo == "truncated":
+            bsize = max(1, chunk_size // len(offsets))
+            for start in range(0, nc, bsize):
+                stop = min(start + bsize, nc)
+                cs = centers[start:stop]
+                # Index of the mesh points within the support of each gaussian.
+                inds = np.rint((cs - mesh[0]) / step).astype(np.int)[:, None] + offsets
+                mask = (inds >= 0) & (inds < nw)
+                gvals = gaussian(mesh[0] + inds[mask] * step, width, center=np.broadcast_to(cs[:, None], inds.shape)[mask])
+                inds = inds[mask]
+                for iset in range(nsets):
+                    wvals = np.broadcast_to(weights[iset, start:stop, None], mask.shape)[mask]
+                    out[iset] += np.bincount(inds, weights=wvals * gvals, minlength=nw)
+
+        elif algo == "histogram":
+            # Linear binning on the mesh padded with nhalf points on each side
+            # so that gaussians centered outside the mesh contribute with their tails.
+            npad = nw + 2 * nhalf
+            x = (centers - mesh[0]) / step + nhalf
+            ileft = np.floor(x).astype(np.int)
+            t = x - ileft
+            hist = np.zeros((nsets, npad))
+            for inds, fact in ((ileft, 1 - t), (ileft + 1, t)):
+                mask = (inds >= 0) & (inds < npad)
+                for iset in range(nsets):
+                    hist[iset] += np.bincount(inds[mask], weights=weights[iset, mask] * fact[mask], minlength=npad)
+
+            # Convolution with the kernel via FFT. See numpy.convolve for the indexing of the full convolution.
+            kernel = gaussian(offsets * step, width)
+            nfft = npad + len(kernel) - 1
+            conv = np.fft.irfft(np.fft.rfft(hist, nfft, axis=-1) * np.fft.rfft(kernel, nfft), nfft, axis=-1)
+            out[:] = conv[:, 2 * nhalf:2 * nhalf + nw]
+
+    return np.reshape(out, extra_dims + (nw,))
+
+
+# Decomposition of the cube in six tetrahedra sharing the main diagonal 0-7.
+# Vertices are indexed with 4 * i + 2 * j + k where (i, j, k) are the vertices of the unit cube.
+_TETRA_CUBE = np.array([[0, 1, 3, 7], [0, 1, 5, 7], [0, 2, 3, 7], [0, 2, 6, 7], [0, 4, 5, 7], [0, 4, 6, 7]])
+
+
+def tetra_dos(mesh, eigens_grid, chunk_size=2**22):
+    """
+    Compute the DOS with the linear tetrahedron method (no Bloechl corrections).
+
+    Args:
+        mesh: Array with the energies where the DOS is evaluated.
+        eigens_grid: Array with shape [n1, n2, n3, nband] with the eigenvalues
+            on the full (periodic) k-grid. The grid can be shifted.
+        chunk_size: Maximum number of floats allocated for temporary arrays.
+
+    Returns:
+        Array with the DOS on the mesh. Each band is normalized to one.
+    """
+    mesh = np.asarray(mesh)
+    eigens_grid = np.asarray(eigens_grid)
+    n1, n2, n3, nband = eigens_grid.shape
+    nkbz, nw = n1 * n2 * n3, len(mesh)
+
+    # Indices of the 8 vertices of the sub-cube starting at each grid point (periodic boundary conditions).
+    i1, i2, i3 = np.meshgrid(np.arange(n1), np.arange(n2), np.arange(n3), indexing="ij")
+    corners = np.empty((8, nkbz), dtype=np.int)
+    for ic in range(8):
+        di, dj, dk = (ic >> 2) & 1, (ic >> 1) & 1, ic & 1
+        corners[ic] = np.ravel_multi_index((((i1 + di) % n1).ravel(), ((i2 + dj) % n2).ravel(), ((i3 + dk) % n3).ravel()),
+                                           (n1, n2, n3))
+
+    # Sorted energies at the vertices of all the tetrahedra: [ntetra * nband, 4]
+    eigens_bz = np.reshape(eigens_grid, (nkbz, nband))
+    enes = np.empty((6, nkbz, nband, 4))
+    for it, tetra in enumerate(_TETRA_CUBE):
+        for iv in range(4):
+            enes[it, :, :, iv] = eigens_bz[corners[tetra[iv]]]
+    enes = np.sort(np.reshape(enes, (-1, 4)), axis=-1)
+
+    dos = np.zeros(nw)
+    bsize = max(1, chunk_size // nw)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, len(enes), bsize):
+            e1, e2, e3, e4 = [enes[start:start + bsize, i, None] for i in range(4)]
+            e21, e31, e41, e32, e42, e43 = e2 - e1, e3 - e1, e4 - e1, e3 - e2, e4 - e2, e4 - e3
+            ee = mesh[None, :]
+            g = np.where((ee >= e1) & (ee < e2), 3 * (ee - e1) ** 2 / (e21 * e31 * e41), 0.0)
+            g += np.where((ee >= e2) & (ee < e3),
+                (3 * e21 + 6 * (ee - e2) - 3 * (e31 + e42) * (ee - e2) ** 2 / (e32 * e42)) / (e31 * e41), 0.0)
+            g += np.where((ee >= e3) & (ee < e4), 3 * (e4 - ee) ** 2 / (e41 * e42 * e43), 0.0)
+            dos += np.sum(g, axis=0)
+
+    # Each tetrahedron has volume 1 / (6 * nkbz) in units of the BZ volume.
+    return dos / (6 * nkbz)
+
+
 #=====================================
 # === Data Interpolation/Smoothing ===
 #=====================================
@@ -241,38 +402,44 @@ def find_convindex(values, tol, min_numpts=1, mode="abs", vinf=None):
 class BlochRegularGridInterpolator(object):
     """
     This object interpolates the periodic part of a Bloch state in real space.
+
+    The interpolation is periodic-aware: the indices of the gridpoints surrounding the interpolation points
+    are wrapped inside the unit cell hence no copy of the input array is needed and all the `ndt` components
+    are evaluated in a single pass. Three methods are available:
+
+        - "linear": trilinear interpolation (8 gridpoints).
+        - "cubic": tricubic convolution interpolation (Catmull-Rom kernel, 64 gridpoints), smoother than
+          "linear" and exact for quadratic functions.
+        - "fourier": trigonometric interpolation i.e. the Fourier series of the data.
+          Exact for band-limited functions such as smooth densities, but each point costs O(nx*ny*nz).
     """
 
-    def __init__(self, structure, datar, add_replicas=True):
+    def __init__(self, structure, datar, add_replicas=True, method="linear"):
         """
         Args:
             structure: :class:`Structure` object.
-            datar: [ndt, nx, ny, nz] array.
-            add_replicas: If True, data is padded with redundant data points.
-                in order to have a periodic 3D array of shape=[ndt, nx+1, ny+1, nz+1].
+            datar: [ndt, nx, ny, nz] array. The data is not copied so that `np.memmap` arrays
+                can be used. Only the gridpoints surrounding the interpolation points are read ("linear", "cubic").
+            add_replicas: Not used, the periodic images are handled with wrapped indices.
+                Kept for backward compatibility.
+            method: Interpolation method: "linear", "cubic" or "fourier".
         """
-        from scipy.interpolate import RegularGridInterpolator
         self.structure = structure
-
-        if add_replicas:
-            datar = add_periodic_replicas(datar)
+        if method not in ("linear", "cubic", "fourier"):
+            raise ValueError("Wrong interpolation method: %s" % str(method))
+        self.method = method
 
         self.dtype = datar.dtype
-        # We want a 4d array (ndt arrays of shape (nx, ny, nz)
-        nx, ny, nz = datar.shape[-3:]
-        datar = np.reshape(datar, (-1,) + (nx, ny, nz))
-        self.ndt = len(datar)
-        x = np.linspace(0, 1, num=nx)
-        y = np.linspace(0, 1, num=ny)
-        z = np.linspace(0, 1, num=nz)
-
-        # Build `ndt` interpolators. Note that RegularGridInterpolator supports
-        # [nx, ny, nz, ...] arrays but then each call operates on the full set of
-        # ndt components and this complicates the declation of callbacks
-        # operating on a single component.
-        self._interpolators = [None] * self.ndt
-        for i in range(self.ndt):
-            self._interpolators[i] = RegularGridInterpolator((x, y, z), datar[i])
+        # We want a 2d array (ndt arrays of shape (nx * ny * nz).
+        self.ngrid = np.array(datar.shape[-3:])
+        self._datar = np.reshape(datar, (-1, np.prod(self.ngrid)))
+        self.ndt = len(self._datar)
+
+    @lazy_property
+    def _datag(self):
+        """[ndt, nx, ny, nz] array with the Fourier coefficients of the data (method == "fourier")."""
+        datar = np.reshape(self._datar, (self.ndt,) + tuple(self.ngrid))
+        return np.fft.fftn(datar, axes=(-3, -2, -1)) / np.prod(self.ngrid)
 
     def eval_line(self, point1, point2, num=200, cartesian=False, kpoint=None):
         """
@@ -295,36 +462,52 @@ class BlochRegularGridInterpolator(object):
             dist: the distance of points along the line in Ang.
             values: numpy array of shape [ndt, num] with interpolated values.
         """
-        site1 = None
-        if duck.is_intlike(point1):
-            if point1 > len(self.structure):
-                raise ValueError("point1: %s > natom: %s" % (point1, len(self.structure)))
-            site1 = self.structure[point1]
-            point1 = site1.coords if cartesian else site1.frac_coords
-
-        site2 = None
-        if duck.is_intlike(point2):
-            if point2 > len(self.structure):
-                raise ValueError("point2: %s > natom: %s" % (point2, len(self.structure)))
-            site2 = self.structure[point2]
-            point2 = site2.coords if cartesian else site2.frac_coords
-
-        point1 = np.reshape(point1, (3,))
-        point2 = np.reshape(point2, (3,))
-        if cartesian:
-            red_from_cart = self.structure.lattice.inv_matrix.T
-            point1 = np.dot(red_from_cart, point1)
-            point2 = np.dot(red_from_cart, point2)
+        return self.eval_lines([(point1, point2)], num=num, cartesian=cartesian, kpoint=kpoint)[0]
 
-        p21 = point2 - point1
-        line_points = np.reshape([alpha * p21 for alpha in np.linspace(0, 1, num=num)], (-1, 3))
-        dist = self.structure.lattice.norm(line_points)
-        line_points += point1
+    def eval_lines(self, point_pairs, num=200, cartesian=False, kpoint=None):
+        """
+        Interpolate values along several lines with a single call to `eval_points`.
 
-        return dict2namedtuple(site1=site1, site2=site2, points=line_points, dist=dist,
-                               values=self.eval_points(line_points, kpoint=kpoint))
+        Args:
+            point_pairs: List of (point1, point2) tuples. See `eval_line` for the API.
+            num: Number of points sampled along each line.
+            cartesian: True if points are in cartesian coordinates.
+            kpoint: k-point in reduced coordinates. If not None, the phase-factor e^{ikr} is included.
 
-    def eval_points(self, frac_coords, idt=None, cartesian=False, kpoint=None):
+        Return: list of named tuples. See `eval_line`.
+        """
+        lines = []
+        for point1, point2 in point_pairs:
+            site1, point1 = self._get_site_and_point(point1, "point1", cartesian)
+            site2, point2 = self._get_site_and_point(point2, "point2", cartesian)
+            p21 = point2 - point1
+            line_points = np.linspace(0, 1, num=num)[:, None] * p21
+            dist = np.sqrt(np.sum(np.dot(line_points, self.structure.lattice.matrix) ** 2, axis=1))
+            lines.append((site1, site2, line_points + point1, dist))
+
+        if not lines: return []
+        values = self.eval_points(np.concatenate([l[2] for l in lines]), kpoint=kpoint)
+
+        return [dict2namedtuple(site1=site1, site2=site2, points=points, dist=dist,
+                                values=values[:, i*num:(i+1)*num])
+                for i, (site1, site2, points, dist) in enumerate(lines)]
+
+    def _get_site_and_point(self, point, name, cartesian):
+        """Return (site, frac_coords). site is None if `point` is not an integer."""
+        site = None
+        if duck.is_intlike(point):
+            if point > len(self.structure):
+                raise ValueError("%s: %s > natom: %s" % (name, point, len(self.structure)))
+            site = self.structure[point]
+            point = site.coords if cartesian else site.frac_coords
+
+        point = np.reshape(point, (3,))
+        if cartesian:
+            point = np.dot(point, self.structure.lattice.inv_matrix)
+
+        return site, point
+
+    def eval_points(self, frac_coords, idt=None, cartesian=False, kpoint=None, chunk_size=2**14):
         """
         Interpolate values on an arbitrary list of points.
 
@@ -333,27 +516,74 @@ class BlochRegularGridInterpolator(object):
             idt: Index of the sub-array to interpolate. If None, all sub-arrays are interpolated.
             cartesian: True if points are in cartesian coordinates.
             kpoint: k-point in reduced coordinates. If not None, the phase-factor e^{ikr} is included.
+            chunk_size: Number of points treated at once.
 
         Return:
-            [ndt, npoints] array or [1, npoints] if idt is not None
+            [ndt, npoints] array or [npoints] array if idt is not None
         """
         frac_coords = np.reshape(frac_coords, (-1, 3))
         if cartesian:
-            red_from_cart = self.structure.lattice.inv_matrix.T
-            frac_coords = [np.dot(red_from, v) for v in frac_coords]
+            frac_coords = np.dot(frac_coords, self.structure.lattice.inv_matrix)
 
-        uc_coords = np.reshape(frac_coords, (-1, 3)) % 1
+        uc_coords = frac_coords % 1
+        datar = self._datar if idt is None else self._datar[idt:idt+1]
+        eval_chunk = {"linear": self._eval_linear, "cubic": self._eval_cubic, "fourier": self._eval_fourier}[self.method]
+        if self.method == "fourier":
+            # Limit the size of the [ndt, npoints, nx, ny] intermediate array.
+            chunk_size = min(chunk_size, max(1, 2**22 // (len(datar) * self.ngrid[0] * self.ngrid[1])))
 
-        if idt is None:
-            values = np.empty((self.ndt, len(uc_coords)), dtype=self.dtype)
-            for idt in range(self.ndt):
-                values[idt] = self._interpolators[idt](uc_coords)
-        else:
-            values = self._interpolators[idt](uc_coords)
+        values = np.empty((len(datar), len(uc_coords)), dtype=self.dtype)
+        for start in range(0, len(uc_coords), chunk_size):
+            stop = start + chunk_size
+            values[:, start:stop] = eval_chunk(datar, uc_coords[start:stop], idt)
 
         if kpoint is not None:
             if hasattr(kpoint, "frac_coords"): kpoint = kpoint.frac_coords
             kpoint = np.reshape(kpoint, (3,))
-            values *= np.exp(2j * np.pi * np.dot(frac_coords, kpoint))
+            values = values * np.exp(2j * np.pi * np.dot(frac_coords, kpoint))
+
+        return values if idt is None else values[0]
+
+    def _eval_stencil(self, datar, uc_coords, offsets, weights_func):
+        """
+        Sum the values of `datar` on the gridpoints i0 + offsets (wrapped in the unit cell)
+        multiplied by the weights computed by `weights_func`.
+        """
+        xyz = uc_coords * self.ngrid
+        i0 = np.floor(xyz).astype(np.int)
+        wgts = weights_func(xyz - i0)
+        inds = [(i0 + off) % self.ngrid for off in offsets]
+        nx, ny, nz = self.ngrid
+
+        values = 0
+        for cx, cy, cz in itertools.product(range(len(offsets)), repeat=3):
+            wgt = wgts[cx][:, 0] * wgts[cy][:, 1] * wgts[cz][:, 2]
+            lin = (inds[cx][:, 0] * ny + inds[cy][:, 1]) * nz + inds[cz][:, 2]
+            values = values + wgt * datar[:, lin]
 
         return values
+
+    def _eval_linear(self, datar, uc_coords, idt):
+        """Trilinear interpolation."""
+        return self._eval_stencil(datar, uc_coords, (0, 1), lambda t: (1 - t, t))
+
+    def _eval_cubic(self, datar, uc_coords, idt):
+        """Tricubic convolution interpolation with the Catmull-Rom kernel."""
+        def weights(t):
+            t2, t3 = t * t, t * t * t
+            return (0.5 * (-t3 + 2 * t2 - t), 0.5 * (3 * t3 - 5 * t2 + 2),
+                    0.5 * (-3 * t3 + 4 * t2 + t), 0.5 * (t3 - t2))
+
+        return self._eval_stencil(datar, uc_coords, (-1, 0, 1, 2), weights)
+
+    def _eval_fourier(self, datar, uc_coords, idt):
+        """Trigonometric interpolation: sum_G f(G) e^{i 2pi G.r}"""
+        datag = self._datag if idt is None else self._datag[idt:idt+1]
+        # Separable phases: contract z, y and x in turn.
+        eigr = [np.exp(2j * np.pi * np.outer(uc_coords[:, i], np.fft.fftfreq(n, 1.0 / n)))
+                for i, n in enumerate(self.ngrid)]
+        values = np.einsum("dxyz,pz->dpxy", datag, eigr[2])
+        values = np.einsum("dpxy,py->dpx", values, eigr[1])
+        values = np.einsum("dpx,px->dp", values, eigr[0])
+
+        return values if np.iscomplexobj(datar) else values.real
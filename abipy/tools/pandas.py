@@ -2,7 +2,6 @@
 from __future__ import print_function, division, unicode_literals, absolute_import
 
 import sys
-import pandas as pd
 
 
 def print_frame(frame, title=None, sortby=None, file=sys.stdout):
@@ -15,6 +14,7 @@ def print_frame(frame, title=None, sortby=None, file=sys.stdout):
         sortby: string name or list of names which refer to the axis items to be sorted (dataframe is not changed)
         file: a file-like object (stream); defaults to the current sys.stdout.
     """
+    import pandas as pd
     if title is not None: print(title, file=file)
     if sortby is not None:
         frame = frame.sort_values(sortby, inplace=False)
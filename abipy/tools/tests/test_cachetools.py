@@ -0,0 +1,43 @@
+"""Tests for cachetools module."""
+from __future__ import print_function, division
+
+import numpy as np
+
+from abipy.core.kpoints import Kpoint
+from abipy.core.testing import AbipyTest
+from abipy.tools.cachetools import json_key, CacheStatsMixin
+
+
+class FakeCache(CacheStatsMixin):
+    COUNTERS = ("hits", "misses")
+
+    def __init__(self):
+        self.reset_stats()
+
+
+class TestCacheTools(AbipyTest):
+    """Test cachetools."""
+
+    def test_json_key(self):
+        """Testing json_key"""
+        assert json_key(dict(b=np.arange(3), a=np.float64(1.5))) == json_key(dict(a=1.5, b=[0, 1, 2]))
+
+        # Kpoints are converted to the full-precision reduced coordinates.
+        lattice = np.eye(3)
+        k1, k2 = Kpoint([0.1, 0, 0], lattice), Kpoint([0.1001, 0, 0], lattice)
+        assert repr(k1) == repr(k2)
+        assert json_key(dict(qpt=k1)) != json_key(dict(qpt=k2))
+        assert json_key(dict(qpt=k1)) == json_key(dict(qpt=[0.1, 0.0, 0.0]))
+
+        # Objects whose repr is not a faithful representation cannot be used.
+        with self.assertRaises(TypeError):
+            json_key(dict(obj=object()))
+
+    def test_cache_stats(self):
+        """Testing CacheStatsMixin"""
+        cache = FakeCache()
+        cache.hits += 2
+        assert list(cache.get_stats().items()) == [("hits", 2), ("misses", 0)]
+        assert "hits: 2" in str(cache) and cache.to_string().startswith("FakeCache")
+        cache.reset_stats()
+        assert cache.hits == 0
@@ -45,6 +45,85 @@ class TestTools(AbipyTest):
             self.assertTrue(np.all(view[...,0,0] == view[...,-1,-1]))
             self.assertTrue(np.all(view[...,0,0,0] == view[...,-1,-1,-1]))
 
+    def test_gaussians_sum(self):
+        """test gaussians_sum"""
+        mesh = np.linspace(-3, 5, num=801)
+        centers = np.random.random((20, 10)) * 6 - 2
+        weights = np.random.random((20, 1))
+        ref = np.zeros(len(mesh))
+        for ik in range(20):
+            for ib in range(10):
+                ref += weights[ik, 0] * gaussian(mesh, 0.2, center=centers[ik, ib])
+
+        self.assert_almost_equal(gaussians_sum(mesh, centers, 0.2, weights=weights, algo="direct"), ref)
+        self.assert_almost_equal(gaussians_sum(mesh, centers, 0.2, weights=weights), ref)
+        assert np.abs(gaussians_sum(mesh, centers, 0.2, weights=weights, algo="histogram") - ref).max() < 1e-3 * ref.max()
+        with self.assertRaises(ValueError):
+            gaussians_sum(mesh, centers, 0.2, algo="foo")
+
+        # Several sets of weights in one call.
+        wsets = np.random.random((3, 20, 10))
+        values = gaussians_sum(mesh, centers, 0.2, weights=wsets)
+        assert values.shape == (3, len(mesh))
+        self.assert_almost_equal(values[2], gaussians_sum(mesh, centers, 0.2, weights=wsets[2], algo="direct"))
+
+        # Non-linear mesh --> direct algorithm.
+        nonlin_mesh = mesh[::3] ** 2
+        self.assert_almost_equal(gaussians_sum(nonlin_mesh, centers, 0.2),
+                                 gaussians_sum(nonlin_mesh, centers, 0.2, algo="direct"))
+
+    def test_tetra_dos(self):
+        """test tetra_dos"""
+        # Two bands on a 12x12x12 grid: each band should integrate to one.
+        ngk = 12
+        k1d = np.fft.fftfreq(ngk)
+        kx, ky, kz = np.meshgrid(k1d, k1d, k1d, indexing="ij")
+        eigens_grid = np.stack([kx**2 + ky**2 + kz**2, 2 + np.cos(2 * np.pi * kx)], axis=-1)
+        mesh = np.linspace(-0.5, 4, num=2000)
+        dos = tetra_dos(mesh, eigens_grid)
+        assert np.all(dos >= 0)
+        self.assert_almost_equal(np.sum(dos) * (mesh[1] - mesh[0]), 2.0, decimal=2)
+
+        # Free-electron DOS: 2 pi sqrt(e) in units of the BZ volume.
+        ie = np.argmin(np.abs(mesh - 0.1))
+        assert abs(dos[ie] - 2 * np.pi * np.sqrt(mesh[ie])) < 0.1
+
+    def test_bloch_regular_grid_interpolator(self):
+        """test BlochRegularGridInterpolator"""
+        import abipy.data as abidata
+        structure = abidata.structure_from_ucell("Si")
+        ngrid = (10, 12, 14)
+        x, y, z = np.meshgrid(*[np.arange(n) / n for n in ngrid], indexing="ij")
+        exact = lambda x, y, z: np.array([np.cos(2 * np.pi * (x + 2 * y)) + np.sin(2 * np.pi * z),
+                                          np.cos(2 * np.pi * (2 * x - z)) * np.sin(2 * np.pi * y)])
+        datar = exact(x, y, z)
+
+        # Points outside the unit cell are folded with wrapped indices.
+        points = np.random.random((50, 3)) * 4 - 2
+        ref_values = exact(*points.T)
+        gridpoint = [3 / 10, 5 / 12, 7 / 14]
+        errors = {}
+        for method in ("linear", "cubic", "fourier"):
+            interpolator = BlochRegularGridInterpolator(structure, datar, method=method)
+            values = interpolator.eval_points(points, chunk_size=7)
+            assert values.shape == (2, len(points))
+            errors[method] = np.abs(values - ref_values).max()
+            self.assert_almost_equal(interpolator.eval_points(gridpoint)[:, 0], datar[:, 3, 5, 7])
+            self.assert_almost_equal(interpolator.eval_points(points, idt=1), values[1])
+
+        assert errors["fourier"] < 1e-10
+        assert errors["cubic"] < errors["linear"]
+        with self.assertRaises(ValueError):
+            BlochRegularGridInterpolator(structure, datar, method="foo")
+
+        # Several lines evaluated in one call.
+        interpolator = BlochRegularGridInterpolator(structure, datar)
+        lines = interpolator.eval_lines([(0, 1), ([0, 0, 0], [1, 1, 1])], num=20)
+        assert len(lines) == 2 and lines[0].site1 is structure[0]
+        r = interpolator.eval_line([0, 0, 0], [1, 1, 1], num=20)
+        self.assert_equal(lines[1].values, r.values)
+        self.assert_almost_equal(r.dist[-1], structure.lattice.norm([1, 1, 1]))
+
 
 if __name__ == "__main__":
     import unittest
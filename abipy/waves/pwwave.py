@@ -191,7 +191,8 @@ class WaveFunction(object):
         """
         mesh = self.mesh if mesh is None else mesh
         ug_mesh = self.get_ug_mesh(mesh=mesh)
-        return mesh.fft_g2r(ug_mesh, fg_ishifted=False)
+        # ug_mesh is a new array so we can perform the transform in-place.
+        return mesh.fft_g2r_batch(ug_mesh, inplace=True)
 
     def to_string(self, verbose=0):
         """String representation."""
@@ -260,6 +261,10 @@ class PWWaveFunction(WaveFunction):
         space = space.lower()
 
         if space == "g":
+            if self.gsphere.istwfk != 1:
+                # Only half of the G-sphere is stored. Compute the norm on the FFT box.
+                ug_mesh = self.get_ug_mesh()
+                return np.real(np.vdot(ug_mesh, ug_mesh))
             return np.real(np.vdot(self.ug, self.ug))
         elif space == "gsphere":
             return np.real(np.vdot(self.ug, self.ug))
@@ -294,12 +299,16 @@ class PWWaveFunction(WaveFunction):
         else:
             raise ValueError("Wrong space: %s" % str(space))
 
-    def get_interpolator(self):
+    def get_interpolator(self, method="linear"):
         """
         Return an interpolator object that interpolates periodic functions in real space.
+
+        Args:
+            method: Interpolation method: "linear", "cubic" or "fourier".
+                See :class:`BlochRegularGridInterpolator`.
         """
         from abipy.tools.numtools import BlochRegularGridInterpolator
-        return BlochRegularGridInterpolator(self.structure, self.ur)
+        return BlochRegularGridInterpolator(self.structure, self.ur, method=method)
 
     #def pww_translation(self, gvector, rprimd):
     #    """Returns the pwwave of the kpoint translated by one gvector."""
@@ -338,44 +347,42 @@ class PWWaveFunction(WaveFunction):
     #    wpww.mesh = self.mesh
     #    return wpww
 
-    #def rotate(self, symmop, mesh=None):
-    #    """
-    #    Apply the symmetry operation `symmop` to the periodic part.
+    def rotate(self, symmop, mesh=None):
+        r"""
+        Apply the symmetry operation `symmop` to the wavefunction i.e. :math:`\psi_{Sk}(r) = \psi_k(R^{-1}(r - \tau))`
+        (complex conjugated if `symmop` contains time-reversal).
 
-    #    Args:
-    #        symmop: :class:`Symmetry` operation
-    #        mesh: mesh for the FFT, if None the mesh of self is used.
+        The coefficients are given by :math:`u_{Sk}(SG) = e^{-i 2\pi (Sk + SG) \cdot \tau} u_k(G)`
+        where the nonsymmorphic phases are computed for all the G-vectors at once.
 
-    #    Returns:
-    #        New wavefunction object.
-    #    """
-    #    if self.nspinor != 1:
-    #        raise ValueError("Spinor rotation not available yet.")
-
-    #    rot_gsphere = self.gsphere.rotate(symmop)
-    #    #rot_istwfk = istwfk(rot_kpt)
-
-    #    if not np.allclose(symmop.tau, np.zeros(3)):
-    #        rot_ug = np.empty_like(self.ug)
-    #        rot_gvecs = rot_gsphere.gvecs
-    #        rot_kpt = rot_gsphere.kpoint.frac_coords
-
-    #        ug = self._ug
-    #        #phase = np.exp(-2j * np.pi * (np.dot(rot_gvecs + rot_kpt, symmop.tau)))
-    #        for ig in range(self.npw):
-    #            rot_ug[:, ig] = ug[:, ig] * np.exp(-2j * np.pi * (np.dot(rot_gvecs[ig] + rot_kpt, symmop.tau)))
-    #    else:
-    #        rot_ug = self.ug.copy()
-
-    #    # Invert the collinear spin if we have an AFM operation.
-    #    rot_spin = self.spin
-    #    if self.nspinor == 1:
-    #        rot_spin = self.spin if symmop.is_fm else (self.spin + 1) % 2
-
-    #    # Build new wave and set the mesh.
-    #    new = self.__class__(self.nspinor, rot_spin, self.band, rot_gsphere, rot_ug)
-    #    new.set_mesh(mesh if mesh is not None else self.mesh)
-    #    return new
+        If istwfk != 1, the coefficients are expanded to the full G-sphere before the rotation
+        and the new wavefunction has istwfk == 1.
+
+        Args:
+            symmop: :class:`SymmOp` object.
+            mesh: mesh for the FFT, if None the mesh of self is used.
+
+        Returns:
+            New wavefunction object with k-point Sk.
+        """
+        if self.nspinor != 1:
+            raise ValueError("Spinor rotation not available yet.")
+
+        gsphere, ug = self.gsphere.to_full_sphere(self.ug)
+        rot_gsphere = gsphere.rotate(symmop)
+        rot_ug = ug.conj() if symmop.has_timerev else ug.copy()
+
+        if np.any(np.abs(symmop.tau) > 0.0):
+            rot_kpg = rot_gsphere.gvecs + rot_gsphere.kpoint.frac_coords
+            rot_ug *= np.exp(-2j * np.pi * np.dot(rot_kpg, symmop.tau))
+
+        # Invert the collinear spin if we have an AFM operation.
+        rot_spin = self.spin if symmop.is_fm else (self.spin + 1) % 2
+
+        # Build new wave and set the mesh.
+        new = self.__class__(self.structure, self.nspinor, rot_spin, self.band, rot_gsphere, rot_ug)
+        new.set_mesh(mesh if mesh is not None else self.mesh)
+        return new
 
     @add_fig_kwargs
     def plot_line(self, point1, point2, num=200, with_krphase=False, cartesian=False, ax=None, **kwargs):
@@ -459,14 +466,15 @@ class PWWaveFunction(WaveFunction):
         interpolator = self.get_interpolator()
         kpoint = None if not with_krphase else self.kpoint
         which = r"\psi(r)" if with_krphase else "u(r)"
+        # Interpolate all the lines in one call.
+        lines = interpolator.eval_lines([(site.frac_coords, nn[0].frac_coords) for nn in nn_list],
+                                        num=num, kpoint=kpoint)
 
         # For each neighbor, plot psi along the line connecting site to nn.
-        for i, (nn, ax) in enumerate(zip(nn_list, axlist)):
+        for i, (nn, ax, r) in enumerate(zip(nn_list, axlist, lines)):
             nn_site, nn_dist, nn_sc_index  = nn
             title = "%s, %s, dist=%.3f A" % (nn_site.species_string, str(nn_site.frac_coords), nn_dist)
 
-            r = interpolator.eval_line(site.frac_coords, nn_site.frac_coords, num=num, kpoint=kpoint)
-
             for ispinor in range(self.nspinor):
                 spinor_label = latex_label_ispinor(ispinor, self.nspinor)
                 ur = r.values[ispinor]
@@ -4,6 +4,7 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 import numpy as np
 import abipy.data as abidata
 
+from abipy.core import Mesh3D, GSphere
 from abipy.core.testing import AbipyTest
 from abipy.waves import WfkFile
 
@@ -85,6 +86,18 @@ class TestWFKFile(AbipyTest):
 
         wave.export_ur2(".xsf")
 
+        # Rotate the wavefunction with the symmetries of the crystal.
+        for symmop in wfk.structure.abi_spacegroup:
+            rot_wave = wave.rotate(symmop)
+            assert rot_wave.kpoint == symmop.rotate_k(wave.kpoint.frac_coords)
+            self.assert_almost_equal(rot_wave.norm2(space="gsphere"), 1.0)
+            if wave.mesh.is_symmetry_compatible([symmop]):
+                # u_{Sk}(r) = e^{-i 2pi Sk.tau} u_k(R^{-1}(r - tau))
+                irottable = wave.mesh.get_irottable([symmop])[0]
+                ur = wave.ur.conj() if symmop.has_timerev else wave.ur
+                phase = np.exp(-2j * np.pi * np.dot(rot_wave.kpoint.frac_coords, symmop.tau))
+                self.assert_almost_equal(rot_wave.ur.ravel(), phase * ur.ravel()[irottable])
+
         if self.has_matplotlib():
             assert wave.plot_line(0, 1, num=100, show=False)
             assert wave.plot_line([0, 0, 0], [2, 2, 2], num=100, with_krphase=True, show=False)
@@ -96,3 +109,124 @@ class TestWFKFile(AbipyTest):
             wfk.write_notebook(nbpath=self.get_tmpname(text=True))
 
         wfk.close()
+
+    def test_block_read(self):
+        """Testing block reads of the wavefunctions in WfkFile."""
+        with WfkFile(abidata.ref_file("si_nscf_WFK.nc")) as wfk:
+            spin, ik = 0, 1
+            nband = wfk.nband_sk[spin, ik]
+            ug_block = wfk.read_ug_block(spin, ik)
+            assert ug_block.shape == (nband, wfk.nspinor, wfk.npwarr[ik])
+            for band in range(nband):
+                self.assert_equal(ug_block[band], wfk.get_wave(spin, ik, band).ug)
+
+            self.assert_equal(wfk.read_ug_block(spin, ik, band_range=(1, 3)), ug_block[1:3])
+            self.assert_equal(wfk.read_ug_block(spin, ik, band_range=slice(2, None)), ug_block[2:])
+            with self.assertRaises(ValueError):
+                wfk.read_ug_block(spin, ik, band_range=(0, nband + 1))
+
+            # Stream the file in chunks of bands.
+            count = 0
+            for ik, bands, ug in wfk.iter_ug_blocks(spin, chunk=3):
+                assert len(bands) <= 3 and ug.shape == (len(bands), wfk.nspinor, wfk.npwarr[ik])
+                self.assert_equal(ug, wfk.read_ug_block(spin, ik, band_range=bands))
+                count += len(bands)
+            assert count == wfk.nband_sk[spin].sum()
+
+            waves = list(wfk.iter_waves(spin, kpoints=[0], band_range=(0, 2), chunk=1))
+            assert len(waves) == 2
+            assert waves[1] == wfk.get_wave(spin, 0, 1)
+
+            # u(r) for all bands with batched FFTs.
+            ur_block = wfk.get_ur_block(spin, 0, band_range=(0, 3))
+            assert ur_block.shape == (3, wfk.nspinor) + wfk.fft_mesh.shape
+            for band in range(3):
+                self.assert_almost_equal(ur_block[band, 0], wfk.get_wave(spin, 0, band).ur)
+
+    def test_overlap_matrix(self):
+        """Testing overlap matrices, classification of states and band tracking in WfkFile."""
+        with WfkFile(abidata.ref_file("si_nscf_WFK.nc")) as wfk:
+            spin, nb = 0, 4
+            self.assert_almost_equal(wfk.overlap_matrix(spin, 0, band_range=(0, nb)), np.eye(nb))
+
+            # Periodic parts at different k-points.
+            smat = wfk.overlap_matrix(spin, 0, 1, band_range=(0, nb), band_range2=(0, 2))
+            assert smat.shape == (nb, 2)
+            self.assert_almost_equal(smat[2, 1], wfk.get_wave(spin, 0, 2).braket(wfk.get_wave(spin, 1, 1), space="g"))
+
+            # Local operator in real space.
+            vr = np.ones(wfk.fft_mesh.shape)
+            self.assert_almost_equal(wfk.overlap_matrix(spin, 1, band_range=(0, nb), operator=vr), np.eye(nb))
+
+            # The characters of the identity give the dimension of the degenerate sets.
+            classes = wfk.classify_states(spin, 0, band_range=(0, nb))
+            assert sum(len(state.bands) for state in classes.states) == nb
+            ie = [op.isE for op in classes.symmops].index(True)
+            for state in classes.states:
+                self.assert_almost_equal(state.characters[ie], len(state.bands))
+                assert np.all(np.abs(state.characters) <= len(state.bands) + 1e-6)
+
+            inds = wfk.track_bands(spin, band_range=(0, nb))
+            assert inds.shape == (wfk.nkpt, nb)
+            self.assert_equal(inds[0], np.arange(nb))
+            for ik in range(wfk.nkpt):
+                assert sorted(inds[ik]) == list(range(nb))
+
+    def test_full_sphere_istwfk(self):
+        """Testing the reconstruction of the full G-sphere for istwfk != 1."""
+        # The reference WFK files are produced with istwfk *1 so half-sphere data is built in memory.
+        from abipy.waves.wfkfile import _full_sphere, _gspace_overlap
+        rprimd = np.eye(3)
+        mesh = Mesh3D((8, 8, 8), rprimd)
+        cube = np.array([g for g in np.ndindex(5, 5, 5)]) - 2
+        istwfk2kpt = {3: [0.5, 0, 0], 4: [0, 0, 0.5], 5: [0.5, 0, 0.5],
+                      6: [0, 0.5, 0], 7: [0.5, 0.5, 0], 8: [0, 0.5, 0.5], 9: [0.5, 0.5, 0.5]}
+
+        for istwfk, kpt in istwfk2kpt.items():
+            g0 = np.rint(2 * np.array(kpt)).astype(np.int)
+            gvecs = np.array([g for g in cube if tuple(g) > tuple(-g - g0)])
+            gsphere = GSphere(2, rprimd, kpt, gvecs, istwfk=istwfk)
+            ug = np.random.random((3, 1, gsphere.npw)) + 1j * np.random.random((3, 1, gsphere.npw))
+
+            full_gvecs, full_ug = _full_sphere(gsphere, ug)
+            assert len(full_gvecs) == 2 * gsphere.npw
+            # Must agree with the data inserted in the FFT box by the G-sphere.
+            full_sphere = GSphere(2, rprimd, kpt, full_gvecs, istwfk=1)
+            ug_mesh = gsphere.tofftmesh(mesh, ug[:, 0])
+            self.assert_equal(full_sphere.fromfftmesh(mesh, ug_mesh), full_ug[:, 0])
+
+            # Overlaps in G-space and in r-space.
+            smat = _gspace_overlap(full_gvecs, full_ug, full_gvecs, full_ug)
+            ur = mesh.fft_g2r(ug_mesh)
+            rmat = np.array([[np.vdot(ur[i], ur[j]) for j in range(3)] for i in range(3)]) / mesh.size
+            self.assert_almost_equal(smat, rmat)
+
+    def test_rotate_istwfk(self):
+        """Testing the rotation of wavefunctions stored with istwfk == 2."""
+        from abipy.waves.pwwave import PWWaveFunction
+        with WfkFile(abidata.ref_file("si_nscf_WFK.nc")) as wfk:
+            structure, mesh = wfk.structure, wfk.fft_mesh
+        rlatt = structure.reciprocal_lattice
+
+        # Half of a G-sphere centered on Gamma that is invariant under the symmetries of the crystal.
+        cube = np.array([g for g in np.ndindex(7, 7, 7)]) - 3
+        norms = np.linalg.norm(np.dot(cube, rlatt.matrix), axis=1)
+        gcut = norms[np.abs(cube).max(axis=1) == 3].min()
+        gvecs = np.array([g for g, n in zip(cube, norms) if n < gcut and tuple(g) >= tuple(-g)])
+        gsphere = GSphere(2, rlatt, [0, 0, 0], gvecs, istwfk=2)
+
+        ug = np.random.random((1, gsphere.npw)) + 1j * np.random.random((1, gsphere.npw))
+        ug[0, 0] = ug[0, 0].real
+        wave = PWWaveFunction(structure, 1, 0, 0, gsphere, ug)
+        wave.set_mesh(mesh)
+        assert np.allclose(wave.ur.imag, 0)
+
+        for symmop in structure.abi_spacegroup:
+            rot_wave = wave.rotate(symmop)
+            assert rot_wave.gsphere.istwfk == 1 and rot_wave.gsphere.npw == 2 * gsphere.npw - 1
+            self.assert_almost_equal(rot_wave.norm2(space="gsphere"), wave.norm2(space="g"))
+            if mesh.is_symmetry_compatible([symmop]):
+                # u_{Sk}(r) = e^{-i 2pi Sk.tau} u_k(R^{-1}(r - tau)) with Sk = 0
+                irottable = mesh.get_irottable([symmop])[0]
+                self.assert_almost_equal(rot_wave.ur.ravel(), wave.ur.ravel()[irottable])
+
@@ -5,9 +5,11 @@ from __future__ import print_function, division, unicode_literals, absolute_impo
 import six
 import numpy as np
 
+from monty.collections import dict2namedtuple
 from monty.functools import lazy_property
 from monty.string import marquee # is_string, list_strings,
 from abipy.core import Mesh3D, GSphere, Structure
+from abipy.core.kpoints import issamek
 from abipy.core.mixins import AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWriter
 from abipy.iotools import ETSF_Reader, Visualizer
 from abipy.electrons.ebands import ElectronsReader
@@ -19,6 +21,68 @@ __all__ = [
 ]
 
 
+def _full_sphere(gsphere, ug):
+    """
+    Return (gvecs, ug) on the full G-sphere. ug is an array with shape [..., npw].
+    See :meth:`GSphere.to_full_sphere`.
+    """
+    full_gsphere, ug = gsphere.to_full_sphere(ug)
+    return full_gsphere.gvecs, ug
+
+
+def _map_gvecs(gvecs1, gvecs2):
+    """
+    Return (inds1, inds2) with the indices of the G-vectors that are common to the two lists
+    i.e. gvecs1[inds1] == gvecs2[inds2]. The G-vectors are mapped to integers and matched with a binary search.
+    """
+    gmax = np.maximum(np.abs(gvecs1).max(axis=0), np.abs(gvecs2).max(axis=0))
+    dims = 2 * gmax + 1
+    lin1 = np.ravel_multi_index((gvecs1 + gmax).T, dims)
+    lin2 = np.ravel_multi_index((gvecs2 + gmax).T, dims)
+
+    order = np.argsort(lin1)
+    pos = np.searchsorted(lin1, lin2, sorter=order)
+    pos[pos == len(lin1)] = 0
+    inds1 = order[pos]
+    found = lin1[inds1] == lin2
+    return inds1[found], np.where(found)[0]
+
+
+def _gspace_overlap(gvecs1, ug1, gvecs2, ug2):
+    """
+    Compute <u1_m|u2_n> for ug1[nb1, nspinor, npw1] and ug2[nb2, nspinor, npw2] with a single matrix-matrix
+    product restricted to the G-vectors that are common to the two spheres. Return [nb1, nb2] array.
+    """
+    if gvecs1.shape != gvecs2.shape or np.any(gvecs1 != gvecs2):
+        inds1, inds2 = _map_gvecs(gvecs1, gvecs2)
+        ug1, ug2 = ug1[..., inds1], ug2[..., inds2]
+
+    return np.dot(np.reshape(ug1, (len(ug1), -1)).conj(), np.reshape(ug2, (len(ug2), -1)).T)
+
+
+def _rotate_ug_block(symmop, kpoint, gvecs, ug, target_kpoint=None):
+    """
+    Apply `symmop` to the block of wavefunctions ug[..., npw] at `kpoint` (reduced coordinates).
+    If S(k) = target_kpoint + G0, the rotated G-vectors are shifted by G0 so that the new coefficients
+    give the periodic part of the rotated states with respect to target_kpoint.
+
+    Return:
+        (rot_gvecs, rot_ug)
+    """
+    rot_kpt = symmop.rotate_k(kpoint, wrap_tows=False)
+    rot_gvecs = symmop.rotate_gvecs(gvecs)
+    rot_ug = ug.conj() if symmop.has_timerev else ug
+
+    if np.any(np.abs(symmop.tau) > 0.0):
+        # Nonsymmorphic phases for all G-vectors.
+        rot_ug = rot_ug * np.exp(-2j * np.pi * np.dot(rot_gvecs + rot_kpt, symmop.tau))
+
+    if target_kpoint is not None and issamek(rot_kpt, target_kpoint):
+        rot_gvecs = rot_gvecs + np.array(np.rint(rot_kpt - target_kpoint), dtype=np.int)
+
+    return rot_gvecs, rot_ug
+
+
 class WfkFile(AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWriter):
     """
     This object provides a simple interface to access and analyze
@@ -146,6 +210,82 @@ class WfkFile(AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWriter):
 
         return wave
 
+    def read_ug_block(self, spin, kpoint, band_range=None):
+        """
+        Read a block of wavefunctions in G-space with a single I/O operation.
+
+        Args:
+            spin: spin index. Must be in (0, 1)
+            kpoint: Either :class:`Kpoint` instance or integer giving the sequential index in the IBZ (C-convention).
+            band_range: None for all bands at this k-point. Accepts (start, stop) tuple, range or slice.
+
+        Returns:
+            Complex array with shape [nb, nspinor, npw_k].
+        """
+        return self.reader.read_ug_block(spin, kpoint, band_range=band_range)
+
+    def iter_ug_blocks(self, spin, kpoints=None, band_range=None, chunk=32):
+        """
+        Generator that streams the wavefunctions in G-space in blocks of bands.
+        Memory is bounded by `chunk * nspinor * max(npwarr)` complex numbers, independently
+        of the number of bands and k-points in the file.
+
+        Args:
+            spin: spin index.
+            kpoints: List of :class:`Kpoint` objects or k-point indices. None for all k-points in the file.
+            band_range: Bands to read. None for all bands available at each k-point.
+                Accepts (start, stop) tuple, range or slice.
+            chunk: Maximum number of bands read in a single I/O operation.
+
+        Yields:
+            (ik, bands, ug) where ik is the index of the k-point, bands is a range with the band indices
+            and ug is a complex array with shape [len(bands), nspinor, npw_k].
+        """
+        if chunk <= 0:
+            raise ValueError("chunk must be > 0 but got %s" % chunk)
+        ik_list = list(range(self.nkpt)) if kpoints is None else [self.kindex(k) for k in kpoints]
+
+        for ik in ik_list:
+            start, stop = self.reader.get_band_range(spin, ik, band_range=band_range)
+            for bstart in range(start, stop, chunk):
+                bstop = min(bstart + chunk, stop)
+                ug = self.reader.read_ug_block(spin, ik, band_range=(bstart, bstop))
+                yield ik, range(bstart, bstop), ug
+
+    def iter_waves(self, spin, kpoints=None, band_range=None, chunk=32):
+        """
+        Generator returning :class:`PWWaveFunction` objects.
+        Similar to :meth:`get_wave` but the coefficients are read in blocks of `chunk` bands.
+        See :meth:`iter_ug_blocks` for the meaning of the arguments.
+        """
+        for ik, bands, ug in self.iter_ug_blocks(spin, kpoints=kpoints, band_range=band_range, chunk=chunk):
+            for i, band in enumerate(bands):
+                # PWWaveFunction stores a copy of ug so it's safe to reuse the buffer.
+                wave = PWWaveFunction(self.structure, self.nspinor, spin, band, self.gspheres[ik], ug[i])
+                wave.set_mesh(self.fft_mesh)
+                yield wave
+
+    def get_ur_block(self, spin, kpoint, band_range=None, mesh=None, engine=None):
+        """
+        Compute the periodic part of the wavefunctions in real space for a block of bands.
+        The G-sphere --> FFT box transfer and the FFTs are performed with a single call for all bands.
+
+        Args:
+            spin: spin index.
+            kpoint: Either :class:`Kpoint` instance or integer giving the sequential index in the IBZ (C-convention).
+            band_range: None for all bands at this k-point. Accepts (start, stop) tuple, range or slice.
+            mesh: :class:`Mesh3D` object. If None, the FFT mesh reported in the WFK file is used.
+            engine: :class:`FFTEngine`. None to use the default engine (see :func:`abipy.core.mesh3d.set_fft_engine`).
+
+        Returns:
+            Complex array with shape [nb, nspinor, nx, ny, nz].
+        """
+        ik = self.kindex(kpoint)
+        mesh = self.fft_mesh if mesh is None else mesh
+        ug = self.read_ug_block(spin, ik, band_range=band_range)
+        ug_mesh = self.gspheres[ik].tofftmesh(mesh, ug)
+        return mesh.fft_g2r_batch(ug_mesh, inplace=True, engine=engine)
+
     def export_ur2(self, filepath, spin, kpoint, band, visu=None):
         """
         Export :math:`|u(r)|^2` on file filename.
@@ -178,69 +318,145 @@ class WfkFile(AbinitNcFile, Has_Structure, Has_ElectronBands, NotebookWriter):
         else:
             raise visu.Error("Don't know how to export data for visualizer %s" % visu_name)
 
-    #def classify_states(self, spin, kpoint, band_range=None, energy_range=None, atol=1e-3):
-    #    """
-    #    Classify electronic eigenstates
-
-    #    Args:
-    #        spin: spin index. Must be in (0, 1)
-    #        kpoint: Either :class:`Kpoint` instance or integer giving the sequential index in the IBZ (C-convention).
-    #        band_range: Define the set of bands included in the classification. See also `energy_range`.
-    #            `None` means all bands available in the WFK file. Accepts also range object, use e.g.
-    #            `band_range=(0, 5)` to include [0, 1, 2, 3, 4].
-    #        energy_range: Define the set of bands included in the classification. Mutually exclusive with `band_range`.
-    #            Accepts: "gap"
-    #        atol: Absolute tolerance on the energy in eV. Two states are considered degerate if
-    #            their energy differ by less than `atol`.
-
-    #    Return:
-    #    """
-    #    if band_range is not None and energy_range is not None:
-    #        raise ValueError("band_range and energy_range are mutually exclusive.")
-
-    #    if energy_range is None:
-    #        bids = ... if band_range is None else list(range(band_range))
-    #    else:
-    #        raise NotImplementedError("energy_range")
-
-    #    # Find little group of the k-point.
-    #    ik = self.kindex(kpoint)
-    #    kpoint = self.kpoints[ik]
-    #    lgk = self.structure.abi_spacegroup.find_little_group(kpoint)
-    #    #wclass = WavefuntionsClassifier(kpoint)
-
-    #    # Select bands to include, find degenerate states and group them.
-    #    from abipy.core.skw import find_degs_sk
-    #    enes = self.ebands.eigens[spin, ik, bids]
-    #    deg_list = find_degs_sk(enes, atol)
-
-    #    for deg in deg_list:
-    #        print("deg", deg)
-    #        nb = len(deg)
-    #        waves = [self.get_wave(spin, ik, band) for band in deg]
-    #        mats = []
-    #        for iclass, op_class in enumerate(lgk.groupby_class()):
-    #            op = op_class[0]
-    #            #print("op_class[0]\n", op)
-    #            #op_waves = [wave.rotate(op) for wave in waves]
-    #            op_waves = waves
-
-    #            # Compute <u1|Op|u2>
-    #            cmat = np.empty((nb, nb), dtype=np.complex)
-    #            for i in range(nb):
-    #                #print("int", waves[i].norm2())
-    #                for j in range(nb):
-    #                    cmat[i, j] = waves[i].braket(op_waves[j], space="r")
-    #                    #cmat[i, j] = 1.0
-
-    #            print(cmat)
-    #            mats.append(cmat)
-
-    #        #if wclass.classify_characters(deg, mats) /= 0:
-    #        #    cprint("Warning")
-    #        #    wclass.classify_characters_accidental(deg, full_mats)
-
-    #    #return wclass
+    def overlap_matrix(self, spin, k1, k2=None, band_range=None, band_range2=None, operator=None):
+        r"""
+        Compute the matrix :math:`M_{mn} = \langle u_{k1,m}|O|u_{k2,n} \rangle` of the periodic parts
+        for all the bands in `band_range` (at k1) and `band_range2` (at k2).
+        The wavefunctions are read in blocks and the matrix is computed with a single matrix-matrix product.
+
+        Args:
+            spin: spin index.
+            k1, k2: :class:`Kpoint` objects or k-point indices. k2 = k1 if None.
+                If the k-points differ, the sum runs over the G-vectors that are common to the two spheres.
+            band_range: Bands at k1. See :meth:`read_ug_block`.
+            band_range2: Bands at k2. None to use `band_range`.
+            operator: None for the identity (G-space).
+                :class:`SymmOp`: the operation is applied to the states at k2 (G-space).
+                If S(k2) = k1 + G0 the G-vectors of the rotated states are shifted by G0.
+                `ndarray` with a local operator V(r) on the FFT mesh of the file e.g. `vks.datar[spin]`.
+                The matrix elements are computed in real space with batched FFTs.
+
+        Returns:
+            Complex array with shape [nb1, nb2].
+        """
+        ik1 = self.kindex(k1)
+        ik2 = ik1 if k2 is None else self.kindex(k2)
+        band_range2 = band_range if band_range2 is None else band_range2
+
+        if isinstance(operator, np.ndarray):
+            # Real-space route.
+            vr = np.reshape(operator, self.fft_mesh.shape)
+            ur1 = self.get_ur_block(spin, ik1, band_range=band_range)
+            ur2 = self.get_ur_block(spin, ik2, band_range=band_range2)
+            ur2 *= vr
+            return np.dot(np.reshape(ur1, (len(ur1), -1)).conj(),
+                          np.reshape(ur2, (len(ur2), -1)).T) / self.fft_mesh.size
+
+        gvecs1, ug1 = _full_sphere(self.gspheres[ik1], self.read_ug_block(spin, ik1, band_range=band_range))
+        gvecs2, ug2 = _full_sphere(self.gspheres[ik2], self.read_ug_block(spin, ik2, band_range=band_range2))
+
+        if operator is not None:
+            if self.nspinor != 1:
+                raise ValueError("Spinor rotation not available yet.")
+            gvecs2, ug2 = _rotate_ug_block(operator, self.kpoints[ik2].frac_coords, gvecs2, ug2,
+                                           target_kpoint=self.kpoints[ik1].frac_coords)
+
+        return _gspace_overlap(gvecs1, ug1, gvecs2, ug2)
+
+    def classify_states(self, spin, kpoint, band_range=None, atol=1e-3):
+        """
+        Classify the electronic eigenstates at `kpoint` with the characters of the operations
+        of the little group of k (time-reversal excluded).
+
+        Args:
+            spin: spin index.
+            kpoint: :class:`Kpoint` object or index of the k-point.
+            band_range: Bands to analyze. See :meth:`read_ug_block`.
+            atol: Absolute tolerance in eV. Two states are degenerate if their energy differ by less than `atol`.
+
+        Return:
+            namedtuple with the list of operations `symmops` and the list `states`.
+            Each item in states is a namedtuple with the indices of the degenerate `bands`, the `energy`
+            the array `characters` with the trace of <u_i|S|u_j> in the degenerate subspace for each S in symmops
+            and `is_irreducible`. The latter is False if the set transforms according to a reducible
+            representation i.e. if the degeneracy is accidental (or `atol` is too large).
+        """
+        from abipy.core.skw import find_degs_sk
+        ik = self.kindex(kpoint)
+        kpoint = self.kpoints[ik]
+        start, stop = self.reader.get_band_range(spin, ik, band_range=band_range)
+
+        # Find little group of the k-point. Remove time-reversal.
+        lgk = self.structure.abi_spacegroup.find_little_group(kpoint)
+        symmops = [op for op in lgk.symmops if not op.has_timerev]
+
+        gvecs, ug = _full_sphere(self.gspheres[ik], self.read_ug_block(spin, ik, band_range=(start, stop)))
+        enes = self.ebands.eigens[spin, ik, start:stop]
+        degs = find_degs_sk(enes, atol)
+
+        characters = np.empty((len(degs), len(symmops)), dtype=np.complex)
+        for isym, symmop in enumerate(symmops):
+            rot_gvecs, rot_ug = _rotate_ug_block(symmop, kpoint.frac_coords, gvecs, ug, target_kpoint=kpoint.frac_coords)
+            mat = _gspace_overlap(gvecs, ug, rot_gvecs, rot_ug)
+            for ideg, deg in enumerate(degs):
+                characters[ideg, isym] = np.trace(mat[np.ix_(deg, deg)])
+
+        states = []
+        for ideg, deg in enumerate(degs):
+            # First orthogonality theorem: sum_S |chi(S)|^2 = order of the group for irreducible representations.
+            norm = np.sum(np.abs(characters[ideg]) ** 2) / len(symmops)
+            states.append(dict2namedtuple(bands=[start + b for b in deg], energy=enes[deg].mean(),
+                                          characters=characters[ideg], is_irreducible=abs(norm - 1) < 0.1))
+
+        return dict2namedtuple(symmops=symmops, states=states)
+
+    def track_bands(self, spin, kpoints=None, band_range=None, atol=1e-3):
+        """
+        Connect the bands along a list of k-points by maximizing the overlap of the periodic parts
+        of the wavefunctions at consecutive k-points. Useful to follow bands across crossings.
+        Degenerate states (energy difference < atol in eV) are treated as a single subspace.
+
+        Args:
+            spin: spin index.
+            kpoints: List of :class:`Kpoint` objects or k-point indices (e.g. a k-path). None for all k-points.
+            band_range: Bands to track. See :meth:`read_ug_block`. Must contain the same number of bands at all k-points.
+            atol: Tolerance in eV used to find degenerate states.
+
+        Return:
+            Integer array with shape [nk, nb]. Item [i, b] gives the index of the band at the i-th k-point
+            that is connected to the b-th band of the first k-point e.g. `eigens[spin, ik_list[i], inds[i]]`
+            gives the energies of the connected bands.
+        """
+        from scipy.optimize import linear_sum_assignment
+        from abipy.core.skw import find_degs_sk
+        ik_list = list(range(self.nkpt)) if kpoints is None else [self.kindex(k) for k in kpoints]
+        start, stop = self.reader.get_band_range(spin, ik_list[0], band_range=band_range)
+        nb = stop - start
+
+        inds = np.empty((len(ik_list), nb), dtype=np.int)
+        inds[0] = np.arange(start, stop)
+        prev_gvecs, prev_ug = _full_sphere(self.gspheres[ik_list[0]], self.read_ug_block(spin, ik_list[0], (start, stop)))
+
+        for i, ik in enumerate(ik_list[1:], start=1):
+            if self.reader.get_band_range(spin, ik, band_range=band_range) != (start, stop):
+                raise ValueError("band_range must contain the same bands at all k-points")
+            gvecs, ug = _full_sphere(self.gspheres[ik], self.read_ug_block(spin, ik, (start, stop)))
+            ovlp = np.abs(_gspace_overlap(prev_gvecs, prev_ug, gvecs, ug)) ** 2
+
+            # Use the projection on the degenerate subspaces so that the result does not depend on the
+            # arbitrary rotation of the degenerate states.
+            for deg in find_degs_sk(self.ebands.eigens[spin, ik, start:stop], atol):
+                ovlp[:, deg] = ovlp[:, deg].sum(axis=1)[:, None]
+            for deg in find_degs_sk(self.ebands.eigens[spin, ik_list[i - 1], start:stop], atol):
+                ovlp[deg, :] = ovlp[deg, :].sum(axis=0)[None, :]
+
+            rows, cols = linear_sum_assignment(-ovlp)
+            perm = np.empty(nb, dtype=np.int)
+            perm[rows] = cols
+            inds[i] = start + perm[inds[i - 1] - start]
+            prev_gvecs, prev_ug = gvecs, ug
+
+        return inds
 
     def write_notebook(self, nbpath=None):
         """
@@ -329,14 +545,64 @@ class WFK_Reader(ElectronsReader):
         npw_k, istwfk = self.npwarr[ik], self.istwfk[ik]
         return self._kg[ik, :npw_k, :], istwfk
 
+    def get_band_range(self, spin, kpoint, band_range=None):
+        """
+        Convert `band_range` into a (start, stop) tuple for the given spin and k-point.
+
+        Args:
+            spin: spin index.
+            kpoint: :class:`Kpoint` object or integer.
+            band_range: None for all the bands available at this k-point. Accepts (start, stop) tuple,
+                `range` or `slice` object with unit step.
+        """
+        ik = self.kindex(kpoint)
+        nband = self.nband_sk[spin, ik]
+        if band_range is None:
+            return 0, nband
+
+        if isinstance(band_range, slice):
+            if band_range.step not in (None, 1):
+                raise ValueError("band_range with step != 1 is not supported: %s" % str(band_range))
+            start, stop, _ = band_range.indices(nband)
+        elif hasattr(band_range, "step"):
+            # range object.
+            if band_range.step != 1:
+                raise ValueError("band_range with step != 1 is not supported: %s" % str(band_range))
+            start, stop = band_range.start, band_range.stop
+        else:
+            start, stop = band_range
+
+        if not (0 <= start < stop <= nband):
+            raise ValueError("Invalid band_range (%s, %s) for spin %s, ik %s with nband %s" % (
+                start, stop, spin, ik, nband))
+
+        return start, stop
+
     def read_ug(self, spin, kpoint, band):
         """Read the Fourier components of the wavefunction."""
+        return self.read_ug_block(spin, kpoint, band_range=(band, band + 1))[0]
+
+    def read_ug_block(self, spin, kpoint, band_range=None):
+        """
+        Read the Fourier components of a block of wavefunctions with a single netCDF read.
+
+        Args:
+            spin: spin index.
+            kpoint: :class:`Kpoint` object or integer.
+            band_range: Bands to read. See :meth:`get_band_range`.
+
+        Returns:
+            Complex array with shape [nb, nspinor, npw_k].
+        """
         ik = self.kindex(kpoint)
-        npw_k, istwfk = self.npwarr[ik], self.istwfk[ik]
+        npw_k = self.npwarr[ik]
         if self.cplex_ug != 2:
             raise NotImplementedError("")
+        start, stop = self.get_band_range(spin, ik, band_range=band_range)
 
-        # Read data from file (we don't store the full block full block in memory!).
+        # Read the contiguous hyperslab [start:stop, :, :npw_k, :] in one call.
+        # Real and imaginary parts are stored in the last dimension so that
+        # we can reinterpret the C-ordered block as a complex array without copying it.
         var = self.rootgrp.variables["coefficients_of_wavefunctions"]
-        value = var[spin, ik, band, :, :npw_k, :]
-        return value[..., 0] + 1j*value[..., 1]  # Build complex array
+        value = np.ascontiguousarray(var[spin, ik, start:stop, :, :npw_k, :], dtype=np.float64)
+        return value.view(np.complex128)[..., 0]
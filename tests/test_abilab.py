@@ -3,6 +3,8 @@
 from __future__ import print_function, division, unicode_literals, absolute_import
 
 import os
+import sys
+import subprocess
 import abipy.data as abidata
 from abipy import abilab
 
@@ -35,4 +37,31 @@ class AbilabTest(AbipyTest):
 
         abilab.abipy_logo1()
         abilab.abipy_logo2()
-        abilab.abipy_logo3()
\ No newline at end of file
+        abilab.abipy_logo3()
+
+    def test_lazy_imports(self):
+        """Testing lazy imports in abilab"""
+        assert "GsrFile" in dir(abilab)
+        assert abilab.GsrFile is abilab.abifile_subclass_from_filename("out_GSR.nc")
+        assert abilab.units.FloatWithUnit is abilab.FloatWithUnit
+        with self.assertRaises(AttributeError):
+            abilab.foobar
+        assert abilab._FLOW_PICKLE_FNAME == abilab.Flow.PICKLE_FNAME
+
+        if sys.version_info < (3, 7): return
+        # The abipy modules exported by abilab should not be imported by abilab and by isabifile.
+        script = ("import sys; from abipy import abilab; abilab.isabifile('out_PHBST.nc'); "
+                  "print(' '.join(m for m in ('abipy.dfpt.phonons', 'abipy.electrons.gw', 'abipy.abio.robots') "
+                  "if m in sys.modules))")
+        out = subprocess.check_output([sys.executable, "-c", script], universal_newlines=True)
+        assert not out.strip()
+
+    def test_star_import(self):
+        """Testing from abipy.abilab import *"""
+        namespace = {}
+        exec("from abipy.abilab import *", namespace)
+        for name in ("GsrFile", "Structure", "abiopen", "abirobot", "ebands_input", "which", "print_frame"):
+            assert name in namespace
+        assert namespace["GsrFile"] is abilab.GsrFile
+        assert not any(name.startswith("_") for name in abilab.__all__)
+        assert "os" not in namespace